@@ -3,11 +3,12 @@ from rich import print as rprint
 from pathlib import Path
 
 from capcon.util.payload import format_payloadIds_with_digest, genPayload
-from capcon.perf_stat import perf_stat_payloads
+from capcon.perf_stat import perf_requirements, perf_stat_payloads
 from capcon.util.systemd_time import parse_systemd_timespan
 from motra.common.capcon import write_capcon_to_file
-from motra.common.capcon_protocol import CAPCON, GenericPayload
+from motra.common.capcon_protocol import CAPCON, CapConMetadata, GenericPayload
 from capcon.log_payload import logging_payloads
+from capcon.reset_payload import reset_capcon
 
 log = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, datefmt="%H:%M:%S")
@@ -19,19 +20,6 @@ capcon_output_folder.resolve().mkdir(parents=True, exist_ok=True)
 log.info(capcon_output_folder)
 
 
-# create a payload to reset the current testbed configuration
-# this is required, in case the testbed crashes or we hit a timeout for the subscription services
-config_payloads: list[GenericPayload] = []
-config_payloads.append(
-    genPayload(
-        command="docker compose -f /home/motra/plc.yaml restart",
-        description="restart containers ... ",
-        limits="30s",
-        offset="200ms",
-        payload_type="config",
-    )
-)
-
 # the network capture process is also a static payload.
 # we try to generate pcaps for the baseline measurements and for the attacks
 static_payloads: list[GenericPayload] = []
@@ -60,7 +48,11 @@ static_payloads.extend(logging_payloads)
 # we can add some level of variation in the future...
 repetition = 5
 dynamic_payloads = perf_stat_payloads[:]
-capture_configurations: list[CAPCON] = []
+# the server runs the reset of the testbed, once the logs payloads of a run
+# report failed containers
+capture_configurations: list[CAPCON] = [
+    reset_capcon("baseline_perf_measurements_reset", timeout=310)
+]
 id_count = 1
 
 for dyn_payload in dynamic_payloads:
@@ -104,28 +96,12 @@ for dyn_payload in dynamic_payloads:
             payload=payload,
             description="baseline measurement",
             timestamp_utc="",
+            metadata=CapConMetadata(requires=perf_requirements(dyn_payload)),
         )
         CAPCON.model_validate(newCon.model_dump())
         capture_configurations.append(newCon)
         id_count += 1
 
-        # every 5 iterations add a config reset
-        if id_count % 5 == 0:
-            confLoad: list[GenericPayload] = [
-                item.model_copy() for item in config_payloads
-            ]
-            nextCapConName = nextCapConName + "_config"
-            confLoad = format_payloadIds_with_digest(confLoad, nextCapConName)
-            configCon = CAPCON(
-                CapConID=nextCapConName,
-                duration="310s",
-                payload=confLoad,
-                description="config reset for docker",
-                timestamp_utc="",
-            )
-            CAPCON.model_validate(configCon.model_dump())
-            capture_configurations.append(configCon)
-
 
 # print(len(capture_configurations))
 
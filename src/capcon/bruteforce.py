@@ -10,8 +10,14 @@ from capcon.util.payload import (
 
 from capcon.util.systemd_time import parse_systemd_timespan
 from motra.common.capcon import write_capcon_to_file
-from motra.common.capcon_protocol import CAPCON, GenericPayload
+from motra.common.capcon_protocol import (
+    CAPCON,
+    GenericPayload,
+    PayloadDependency,
+    ReadinessProbe,
+)
 from capcon.log_payload import logging_payloads
+from capcon.reset_payload import reset_capcon
 
 
 log = logging.getLogger(__name__)
@@ -34,7 +40,8 @@ bforce_payloads.append(
         command="hydra -L {username_list} -P {password_list} {target_ip} -s 22 ssh -o hydra.txt ",
         description="perform a bruteforce attack against local SSH service",
         limits="305s",
-        offset="500ms",
+        offset="0",
+        depends_on=[PayloadDependency(payload="capture")],
         payload_type="attack",
         target=["server"],
     )
@@ -46,7 +53,8 @@ bforce_payloads.append(
         command="hydra -L {username_list} -P {password_list} {target_ip} -s 5432 postgres -o hydra.txt ",
         description="perform a bruteforce attack against local testing database",
         limits="305s",
-        offset="200ms",
+        offset="0",
+        depends_on=[PayloadDependency(payload="capture")],
         payload_type="attack",
         target=["server"],
     )
@@ -64,22 +72,10 @@ static_payloads.append(
         target=["server"],
         description="archive current network interaction",
         limits="{tcpdump_runtime}s",
-        offset="400ms",
+        offset="0",
         payload_type="capture",
-    )
-)
-
-# create a payload to reset the current testbed configuration
-# this is required, in case the testbed crashes or we hit a timeout for the subscription services
-config_payloads: list[GenericPayload] = []
-config_payloads.append(
-    genPayload(
-        command="docker compose -f /home/motra/plc.yaml restart",
-        description="restart containers ... ",
-        target=["client"],
-        limits="30s",
-        offset="200ms",
-        payload_type="config",
+        name="capture",
+        ready=ReadinessProbe(kind="log", pattern="listening on"),
     )
 )
 
@@ -125,7 +121,11 @@ for perm_payload, username_l, password_l in product(
 # Generate each test X times (for starter with identical configuration)
 # we can add some level of variation in the future...
 repetition = 1
-capture_configurations: list[CAPCON] = []
+# the server runs the reset of the testbed, once the logs payloads of a run
+# report failed containers
+capture_configurations: list[CAPCON] = [
+    reset_capcon("bruteforce_measurements_reset", timeout=35)
+]
 id_count = 1
 
 
@@ -172,24 +172,6 @@ for dyn_payload in dynamic_payloads:
         capture_configurations.append(newCon)
         id_count += 1
 
-        # every x iterations add a config reset
-        # for the nmap modules we need to reconfigure more often, since we have more long running scans
-        if id_count % 3 == 0:
-            confLoad: list[GenericPayload] = [
-                item.model_copy() for item in config_payloads
-            ]
-            nextCapConName = nextCapConName + "_config"
-            confLoad = format_payloadIds_with_digest(confLoad, nextCapConName)
-            configCon = CAPCON(
-                CapConID=nextCapConName,
-                duration="35s",
-                payload=confLoad,
-                description="config reset for docker",
-                timestamp_utc="",
-            )
-            CAPCON.model_validate(configCon.model_dump())
-            capture_configurations.append(configCon)
-
 
 # print(len(capture_configurations))
 
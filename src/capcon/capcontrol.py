@@ -4,9 +4,10 @@ from pathlib import Path
 from rich import print as rprint
 
 from capcon.log_payload import logging_payloads
+from capcon.reset_payload import reset_capcon
 from capcon.util.systemd_time import parse_systemd_timespan
 from motra.common.capcon import write_capcon_to_file
-from motra.common.capcon_protocol import CAPCON
+from motra.common.capcon_protocol import CAPCON, CapConMetadata
 from capcon.util.payload import (
     genPayload,
     format_payloadIds_with_digest,
@@ -154,19 +155,6 @@ c2_payloads.append(
 # configuration and capture payloads
 
 
-# create a payload to reset the current testbed configuration
-# this is required, in case the testbed crashes or we hit a timeout for the
-# subscription services
-config_payload = genPayload(
-    command="docker compose -f /home/motra/plc.yaml restart",
-    description="restart containers ... ",
-    target=["client"],
-    limits="30s",
-    offset="200ms",
-    payload_type="config",
-)
-
-
 # the network capture process is also a static payload.
 # we try to generate pcaps for the baseline measurements and for the attacks
 capture_payload = genPayload(
@@ -196,7 +184,11 @@ static_payloads.append(capture_payload)
 
 repetition = 1
 dynamic_payloads = c2_payloads[:]  # shallow copy
-mitm_configurations: list[CAPCON] = []
+# the C2 payloads can break the testbed, the server runs the reset once the
+# logs payloads of a run report failed containers
+mitm_configurations: list[CAPCON] = [
+    reset_capcon("command_control_payload_reset", timeout=35)
+]
 id_count = 1
 
 
@@ -238,25 +230,12 @@ for _ in range(0, repetition):
         payload=payload,
         description=f"run C2 configurations for testing",
         timestamp_utc="",
+        metadata=CapConMetadata(tags=["destructive"]),
     )
     CAPCON.model_validate(newCon.model_dump())
     mitm_configurations.append(newCon)
     id_count += 1
 
-    # since the mitm attacks can be destructive, we will be adding a configuration reset every iteration
-    confLoad = config_payload.model_copy()
-    nextCapConName = nextCapConName + "_config"
-    confLoad = format_payloadIds_with_digest([confLoad], nextCapConName)
-    configCon = CAPCON(
-        CapConID=nextCapConName,
-        duration="35s",
-        payload=confLoad,
-        description="config reset for docker",
-        timestamp_utc="",
-    )
-    CAPCON.model_validate(configCon.model_dump())
-    mitm_configurations.append(configCon)
-
 
 # generate the base configuration
 for capcon in mitm_configurations:
@@ -4,9 +4,15 @@ from pathlib import Path
 from rich import print as rprint
 
 from capcon.log_payload import logging_payloads
+from capcon.reset_payload import reset_capcon
 from capcon.util.systemd_time import parse_systemd_timespan
 from motra.common.capcon import write_capcon_to_file
-from motra.common.capcon_protocol import CAPCON
+from motra.common.capcon_protocol import (
+    CAPCON,
+    CapConMetadata,
+    PayloadDependency,
+    ReadinessProbe,
+)
 from capcon.util.payload import (
     genPayload,
     format_payloadIds_with_digest,
@@ -40,7 +46,8 @@ mitm_payloads.append(
         target=["server"],
         description="ettercap arp 1:1 target",
         limits="231s",
-        offset="500ms",
+        offset="0",
+        depends_on=[PayloadDependency(payload="capture")],
         payload_type="attack",
     )
 )
@@ -51,7 +58,8 @@ mitm_payloads.append(
         target=["server"],
         description="ettercap arp:oneway 1:1 target",
         limits="231s",
-        offset="500ms",
+        offset="0",
+        depends_on=[PayloadDependency(payload="capture")],
         payload_type="attack",
     )
 )
@@ -63,22 +71,12 @@ mitm_payloads.append(
         target=["server"],
         description="ettercap portstealing",
         limits="231s",
-        offset="500ms",
+        offset="0",
+        depends_on=[PayloadDependency(payload="capture")],
         payload_type="attack",
     )
 )
 
-# create a payload to reset the current testbed configuration
-# this is required, in case the testbed crashes or we hit a timeout for the subscription services
-config_payload = genPayload(
-    command="docker compose -f /home/motra/plc.yaml restart",
-    description="restart containers ... ",
-    target=["client"],
-    limits="30s",
-    offset="200ms",
-    payload_type="config",
-)
-
 
 # the network capture process is also a static payload.
 # we try to generate pcaps for the baseline measurements and for the attacks
@@ -87,8 +85,10 @@ capture_payload = genPayload(
     target=["server"],
     description="archive current network interaction",
     limits="{tcpdump_runtime}s",
-    offset="500ms",
+    offset="0",
     payload_type="capture",
+    name="capture",
+    ready=ReadinessProbe(kind="log", pattern="listening on"),
 )
 
 # we can update these early
@@ -102,7 +102,13 @@ static_payloads.append(capture_payload)
 
 repetition = 10
 dynamic_payloads = mitm_payloads[:]  # shallow copy
-mitm_configurations: list[CAPCON] = []
+# the mitm attacks can break the testbed, the server runs the reset once the
+# logs payloads of a run report failed containers. ARP poisoning does not show
+# in docker ps or the container logs, use the "optimized" campaign ordering to
+# reset after each destructive run
+mitm_configurations: list[CAPCON] = [
+    reset_capcon("mitm_payload_testing_reset", timeout=35)
+]
 id_count = 1
 
 for dyn_payloads in dynamic_payloads:
@@ -143,26 +149,13 @@ for dyn_payloads in dynamic_payloads:
             payload=payload,
             description=f"MITM attacks for {dyn_payloads.description}",
             timestamp_utc="",
+            metadata=CapConMetadata(tags=["destructive"]),
         )
         CAPCON.model_validate(newCon.model_dump())
 
         mitm_configurations.append(newCon)
         id_count += 1
 
-        # since the mitm attacks can be destructive, we will be adding a configuration reset every iteration
-        confLoad = config_payload.model_copy()
-        nextCapConName = nextCapConName + "_config"
-        confLoad = format_payloadIds_with_digest([confLoad], nextCapConName)
-        configCon = CAPCON(
-            CapConID=nextCapConName,
-            duration="35s",
-            payload=confLoad,
-            description="config reset for docker",
-            timestamp_utc="",
-        )
-        CAPCON.model_validate(configCon.model_dump())
-        mitm_configurations.append(configCon)
-
 
 # generate the base configuration
 for capcon in mitm_configurations:
@@ -6,6 +6,7 @@ from capcon.util.payload import format_payloadIds_with_digest, genPayload
 from motra.common.capcon import write_capcon_to_file
 from motra.common.capcon_protocol import CAPCON, GenericPayload
 from capcon.log_payload import logging_payloads
+from capcon.reset_payload import reset_capcon
 
 
 log = logging.getLogger(__name__)
@@ -31,19 +32,6 @@ flooding_payloads.append(
 )
 
 
-# create a payload to reset the current testbed configuration
-# this is required, in case the testbed crashes or we hit a timeout for the subscription services
-config_payloads: list[GenericPayload] = []
-config_payloads.append(
-    genPayload(
-        command="docker compose -f /home/motra/plc.yaml restart",
-        description="restart containers ... ",
-        limits="30s",
-        offset="200ms",
-        payload_type="config",
-    )
-)
-
 # the network capture process is also a static payload.
 # we try to generate pcaps for the baseline measurements and for the attacks
 static_payloads: list[GenericPayload] = []
@@ -66,7 +54,11 @@ static_payloads.extend(logging_payloads)
 # we can add some level of variation in the future...
 repetition = 1
 dynamic_payloads = flooding_payloads[:]
-capture_configurations: list[CAPCON] = []
+# the server runs the reset of the testbed, once the logs payloads of a run
+# report failed containers
+capture_configurations: list[CAPCON] = [
+    reset_capcon("flooding_measurements_reset", timeout=35)
+]
 id_count = 1
 
 # in case we have multiple ips or combinations, we need to create permutations using itertools
@@ -106,23 +98,6 @@ for dyn_payloads in dynamic_payloads:
         capture_configurations.append(newCon)
         id_count += 1
 
-        # every x iterations add a config reset
-        if id_count % 5 == 0:
-            confLoad: list[GenericPayload] = [
-                item.model_copy() for item in config_payloads
-            ]
-            nextCapConName = nextCapConName + "_config"
-            confLoad = format_payloadIds_with_digest(confLoad, nextCapConName)
-            configCon = CAPCON(
-                CapConID=nextCapConName,
-                duration="35s",
-                payload=confLoad,
-                description="config reset for docker",
-                timestamp_utc="",
-            )
-            CAPCON.model_validate(configCon.model_dump())
-            capture_configurations.append(configCon)
-
 
 # print(len(capture_configurations))
 
@@ -11,6 +11,7 @@ import logging
 from motra.common.capcon import write_capcon_to_file
 from motra.common.capcon_protocol import CAPCON, GenericPayload
 from capcon.log_payload import logging_payloads
+from capcon.reset_payload import reset_capcon
 
 from capcon.perf_stat import default_options, genCommand
 
@@ -244,20 +245,6 @@ static_payloads.append(
     )
 )
 
-# create a payload to reset the current testbed configuration
-# this is required, in case the testbed crashes or we hit a timeout for the subscription services
-config_payloads: list[GenericPayload] = []
-config_payloads.append(
-    genPayload(
-        command="docker compose -f /home/motra/plc.yaml restart",
-        description="restart containers ... ",
-        target=["client"],
-        limits="30s",
-        offset="200ms",
-        payload_type="config",
-    )
-)
-
 # default payloads for creating device logs
 static_payloads.extend(logging_payloads)
 
@@ -270,7 +257,11 @@ static_payloads.extend(logging_payloads)
 # we can add some level of variation in the future...
 repetition = 1
 dynamic_payloads = nmap_payloads[:]
-capture_configurations: list[CAPCON] = []
+# the server runs the reset of the testbed, once the logs payloads of a run
+# report failed containers
+capture_configurations: list[CAPCON] = [
+    reset_capcon("recon_measurements_reset", timeout=35)
+]
 id_count = 1
 
 
@@ -328,24 +319,6 @@ for dyn_payloads in dynamic_payloads:
         capture_configurations.append(newCon)
         id_count += 1
 
-        # every x iterations add a config reset
-        # for the nmap modules we need to reconfigure more often, since we have more long running scans
-        if id_count % 3 == 0:
-            confLoad: list[GenericPayload] = [
-                item.model_copy() for item in config_payloads
-            ]
-            nextCapConName = nextCapConName + "_config"
-            confLoad = format_payloadIds_with_digest(confLoad, nextCapConName)
-            configCon = CAPCON(
-                CapConID=nextCapConName,
-                duration="35s",
-                payload=confLoad,
-                description="config reset for docker",
-                timestamp_utc="",
-            )
-            CAPCON.model_validate(configCon.model_dump())
-            capture_configurations.append(configCon)
-
 
 # print(len(capture_configurations))
 
@@ -9,6 +9,7 @@ from capcon.util.payload import format_payloadIds_with_digest, genPayload
 from motra.common.capcon import write_capcon_to_file
 from motra.common.capcon_protocol import CAPCON
 from capcon.log_payload import logging_payloads
+from capcon.reset_payload import reset_capcon
 
 log = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, datefmt="%H:%M:%S")
@@ -80,19 +81,6 @@ for server_t, destination, function in product(server_type, dest_ip, testing_fun
 # #############################################################################################
 
 
-# create a payload to reset the current testbed configuration
-# this is required, in case the testbed crashes or we hit a timeout for the subscription services
-config_payloads: list[GenericPayload] = []
-config_payloads.append(
-    genPayload(
-        command="docker compose -f /home/motra/plc.yaml restart",
-        description="restart containers ... ",
-        limits="30s",
-        offset="200ms",
-        payload_type="config",
-    )
-)
-
 # the network capture process is also a static payload.
 # we try to generate pcaps for the baseline measurements and for the attacks
 static_payloads: list[GenericPayload] = []
@@ -117,9 +105,15 @@ static_payloads.extend(logging_payloads)
 # we can add some level of variation in the future...
 repetition = 1
 dynamic_payloads = opc_payloads[:]
-opc_configurations: list[CAPCON] = []
 id_count = 1
 
+# reset the current testbed configuration, in case the testbed crashes or we hit
+# a timeout for the subscription services. The server runs the reset, once the
+# logs payloads of a run report failed containers
+opc_configurations: list[CAPCON] = [
+    reset_capcon("opc_tampering_measurements_reset", timeout=65)
+]
+
 for dyn_payloads in dynamic_payloads:
 
     # run N measurements to get a good baseline
@@ -150,23 +144,6 @@ for dyn_payloads in dynamic_payloads:
         opc_configurations.append(newCon)
         id_count += 1
 
-        # every 20 iterations add a config reset
-        if id_count % 5 == 0:
-            confLoad: list[GenericPayload] = [
-                item.model_copy() for item in config_payloads
-            ]
-            nextCapConName = nextCapConName + "_config"
-            confLoad = format_payloadIds_with_digest(confLoad, nextCapConName)
-            configCon = CAPCON(
-                CapConID=nextCapConName,
-                duration="65s",
-                payload=confLoad,
-                description="config reset for docker",
-                timestamp_utc="",
-            )
-            CAPCON.model_validate(configCon.model_dump())
-            opc_configurations.append(configCon)
-
 
 # generate the base configuration
 for capcon in opc_configurations:
@@ -1,4 +1,7 @@
+import shlex
+
 from capcon.util.payload import genPayload, GenericPayload
+from motra.common.capcon_protocol import CapabilityRequirements
 
 
 def genCommand(options: list[str], runtime: str) -> str:
@@ -6,6 +9,19 @@ def genCommand(options: list[str], runtime: str) -> str:
     return f"perf stat -e {opts} -I 100 -j -o cap.json -a sleep {runtime}"
 
 
+def perf_requirements(payload: GenericPayload) -> CapabilityRequirements:
+    """
+    Creates the client requirements for a perf payload from the events passed
+    with -e, so the test is only sent to clients supporting these events.
+    """
+    args = shlex.split(payload.command)
+    events = []
+    for option, value in zip(args, args[1:]):
+        if option == "-e":
+            events.extend(value.split(","))
+    return CapabilityRequirements(tools=["perf"], pmu_events=events)
+
+
 default_options = [
     "branch-misses",
     "bus-cycles",
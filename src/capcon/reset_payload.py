@@ -0,0 +1,81 @@
+from capcon.util.payload import (
+    format_payloadIds_with_digest,
+    genPayload,
+    GenericPayload,
+)
+from motra.common.capcon_protocol import (
+    CAPCON,
+    CapConMetadata,
+    HealthGate,
+    PayloadDependency,
+    ReadinessProbe,
+)
+
+# runtime limit of the container restart
+RESET_LIMIT = 30
+
+testbed_containers = ["plc-logic", "plc-server", "plc-historian"]
+
+
+def reset_payloads(timeout: int) -> list[GenericPayload]:
+    """
+    Restarts the testbed and waits until all containers are healthy again.
+    The gate ends the reset as soon as the testbed is ready and fails the run,
+    if the containers are not healthy timeout seconds after the restart.
+    """
+    reset = genPayload(
+        command="docker compose -f /home/motra/plc.yaml restart",
+        description="restart containers ... ",
+        target=["client"],
+        limits=f"{RESET_LIMIT}s",
+        offset="200ms",
+        payload_type="config",
+        name="reset",
+    )
+    gate = genPayload(
+        command="",
+        description="wait for healthy containers",
+        target=["client"],
+        limits=f"{RESET_LIMIT + timeout + 5}s",
+        offset="0",
+        payload_type="gate",
+        depends_on=[
+            PayloadDependency(
+                payload="reset", condition="exited", timeout=f"{RESET_LIMIT + 5}s"
+            )
+        ],
+        gate=HealthGate(
+            probes=[
+                ReadinessProbe(kind="container", container=name, interval="1s")
+                for name in testbed_containers
+            ],
+            timeout=f"{timeout}s",
+        ),
+    )
+    return [reset, gate]
+
+
+def reset_duration(timeout: int) -> str:
+    """
+    Upper bound for a reset capcon, the client returns once the gate passed.
+    """
+    return f"{RESET_LIMIT + timeout + 10}s"
+
+
+def reset_capcon(capcon_id: str, timeout: int) -> CAPCON:
+    """
+    The reset test of a campaign. The server holds it back and runs a copy
+    only when the logs payloads of a run report an unhealthy testbed, so the
+    generators write a single reset instead of one every N runs.
+    """
+    payload = format_payloadIds_with_digest(reset_payloads(timeout), capcon_id)
+    reset = CAPCON(
+        CapConID=capcon_id,
+        duration=reset_duration(timeout),
+        payload=payload,
+        description="config reset for docker",
+        timestamp_utc="",
+        metadata=CapConMetadata(tags=["reset"]),
+    )
+    CAPCON.model_validate(reset.model_dump())
+    return reset
@@ -1,5 +1,13 @@
-import hashlib
-from motra.common.capcon_protocol import GenericPayload
+from typing import Optional
+
+from motra.common.capcon import format_payload_ids
+from motra.common.capcon_protocol import (
+    GenericPayload,
+    HealthGate,
+    PayloadDependency,
+    PayloadExpectation,
+    ReadinessProbe,
+)
 
 
 def genPayload(
@@ -9,6 +17,11 @@ def genPayload(
     offset: str,
     payload_type: str = "other",
     target: list[str] = ["client"],
+    expect: Optional[PayloadExpectation] = None,
+    name: Optional[str] = None,
+    depends_on: list[PayloadDependency] = [],
+    ready: Optional[ReadinessProbe] = None,
+    gate: Optional[HealthGate] = None,
 ) -> GenericPayload:
 
     return GenericPayload.model_construct(
@@ -22,6 +35,11 @@ def genPayload(
         limits=limits,
         offset=offset,
         timestamp_utc="",
+        expect=expect,
+        name=name,
+        depends_on=list(depends_on),
+        ready=ready,
+        gate=gate,
     )
 
 
@@ -38,15 +56,5 @@ def format_payloadIds_with_digest(
 
     # this is to identify all ids in the future
     # we use the first 8 digits from the digest of capcon
-    hasher = hashlib.sha256()
-    hasher.update(capConID.encode("utf-8"))
-    payloadHashId = hasher.hexdigest()[:8]
-
-    load_count = 1
-    for payload in payloads:
-        payload.payload_id = (
-            payload.payload_type[0:3] + f"{load_count:03}-" + payloadHashId
-        )
-        load_count += 1
-
-    return payloads
+    # the server uses the same scheme when deriving capcons at runtime
+    return format_payload_ids(payloads, capConID)
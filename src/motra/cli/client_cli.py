@@ -42,26 +42,53 @@ def client(
 
     from motra.client.measurement_client import MeasurementClient
     from motra.client.configuration import MotraClientConfig
+    from motra.common.resources import apply_own_profile
+    from motra.common.scheduler_backend import create_scheduler
 
     # configure runtime settings for this client
-    connection = ClientConnection(app)
     clientWorkspace = {
         "live": app.configuration.live_workspace,
         "staging": app.configuration.staging_workspace,
         "archive": app.configuration.archive_workspace,
     }
 
-    client = MeasurementClient(
-        entity=app.entity_id,
-        clientConnection=connection,
-        workspace=clientWorkspace,
-    )
+    # without systemd, the payloads run inside this process and the client
+    # restarts itself after each run
+    backend = app.configuration.scheduler_backend
+    if app.configuration.scheduling_mode == "none":
+        backend = "asyncio"
+    scheduler = create_scheduler(backend, clientWorkspace["live"])
+
+    # archiving and uploading run inside this process
+    apply_own_profile(app.configuration.motra_profile)
 
     try:
-        # run the default state machine
-        client.connect()
+        while True:
+            client = MeasurementClient(
+                entity=app.entity_id,
+                clientConnection=ClientConnection(app),
+                workspace=clientWorkspace,
+                retention=app.configuration.retention,
+                scheduler=scheduler,
+                stage_units=app.configuration.stage_units,
+                restart_settle=(
+                    app.configuration.restart_settle
+                    if app.configuration.early_restart
+                    else None
+                ),
+                resource_profiles=app.configuration.resource_profiles,
+                motra_profile=app.configuration.motra_profile,
+            )
+
+            # run the default state machine
+            client.connect()
+            if not scheduler.wait_restart():
+                break
     except KeyboardInterrupt:
         typer.secho("\nSession stopped by user...", fg=typer.colors.YELLOW)
 
     except RuntimeError as e:
         typer.secho(f"Stopping on error: {e}", fg=typer.colors.RED)
+
+    finally:
+        scheduler.close()
@@ -1,7 +1,7 @@
 import typer
 from typing_extensions import Annotated
 
-from motra.mexec.mexec import mexec_run
+from motra.mexec.mexec import mexec_finish, mexec_run
 
 
 mexec_cli = typer.Typer(no_args_is_help=True)
@@ -19,3 +19,17 @@ def mexec(
     """
 
     mexec_run(payload_id)
+
+
+@mexec_cli.command("mexec-finish")
+def finish(
+    payload_id: Annotated[
+        str,
+        typer.Argument(help="The payload ID for the current run."),
+    ],
+):
+    """
+    Record the end of a capcon payload, run by systemd after the payload
+    """
+
+    mexec_finish(payload_id)
@@ -1,5 +1,6 @@
 import typer
 import logging
+import os
 from typing_extensions import Annotated
 
 from motra.logging.server_config import (
@@ -27,6 +28,12 @@ def server(
             help="Enables uvicorn reload for changes to the configuration options."
         ),
     ] = False,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            help="Continue the campaign from the journal. Use --no-resume to start over."
+        ),
+    ] = True,
 ):
     """
     Run a local measurement server to orchestrate a testbed.
@@ -46,7 +53,13 @@ def server(
     server_defaultFileLogger("debug", filelog)
 
     from motra.server.server import run
-    from motra.server.configuration import MotraServerConfig, set_server_config
+    from motra.server.configuration import (
+        SERVER_LOGLEVEL_ENV,
+        SERVER_WORKSPACE_ENV,
+        MotraServerConfig,
+        prepare_workers,
+        set_server_config,
+    )
 
     log = logging.getLogger("__name__")
 
@@ -54,10 +67,26 @@ def server(
     if app:
         log.info(f"Found existing configuration at {workspace}")
 
-    # we need to update the central configuraiton for FastAPs
-
-    config = MotraServerConfig(app)
-    set_server_config(config)
+    workers = app.configuration.workers
+    if workers > 1:
+        if reload:
+            raise typer.BadParameter("--reload can not be used with several workers")
+        # the workers load the configuration from the workspace, this process
+        # only prepares the campaign shared by all of them
+        os.environ[SERVER_WORKSPACE_ENV] = str(workspace)
+        os.environ[SERVER_LOGLEVEL_ENV] = loglevel
+        prepare_workers(app, resume)
+        log.info(f"Starting {workers} worker processes")
+    else:
+        # we need to update the central configuraiton for FastAPs
+        config = MotraServerConfig(app)
+        if not resume:
+            log.info("Starting a new campaign, removing the existing journal.")
+            config.journal.reset()
+            config.queue_backend.reset()
+            config.session_store.reset()
+            config.reset_queue_control()
+        set_server_config(config)
 
     level = getattr(logging, loglevel.upper())
 
@@ -66,4 +95,5 @@ def server(
         loglevel=level,
         port=app.configuration.port,
         host=app.configuration.host,
+        workers=workers,
     )
@@ -1,5 +1,6 @@
 import json, sh, os, typer, click, rich
 from pathlib import Path
+from typing import Optional
 from rich.json import JSON
 from typing_extensions import Annotated
 
@@ -27,6 +28,7 @@ from motra.workspace.workspace import (
 from motra.workspace.workspace_configuration import (
     ClientFileConfiguration,
     FileConfiguration,
+    RetentionConfiguration,
     ServerFileConfiguration,
 )
 
@@ -57,6 +59,18 @@ def client(
         str, typer.Option(prompt="The name of the new Client (Client ID)")
     ] = "client",
     prefered_workspace: Path = None,
+    archive_max_bytes: Annotated[
+        Optional[int],
+        typer.Option(help="Evict acknowledged archives above this size in bytes."),
+    ] = None,
+    archive_max_count: Annotated[
+        Optional[int],
+        typer.Option(help="Evict acknowledged archives above this count."),
+    ] = None,
+    archive_max_age: Annotated[
+        Optional[str],
+        typer.Option(help="Evict acknowledged archives older than this (e.g. 7d)."),
+    ] = None,
 ):
     """
     Create a workspacesconfiguration for a MOTRA client
@@ -98,6 +112,11 @@ def client(
         live_workspace=entity_storage / "live",
         staging_workspace=entity_storage / "staging",
         archive_workspace=entity_storage / "archive",
+        retention=RetentionConfiguration(
+            max_bytes=archive_max_bytes,
+            max_count=archive_max_count,
+            max_age=archive_max_age,
+        ),
     )
 
     appconfig = FileConfiguration(
@@ -0,0 +1,99 @@
+import logging
+import platform
+import shutil
+import socket
+import subprocess
+from pathlib import Path
+
+from motra.common.capcon_protocol import ClientCapabilities
+
+logger = logging.getLogger(__name__)
+
+
+# tools used by the capcon generators
+DEFAULT_TOOLS = [
+    "perf",
+    "tcpdump",
+    "docker",
+    "ettercap",
+    "nmap",
+    "hydra",
+    "timeout",
+]
+
+# perf maps these to the events of the core PMU on every architecture
+PERF_GENERIC_EVENTS = [
+    "branch-instructions",
+    "branch-misses",
+    "bus-cycles",
+    "cache-misses",
+    "cache-references",
+    "cpu-cycles",
+    "cycles",
+    "instructions",
+]
+
+EVENT_SOURCE_DEVICES = Path("/sys/bus/event_source/devices")
+
+
+def probe_pmu_events(devices: Path = EVENT_SOURCE_DEVICES) -> list[str]:
+    """
+    Lists the PMU events exported by the kernel through sysfs. This is the
+    list perf shows for the hardware PMUs, without running perf itself.
+    """
+    events = set()
+    try:
+        for device in devices.iterdir():
+            event_dir = device / "events"
+            if event_dir.is_dir():
+                events.update(event.name for event in event_dir.iterdir())
+    except OSError as e:
+        logger.warning(f"Cannot read PMU events from {devices}: {e}")
+        return []
+
+    if events:
+        events.update(PERF_GENERIC_EVENTS)
+    return sorted(events)
+
+
+def probe_perf_events() -> list[str]:
+    """
+    Lists the generic hardware and cache events (e.g. L1-dcache-loads), perf
+    only lists the events supported by this host. These are not exported
+    through sysfs.
+    """
+    try:
+        result = subprocess.run(
+            ["perf", "list", "--raw-dump", "hw", "cache"],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Cannot list perf events: {e}")
+        return []
+    return result.stdout.split()
+
+
+def probe_capabilities(tools: list[str] = DEFAULT_TOOLS) -> ClientCapabilities:
+    """
+    Collects the capabilities of this host, sent to the server with
+    CLIENT_HELLO.
+    """
+    try:
+        interfaces = sorted(name for _, name in socket.if_nameindex())
+    except OSError:
+        interfaces = []
+
+    available = [tool for tool in tools if shutil.which(tool) is not None]
+
+    pmu_events = set(probe_pmu_events())
+    if "perf" in available:
+        pmu_events.update(probe_perf_events())
+
+    return ClientCapabilities(
+        arch=platform.machine(),
+        pmu_events=sorted(pmu_events),
+        tools=available,
+        interfaces=interfaces,
+    )
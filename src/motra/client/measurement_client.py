@@ -5,7 +5,9 @@ from datetime import datetime, UTC
 from statemachine import StateMachine, State
 
 from motra.client import requests
+from motra.client.capabilities import probe_capabilities
 from motra.client.client_connection import ClientConnection
+from motra.client.retention import ArchiveRetention
 
 from motra.common import util
 from motra.common.capcon import (
@@ -14,19 +16,28 @@ from motra.common.capcon import (
     write_payload_to_file,
 )
 from motra.common.capcon_protocol import *
+from motra.common.completion import RunCompletion, watch_run
+from motra.common.resources import ResourceProfile, write_resource_report
 from motra.common.response_types import Response, Status
 from motra.common.archive import (
     clean_workspace,
     create_archive,
 )
 from motra.common.schedule import (
-    COMMAND,
-    execute_scheduler_template,
-    generate_scheduler_template,
+    UnitSpec,
+    generate_payload_units,
+    generate_unit_spec,
+    parse_trigger,
 )
+from motra.common.scheduler_backend import SchedulerBackend, SystemdRunScheduler
 
 from motra.common.systemd import generate_logfile_from_jobid
-from motra.workspace.workspace_configuration import FileConfiguration
+from motra.common.timing import record_planned, write_skew_report
+from motra.common.unit_staging import StagedRun, clear_staged_units
+from motra.workspace.workspace_configuration import (
+    FileConfiguration,
+    RetentionConfiguration,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -58,22 +69,47 @@ class MeasurementClient(StateMachine):
         entity: str,
         clientConnection: ClientConnection,
         workspace: dict,
+        retention: RetentionConfiguration | None = None,
+        scheduler: SchedulerBackend | None = None,
+        stage_units: bool = False,
+        restart_settle: Optional[str] = None,
+        resource_profiles: Optional[dict[str, ResourceProfile]] = None,
+        motra_profile: Optional[ResourceProfile] = None,
     ):
         self.entity_ID = entity
         self.connection = clientConnection
         self.pending_files = list()
         self.current_captureConfiguration: str
+        self.current_duration: str = ""
+        self.active_payloads: list[GenericPayload] = list()
         self.workspace = workspace
 
+        # probed once, the server selects the tests based on these
+        self.capabilities = probe_capabilities()
+
         # if we store all payloads, we need to prep all systemd units
         # starting with the main client unit and then all transient units
         # required for starting the different payloads...
-        self.schedule_units: list[COMMAND] = list()
+        self.schedule_units: list[UnitSpec] = list()
+        self.scheduler = scheduler or SystemdRunScheduler()
+        self.stage_units = stage_units and self.scheduler.systemd
+        self.staged: Optional[StagedRun] = None
+        # without a settle time, the client waits for CAPCON.duration
+        self.restart_settle = restart_settle
+        # payload units by payload type, the client unit uses the motra profile
+        self.resource_profiles = resource_profiles or {}
+        self.motra_profile = motra_profile
 
         # the default number should be 3 for live, staged, archives
         if len(workspace.keys()) != 3:
             raise ValueError("wrong number of keys for workspace")
 
+        # acknowledged archives are evicted between runs to bound disk usage
+        self.retention = ArchiveRetention(
+            workspace["archive"],
+            retention or RetentionConfiguration(),
+        )
+
         # setup the main state machine, so we can query/upload/receive CapCons.
         super().__init__()
 
@@ -98,7 +134,7 @@ class MeasurementClient(StateMachine):
             await self.connection_failed()
             return
 
-        request = requests.parse_CLIENT_HELLO()
+        request = requests.parse_CLIENT_HELLO(self.entity_ID, self.capabilities)
         if request.status is not Status.SUCCESS:
             exit(1)
 
@@ -132,8 +168,9 @@ class MeasurementClient(StateMachine):
         # before uploading the files, we need to parse the current test:
         last_capture = load_capcon_from_file(self.workspace["live"])
 
-        # create logfiles from all active payloads inside the client workspace
-        if last_capture:
+        # create logfiles from all active payloads inside the client workspace,
+        # the asyncio scheduler writes the logs while running them
+        if last_capture and self.scheduler.systemd:
             for payload in last_capture.payload:
                 if self.entity_ID in payload.target:
                     generate_logfile_from_jobid(
@@ -142,6 +179,7 @@ class MeasurementClient(StateMachine):
 
         # Archive the last test, if one is available
         if last_capture is not None:
+            write_skew_report(self.workspace["live"], last_capture.CapConID, "client")
             logger.info("Generating new zip archive for previous capture run.")
             create_archive(
                 archive_name=last_capture.CapConID,
@@ -197,11 +235,13 @@ class MeasurementClient(StateMachine):
 
         # the file name is sent back to ack the last archive
         # we can use the archive name in this case to move the file from
-        # staging to done
+        # staging to done. Only archives with a matching hash are marked as
+        # acknowledged and can be evicted by the retention policy later on.
         if parsed_data.file_name:
             source = self.workspace["staging"] / parsed_data.file_name
             dest = self.workspace["archive"] / parsed_data.file_name
             util.move_file(source, dest)
+            self.retention.acknowledge(dest, parsed_data.file_hash)
 
         # ... if there are more files to upload
         if len(self.pending_files) != 0:
@@ -214,6 +254,10 @@ class MeasurementClient(StateMachine):
     @upload_complete.on
     async def request_new_capcon_from_server(self):
         conman = self.connection
+
+        # all uploads are done, free up disk space before the next run
+        self.retention.enforce()
+
         logger.info("Requesting new test from server...")
         request = requests.parse_REQUEST_CAPCON()
 
@@ -265,29 +309,43 @@ class MeasurementClient(StateMachine):
                     current_job = self.workspace["live"] / f"{pid}.json"
                     write_payload_to_file(current_job, payload=payload)
 
-        client_unit = generate_scheduler_template(
+        self.current_duration = parsed_data.duration
+        self.active_payloads = active_payloads
+
+        # prepare the units now, so EXECUTE_CAPCON only starts a trigger at
+        # the start instant of the run
+        if self.stage_units:
+            clear_staged_units("motra-client")
+            staged = StagedRun(
+                "motra-client",
+                parsed_data.CapConID,
+                self.run_units(trigger=None),
+            )
+            if staged.stage():
+                self.staged = staged
+
+        # When the final trigger is received, you call:
+        await self.transition_await_final_test_trigger()
+
+    def run_units(self, trigger: Optional[datetime]) -> list[UnitSpec]:
+        """
+        The restart of the client after the run and the client payloads.
+        """
+        client_unit = generate_unit_spec(
             "motra-client",
-            current_id=parsed_data.CapConID,
-            start_time_delta=parsed_data.duration,
+            current_id=self.current_captureConfiguration,
+            start_time_delta=self.current_duration,
             runtime_limt="infinity",  # disable timeout
             template_unit=True,
+            trigger=trigger,
+            profile=self.motra_profile,
+        )
+        return [client_unit] + generate_payload_units(
+            "motra-client-mexec",
+            self.active_payloads,
+            trigger,
+            profiles=self.resource_profiles,
         )
-
-        self.schedule_units.append(client_unit)
-
-        if active_payloads:
-            for payload in active_payloads:
-                payload_unit = generate_scheduler_template(
-                    "motra-client-mexec",
-                    current_id=payload.payload_id,
-                    start_time_delta=payload.offset,
-                    runtime_limt=payload.limits,
-                    template_unit=True,
-                )
-                self.schedule_units.append(payload_unit)
-
-        # When the final trigger is received, you call:
-        await self.transition_await_final_test_trigger()
 
     @transition_await_final_test_trigger.on
     async def request_server_test_trigger(self):
@@ -314,9 +372,49 @@ class MeasurementClient(StateMachine):
             logger.error("Current and Received test CapConIDs do not match")
             exit(1)
 
-        # run all commands
-        for command in self.schedule_units:
-            execute_scheduler_template(command)
+        # all units start relative to the same instant as the server payloads
+        trigger = parse_trigger(parsed_data.trigger_utc)
+        if trigger is not None:
+            logger.info(f"Run starts at {parsed_data.trigger_utc}")
+
+        # the planned starts are compared to the actual ones after the run
+        record_planned(self.workspace["live"], self.active_payloads, trigger)
+        write_resource_report(
+            self.workspace["live"],
+            "client",
+            self.active_payloads,
+            self.resource_profiles,
+            self.motra_profile,
+            units=self.scheduler.systemd,
+        )
+
+        units = self.run_units(trigger)
+        if self.restart_settle is not None and self.active_payloads:
+            # the last payload starts the client, the timer is the upper bound
+            completion = RunCompletion(
+                CapConID=self.current_captureConfiguration,
+                client_unit=units[0].unit,
+                settle=self.restart_settle,
+                payloads=[payload.payload_id for payload in self.active_payloads],
+            )
+            watch_run(self.workspace["live"], completion)
+
+        failed = []
+        if self.staged is not None:
+            failed = self.scheduler.schedule([self.staged.trigger_unit(trigger)])
+        if failed:
+            # drop the staged timers, the names are used again
+            self.staged.clear(reload=True)
+            self.staged = None
+        if self.staged is None:
+            # create all timers of the run as one batch
+            self.schedule_units.extend(units)
+            failed = self.scheduler.schedule(self.schedule_units)
+            if failed:
+                logger.error(
+                    f"{self.current_captureConfiguration}: cannot schedule "
+                    f"{', '.join(unit.unit for unit in failed)}"
+                )
 
         # we run the commands before closing the handshake, since this blocks.
         # we need to add some offset to all commands when running this
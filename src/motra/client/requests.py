@@ -9,9 +9,14 @@ from motra.common import util
 logger = logging.getLogger(__name__)
 
 
-def parse_CLIENT_HELLO() -> Response:
+def parse_CLIENT_HELLO(
+    entity_id: str = "",
+    capabilities: Optional[ClientCapabilities] = None,
+) -> Response:
     request = CLIENT_HELLO(
-        client_id="00:00:00:00:00:00",  # TODO: implement the hw IDs
+        client_id=util.get_hardware_id(),
+        entity_id=entity_id,
+        capabilities=capabilities,
         timestamp_utc=str(datetime.now(timezone.utc)),
     )
 
@@ -0,0 +1,194 @@
+import json
+import logging
+import shutil
+import time
+from datetime import datetime, UTC
+from pathlib import Path
+
+from motra.common import util
+from motra.common.timespan import parse_systemd_timespan
+from motra.workspace.workspace_configuration import RetentionConfiguration
+
+logger = logging.getLogger(__name__)
+
+
+ACKNOWLEDGED_LEDGER = ".acknowledged.json"
+
+
+class ArchiveRetention:
+    """
+    Retention engine for the client side archive directory.
+
+    After an upload the server returns the hash of the stored archive with
+    UPLOAD_COMPLETE. Archives with a matching hash are recorded inside a small
+    ledger next to the archives. Only archives listed in the ledger are ever
+    removed, and the hash is checked again before deleting the file, so a
+    replaced or modified archive is kept.
+
+    The engine is run between two measurement runs. To keep the runtime
+    predictable, each pass removes at most `max_evictions` archives and reads
+    at most `hash_budget_bytes` from disk for verification.
+
+    archive_workspace: The directory holding acknowledged archives.
+
+    policy: The configured limits for the archive directory.
+    """
+
+    archive_workspace: Path
+    policy: RetentionConfiguration
+
+    def __init__(
+        self,
+        archive_workspace: Path,
+        policy: RetentionConfiguration,
+    ):
+        self.archive_workspace = archive_workspace
+        self.policy = policy
+        self.ledger_path = archive_workspace / ACKNOWLEDGED_LEDGER
+
+    @property
+    def enabled(self) -> bool:
+        policy = self.policy
+        return any(
+            limit is not None
+            for limit in (
+                policy.max_bytes,
+                policy.max_count,
+                policy.max_age,
+                policy.min_free_bytes,
+            )
+        )
+
+    def load_ledger(self) -> dict[str, dict]:
+        if not self.ledger_path.is_file():
+            return {}
+
+        try:
+            return json.loads(self.ledger_path.read_text())
+        except json.JSONDecodeError:
+            logger.error(
+                f"Retention ledger '{self.ledger_path}' is corrupted, ignoring it."
+            )
+            return {}
+
+    def store_ledger(self, ledger: dict[str, dict]):
+        # write to a temporary file first, so a crash never leaves a broken ledger
+        temp_path = self.ledger_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(ledger, indent=2))
+        temp_path.replace(self.ledger_path)
+
+    def acknowledge(self, archive: Path, file_hash: str) -> bool:
+        """
+        Marks an archive as safe to evict, if the hash reported by the server
+        matches the local file. Returns True, if the archive was acknowledged.
+        """
+        if not archive.is_file():
+            logger.error(f"Cannot acknowledge missing archive '{archive}'")
+            return False
+
+        if not file_hash:
+            logger.error(f"Server did not confirm storing '{archive.name}'.")
+            return False
+
+        local_hash = util.create_sha256(archive)
+        if local_hash != file_hash:
+            logger.error(
+                f"Server reported hash '{file_hash}' for '{archive.name}', "
+                f"local hash is '{local_hash}'. Archive will be kept.",
+            )
+            return False
+
+        ledger = self.load_ledger()
+        ledger[archive.name] = {
+            "hash": file_hash,
+            "acknowledged_utc": str(datetime.now(UTC)),
+        }
+        self.store_ledger(ledger)
+        logger.debug(f"Acknowledged archive '{archive.name}'")
+        return True
+
+    def enforce(self) -> list[Path]:
+        """
+        Removes acknowledged archives until all configured limits are met or
+        the per pass budget is used up. The oldest archives are evicted first.
+
+        Returns:
+            A list containing the removed archives.
+        """
+        if not self.enabled:
+            return []
+
+        policy = self.policy
+        ledger = self.load_ledger()
+
+        archives = [path for path in self.archive_workspace.glob("*.zip")]
+        sizes = {path: path.stat().st_size for path in archives}
+        mtimes = {path: path.stat().st_mtime for path in archives}
+
+        total_bytes = sum(sizes.values())
+        total_count = len(archives)
+
+        max_age = None
+        if policy.max_age is not None:
+            max_age = parse_systemd_timespan(policy.max_age)
+
+        def free_bytes() -> int:
+            return shutil.disk_usage(self.archive_workspace).free
+
+        def limits_exceeded(archive: Path) -> bool:
+            if max_age is not None and time.time() - mtimes[archive] > max_age:
+                return True
+            if policy.max_bytes is not None and total_bytes > policy.max_bytes:
+                return True
+            if policy.max_count is not None and total_count > policy.max_count:
+                return True
+            if policy.min_free_bytes is not None:
+                return free_bytes() < policy.min_free_bytes
+            return False
+
+        # unacknowledged archives are never candidates for eviction
+        candidates = sorted(
+            (path for path in archives if path.name in ledger),
+            key=lambda path: mtimes[path],
+        )
+
+        evicted: list[Path] = list()
+        hashed_bytes = 0
+        for archive in candidates:
+            if len(evicted) >= policy.max_evictions:
+                logger.info("Reached eviction limit for this pass.")
+                break
+            if not limits_exceeded(archive):
+                break
+            if hashed_bytes + sizes[archive] > policy.hash_budget_bytes:
+                logger.info("Reached hashing budget for this pass.")
+                break
+
+            hashed_bytes += sizes[archive]
+            if util.create_sha256(archive) != ledger[archive.name]["hash"]:
+                logger.warning(
+                    f"Archive '{archive.name}' changed after acknowledgement, keeping it."
+                )
+                ledger.pop(archive.name)
+                continue
+
+            archive.unlink()
+            ledger.pop(archive.name)
+            total_bytes -= sizes[archive]
+            total_count -= 1
+            evicted.append(archive)
+            logger.info(f"Evicted acknowledged archive '{archive.name}'")
+
+        # forget about archives, that were removed by other means
+        present = {path.name for path in archives}
+        for name in list(ledger.keys()):
+            if name not in present:
+                ledger.pop(name)
+
+        self.store_ledger(ledger)
+
+        logger.info(
+            f"Retention pass removed {len(evicted)} archive(s), "
+            f"{total_count} archive(s) with {total_bytes} bytes remaining.",
+        )
+        return evicted
@@ -1,9 +1,12 @@
 from pathlib import Path
 
+import hashlib
 import logging
-from typing import Optional
+import math
+import re
+from typing import Iterator, Optional
 
-from motra.common.capcon_protocol import CAPCON, GenericPayload
+from motra.common.capcon_protocol import CAPCON, CapConTemplate, GenericPayload
 
 logger = logging.getLogger(__name__)
 
@@ -53,3 +56,151 @@ def write_payload_to_file(
         raise RuntimeError("Found existing configuration, not overriding.")
 
     payload_file.write_text(payload.model_dump_json())
+
+
+def format_payload_ids(
+    payloads: list[GenericPayload],
+    capcon_id: str,
+) -> list[GenericPayload]:
+    """
+    Updates the payload ids to use correct numbering and embeds a digest of the
+    CapConID as trailer, e.g. att003-1a2b3c4d.
+
+    The trailer uniquely binds a payload to its capcon, using the trailer with
+    journalctl -u *hash* payloads for specific capture configurations can be
+    filtered.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(capcon_id.encode("utf-8"))
+    payload_hash_id = hasher.hexdigest()[:8]
+
+    for load_count, payload in enumerate(payloads, start=1):
+        payload.payload_id = (
+            payload.payload_type[0:3] + f"{load_count:03}-" + payload_hash_id
+        )
+
+    return payloads
+
+
+def derive_capcon(template: CAPCON, capcon_id: str) -> CAPCON:
+    """
+    Creates a copy of a capcon with a new CapConID and matching payload ids.
+    """
+    capcon = template.model_copy(deep=True)
+    capcon.CapConID = capcon_id
+    if capcon.payload:
+        format_payload_ids(capcon.payload, capcon_id)
+    return capcon
+
+
+def template_size(template: CapConTemplate) -> int:
+    """
+    Returns the number of runs a template expands to.
+    """
+    combinations = math.prod(len(values) for values in template.parameters.values())
+    return combinations * template.repetitions
+
+
+def template_values(template: CapConTemplate, index: int) -> dict:
+    """
+    Returns the format values for a single run of a template, without creating
+    the parameter matrix. The runs of a combination are consecutive.
+
+    index: 0-based number of the run.
+    """
+    if not 0 <= index < template_size(template):
+        raise IndexError(f"{template.TemplateID} has no run {index}")
+
+    combination, repetition = divmod(index, template.repetitions)
+
+    # decode the combination as mixed radix number, the last parameter
+    # changes fastest (like itertools.product)
+    values = {}
+    for name, choices in reversed(template.parameters.items()):
+        combination, position = divmod(combination, len(choices))
+        values[name] = choices[position]
+
+    values = dict(reversed(values.items()))
+    values.update(index=index + 1, repetition=repetition + 1)
+    return values
+
+
+def template_samples(template: CapConTemplate) -> list[int]:
+    """
+    Returns the runs of a template, that use every value of every parameter
+    in the first and in the last repetition. Validating these covers every
+    distinct value, without expanding the whole parameter matrix.
+    """
+    widest = max((len(values) for values in template.parameters.values()), default=1)
+    samples = {0, template_size(template) - 1}
+    for position in range(widest):
+        # mixed radix number, the first parameter is the most significant
+        combination = 0
+        for choices in template.parameters.values():
+            combination = combination * len(choices) + position % len(choices)
+        samples.add(combination * template.repetitions)
+        samples.add((combination + 1) * template.repetitions - 1)
+    return sorted(samples)
+
+
+# a format field of a template, doubled braces are kept as they are
+TEMPLATE_FIELD = re.compile(r"(?<!\{)\{(\w+)(?::([^{}]*))?\}(?!\})")
+
+
+def format_fields(text: str, values: dict) -> str:
+    """
+    Replaces the known fields of a template inside a string. Other braces,
+    e.g. of a docker --format '{{.Names}}' or an awk program, are kept.
+    """
+
+    def replace(match: re.Match) -> str:
+        name, spec = match.group(1), match.group(2) or ""
+        if name not in values:
+            return match.group(0)
+        return format(values[name], spec)
+
+    return TEMPLATE_FIELD.sub(replace, text)
+
+
+def template_capcon_id(template: CapConTemplate, index: int) -> str:
+    return format_fields(template.template.CapConID, template_values(template, index))
+
+
+def expand_template(template: CapConTemplate, index: int) -> CAPCON:
+    """
+    Creates a single run of a template with a deterministic CapConID and
+    payload ids. Each run is validated, the validation of the template only
+    checks the unformatted fields.
+
+    Raises:
+        IndexError: The index is out of range.
+        ValidationError: The run is not a valid CAPCON.
+    """
+    values = template_values(template, index)
+    capcon = template.template.model_copy(deep=True)
+
+    capcon.CapConID = format_fields(capcon.CapConID, values)
+    values["capconname"] = capcon.CapConID
+    capcon.description = format_fields(capcon.description, values)
+    capcon.duration = format_fields(capcon.duration, values)
+
+    if capcon.payload:
+        for payload in capcon.payload:
+            payload.command = format_fields(payload.command, values)
+            payload.description = format_fields(payload.description, values)
+            payload.limits = format_fields(payload.limits, values)
+            payload.offset = format_fields(payload.offset, values)
+            if payload.expect is not None:
+                payload.expect.files = [
+                    format_fields(pattern, values) for pattern in payload.expect.files
+                ]
+            if payload.ready is not None and payload.ready.path is not None:
+                payload.ready.path = format_fields(payload.ready.path, values)
+        format_payload_ids(capcon.payload, capcon.CapConID)
+
+    return CAPCON.model_validate(capcon.model_dump())
+
+
+def iterate_template(template: CapConTemplate, start: int = 0) -> Iterator[CAPCON]:
+    for index in range(start, template_size(template)):
+        yield expand_template(template, index)
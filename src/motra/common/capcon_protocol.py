@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, ValidationError
-from typing import Optional, Type, TypeVar, Literal
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import Optional, Type, TypeVar, Literal, Union
 
 import logging
 
@@ -99,18 +99,154 @@ def serialize(model: BaseModel) -> str:
 # ============================================================================ #
 
 
+class PayloadExpectation(BaseModel):
+    """
+    Checks the server runs on the data of a payload after the run completed.
+    A run failing any check is requeued.
+    """
+
+    files: list[str] = Field(
+        description="Glob patterns of files the payload creates inside the workspace",
+        default_factory=list,
+    )
+    min_bytes: int = Field(
+        description="Minimal size of each matched file",
+        default=1,
+        ge=0,
+    )
+    min_lines: Optional[int] = Field(
+        description="Minimal number of non empty lines of each matched file,"
+        " e.g. the intervals written by perf stat -I",
+        default=None,
+        ge=0,
+    )
+    allow_timeout: bool = Field(
+        description="Accept a unit, that was stopped by RuntimeMaxSec",
+        default=False,
+    )
+
+
+class ReadinessProbe(BaseModel):
+    """
+    Signals, that a payload is ready, e.g. a capture is listening. Payloads
+    depending on the readiness check the probe until it succeeds.
+
+    kind:
+        file: A file matching `path` exists inside the workspace.
+        port: A TCP connection to `host`:`port` is accepted.
+        log: A line of the payload output matches `pattern`.
+        container: The docker `container` is healthy, or running if it has no
+            health check. With a `pattern`, a line it logged since the payload
+            started needs to match instead.
+    """
+
+    kind: Literal["file", "port", "log", "container"] = Field(
+        description="Type of the readiness check",
+    )
+    path: Optional[str] = Field(
+        description="file: glob pattern inside the workspace. log: file to search"
+        " instead of the payload output",
+        default=None,
+    )
+    host: str = Field(
+        description="port: host accepting the connection",
+        default="127.0.0.1",
+    )
+    port: Optional[int] = Field(
+        description="port: TCP port accepting the connection",
+        default=None,
+        ge=1,
+        le=65535,
+    )
+    pattern: Optional[str] = Field(
+        description="log, container: regular expression matching a line of the"
+        " output",
+        default=None,
+    )
+    container: Optional[str] = Field(
+        description="container: name of the docker container",
+        default=None,
+    )
+    interval: str = Field(
+        description="Time between two checks in systemd time format",
+        default="50ms",
+    )
+
+    @model_validator(mode="after")
+    def check_kind(self):
+        required = {
+            "file": "path",
+            "port": "port",
+            "log": "pattern",
+            "container": "container",
+        }[self.kind]
+        if getattr(self, required) is None:
+            raise ValueError(f"A {self.kind} probe requires {required}")
+        return self
+
+
+class PayloadDependency(BaseModel):
+    """
+    Delays a payload until another payload of the same run reached a state.
+    The offset of the payload is the earliest start.
+
+    condition:
+        started: The command of the other payload is running.
+        ready: The readiness probe of the other payload succeeded, same as
+            started for payloads without a probe.
+        exited: The other payload finished.
+    """
+
+    payload: str = Field(
+        description="Name of the payload to wait for",
+    )
+    condition: Literal["started", "ready", "exited"] = Field(
+        description="State of the payload to wait for",
+        default="ready",
+    )
+    delay: str = Field(
+        description="Additional delay after the condition is met",
+        default="0",
+    )
+    timeout: str = Field(
+        description="Maximal time to wait, the payload fails afterwards",
+        default="60s",
+    )
+
+
+class HealthGate(BaseModel):
+    """
+    Checks of a gate payload, e.g. after a testbed reset. The gate exits as
+    soon as every probe succeeded once, or fails after the timeout.
+    """
+
+    probes: list[ReadinessProbe] = Field(
+        description="Checks that need to succeed",
+        min_length=1,
+    )
+    timeout: str = Field(
+        description="Maximal time to wait in systemd time format",
+        default="60s",
+    )
+
+
 class GenericPayload(BaseModel):
     """
     CapCon Payload for different measurement applications.
+
+    A gate payload does not run its command, it runs the probes of its gate
+    and fails, if they do not succeed in time.
     """
 
-    payload_type: Literal["capture", "attack", "config", "logs", "other"] = Field(
+    payload_type: Literal[
+        "capture", "attack", "config", "logs", "gate", "other"
+    ] = Field(
         description="",
         default="capture",
     )
     payload_id: str = Field(
         description="Unique ID for the payload to execute",
-        pattern=r"^(cap|log|att|con|oth)(\d{3})-([0-9,a-f,A-F]{8})$",
+        pattern=r"^(cap|log|att|con|gat|oth)(\d{3})-([0-9,a-f,A-F]{8})$",
     )
     target: list[str] = Field(
         description="Discriminator where to run the specified payload."
@@ -140,6 +276,32 @@ class GenericPayload(BaseModel):
     timestamp_utc: str = Field(
         description="The ISO 8601 timestamp of when the message/object was created."
     )
+    expect: Optional[PayloadExpectation] = Field(
+        description="Quality checks for the data of this payload",
+        default=None,
+    )
+    name: Optional[str] = Field(
+        description="Name of the payload inside its capcon, used by dependencies",
+        default=None,
+    )
+    depends_on: list[PayloadDependency] = Field(
+        description="Payloads that need to reach a state before this one starts",
+        default_factory=list,
+    )
+    ready: Optional[ReadinessProbe] = Field(
+        description="Readiness check for payloads depending on this one",
+        default=None,
+    )
+    gate: Optional[HealthGate] = Field(
+        description="Checks of a gate payload",
+        default=None,
+    )
+
+    @model_validator(mode="after")
+    def check_gate(self):
+        if (self.payload_type == "gate") != (self.gate is not None):
+            raise ValueError("Gate payloads, and only these, require a gate")
+        return self
 
     # systemd time definition:
     # usec, us, μs
@@ -164,6 +326,26 @@ class GenericPayload(BaseModel):
 # ============================================================================ #
 
 
+class ClientCapabilities(BaseModel):
+    """
+    Features of a client, that capture configurations can depend on.
+    """
+
+    arch: str = Field(description="Machine architecture, e.g. x86_64 or aarch64")
+    pmu_events: list[str] = Field(
+        description="perf events available on the client",
+        default_factory=list,
+    )
+    tools: list[str] = Field(
+        description="Executables found in the PATH of the client",
+        default_factory=list,
+    )
+    interfaces: list[str] = Field(
+        description="Names of the network interfaces",
+        default_factory=list,
+    )
+
+
 class CLIENT_HELLO(BaseModel):
     """
     The very first message sent by the client upon connecting.
@@ -180,6 +362,14 @@ class CLIENT_HELLO(BaseModel):
         description="The MAC address or other unique hardware ID of the client.",
         pattern=r"^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$",
     )
+    entity_id: str = Field(
+        description="The configured name of the client, used for logging.",
+        default="",
+    )
+    capabilities: Optional[ClientCapabilities] = Field(
+        description="Features of the client, used to select matching tests.",
+        default=None,
+    )
     timestamp_utc: str = Field(
         description="The ISO 8601 timestamp of when the message was created."
     )
@@ -295,6 +485,58 @@ class REQUEST_CAPCON(BaseModel):
     )
 
 
+class CapabilityRequirements(BaseModel):
+    """
+    Capabilities a client needs to run a capture configuration. Every listed
+    value needs to be available, for arch any of the listed values matches.
+    """
+
+    arch: list[str] = Field(default_factory=list)
+    pmu_events: list[str] = Field(default_factory=list)
+    tools: list[str] = Field(default_factory=list)
+    interfaces: list[str] = Field(default_factory=list)
+
+    def missing(self, capabilities: ClientCapabilities) -> list[str]:
+        """
+        Returns the requirements the client does not fulfill.
+        """
+        missing = []
+        if self.arch and capabilities.arch not in self.arch:
+            missing.append(f"arch {capabilities.arch} not in {self.arch}")
+        for field in ("pmu_events", "tools", "interfaces"):
+            available = set(getattr(capabilities, field))
+            for value in getattr(self, field):
+                if value not in available:
+                    missing.append(f"{field}: {value}")
+        return missing
+
+
+class CapConMetadata(BaseModel):
+    """
+    Optional scheduling hints for a capture configuration. The server uses these
+    to order a campaign, the client does not evaluate them.
+    """
+
+    tags: list[str] = Field(
+        description="Free form tags. 'destructive' marks runs, that leave the testbed"
+        " in a state which requires a reset before the next run, 'reset' marks"
+        " runs, that restore the testbed.",
+        default_factory=list,
+    )
+    requires_reset: bool = Field(
+        description="The run needs a freshly reset testbed.",
+        default=False,
+    )
+    after: list[str] = Field(
+        description="CapConIDs that need to be run before this configuration.",
+        default_factory=list,
+    )
+    requires: Optional[CapabilityRequirements] = Field(
+        description="Capabilities a client needs to run this configuration.",
+        default=None,
+    )
+
+
 class CAPCON(BaseModel):
     """
     Answer from the Server to the Client. Contains a test instance to be run on
@@ -330,6 +572,98 @@ class CAPCON(BaseModel):
         default=None,
     )
 
+    metadata: Optional[CapConMetadata] = Field(
+        description="Scheduling hints for the server",
+        default=None,
+    )
+
+    @model_validator(mode="after")
+    def check_dependencies(self):
+        payloads = self.payload or []
+        named = {}
+        for payload in payloads:
+            if payload.name is None:
+                continue
+            if payload.name in named:
+                raise ValueError(f"Payload name {payload.name} is not unique")
+            named[payload.name] = payload
+
+        for payload in payloads:
+            for dependency in payload.depends_on:
+                other = named.get(dependency.payload)
+                if other is None:
+                    raise ValueError(f"Unknown dependency {dependency.payload}")
+                if other is payload:
+                    raise ValueError(f"Payload {payload.name} depends on itself")
+                # dependencies are resolved on the host running the payload
+                if not set(payload.target) <= set(other.target):
+                    raise ValueError(
+                        f"Dependency {dependency.payload} does not run on all"
+                        f" targets of {payload.name or payload.payload_id}"
+                    )
+
+        # depth first search for cycles, 1: visiting, 2: done
+        state: dict[str, int] = {}
+
+        def visit(name: str):
+            if state.get(name) == 1:
+                raise ValueError(f"Payload dependencies form a cycle at {name}")
+            if state.get(name) == 2:
+                return
+            state[name] = 1
+            for dependency in named[name].depends_on:
+                visit(dependency.payload)
+            state[name] = 2
+
+        for name in named:
+            visit(name)
+        return self
+
+
+class CapConTemplate(BaseModel):
+    """
+    A parameterized capture configuration, that is expanded into single runs
+    by the server when they are requested.
+
+    Every combination of the parameter lists is run `repetitions` times. The
+    CapConID, duration and description of the template, as well as command,
+    description, limits, offset, expected files and readiness path of each
+    payload, can contain format fields. Available fields are the parameters,
+    `index` (1-based run number), `repetition` (1-based) and `capconname`
+    (the formatted CapConID). The payload ids are generated for each run and
+    can be omitted.
+
+    Only the fields listed above are replaced, e.g. `{index}` or `{rate:04}`.
+    All other braces, like `{{.Names}}` of docker --format or `{print $1}` of
+    awk, are kept without escaping them. A doubled field like `{{index}}` is
+    kept as well.
+    """
+
+    TemplateID: str = Field(
+        description="Unique ID of the template, used as key for the test queue."
+    )
+    template: CAPCON = Field(description="The capture configuration to expand.")
+    parameters: dict[str, list[Union[int, float, str]]] = Field(
+        description="Parameter matrix, each combination is a single run.",
+        default_factory=dict,
+    )
+    repetitions: int = Field(
+        description="Number of runs for each combination of parameters.",
+        default=1,
+        ge=1,
+    )
+
+    @model_validator(mode="before")
+    @classmethod
+    def fill_payload_ids(cls, data):
+        # ids are generated for each run, use placeholders for validation
+        if isinstance(data, dict) and isinstance(data.get("template"), dict):
+            for payload in data["template"].get("payload") or []:
+                if isinstance(payload, dict) and "payload_id" not in payload:
+                    prefix = str(payload.get("payload_type", "capture"))[0:3]
+                    payload["payload_id"] = f"{prefix}000-00000000"
+        return data
+
 
 class ACK_CAPCON(BaseModel):
     """
@@ -377,3 +711,9 @@ class EXECUTE_CAPCON(BaseModel):
         description="The ISO 8601 timestamp of when the message was created."
     )
     CapConID: str = Field(description="copy of the currently used test id.")
+    trigger_utc: Optional[str] = Field(
+        description="Start instant (ISO 8601) of the run, shared by all targeted"
+        " clients and the server. The payload offsets count from this instant"
+        " instead of the reception of this message.",
+        default=None,
+    )
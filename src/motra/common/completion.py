@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import math
+import subprocess
+import time
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from motra.common.capcon_protocol import GenericPayload
+from motra.common.timespan import parse_systemd_timespan
+from motra.common.timing import load_timing
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_FILE = "completion.json"
+
+# systemd stops a payload exceeding its limit, this may take a while
+STOP_MARGIN = 10.0
+
+
+class RunCompletion(BaseModel):
+    """
+    Written by the client into the live workspace when a run starts. Once
+    all payloads of the run exited, the client is started after the settle
+    time instead of waiting for its timer. CAPCON.duration stays the upper
+    bound, the timer still starts the client if a payload does not exit.
+    """
+
+    CapConID: str
+    client_unit: str = Field(description="Unit restarting the client")
+    settle: str = Field(
+        description="Delay between the end of the last payload and the restart",
+        default="2s",
+    )
+    payloads: list[str]
+
+    @property
+    def client_timer(self) -> str:
+        return self.client_unit.rsplit(".", 1)[0] + ".timer"
+
+
+def watch_run(workspace: Path, completion: RunCompletion):
+    (workspace / COMPLETION_FILE).write_text(completion.model_dump_json(indent=2))
+
+
+def pending_payloads(workspace: Path, payload_ids: list[str]) -> list[str]:
+    """
+    Returns the payloads, that did not exit yet.
+    """
+    return [
+        payload_id
+        for payload_id in payload_ids
+        if load_timing(workspace, payload_id).finished_utc is None
+    ]
+
+
+def claim_completion(workspace: Path) -> Optional[RunCompletion]:
+    """
+    Called after a payload exited. Returns the completion of the run, if this
+    was the last payload. The completion is removed, so only a single caller
+    restarts the client.
+    """
+    path = workspace / COMPLETION_FILE
+    try:
+        completion = RunCompletion.model_validate_json(path.read_text())
+    except (OSError, ValidationError):
+        return None
+    if pending_payloads(workspace, completion.payloads):
+        return None
+
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        # claimed by the hook of another payload
+        return None
+    return completion
+
+
+def restart_client(completion: RunCompletion):
+    """
+    Starts the client unit after the settle time. The timer of the client is
+    stopped once the start was queued, so the client is not started a second
+    time. If the start fails, the timer still starts the client.
+    """
+    time.sleep(parse_systemd_timespan(completion.settle))
+    logger.info(f"All payloads of {completion.CapConID} exited, starting the client")
+    try:
+        subprocess.run(
+            ["systemctl", "start", "--no-block", completion.client_unit],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.error(f"Cannot start {completion.client_unit} early: {e}")
+        return
+
+    # the timer elapsing meanwhile does not matter, the unit is already active
+    result = subprocess.run(
+        ["systemctl", "stop", completion.client_timer],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        logger.warning(f"Cannot stop {completion.client_timer}: {result.stderr}")
+
+
+def payload_deadline(workspace: Path, payload_id: str) -> Optional[datetime]:
+    """
+    Latest instant a payload can still run: its planned start plus its
+    runtime limit. None for payloads without a limit or planned start.
+    """
+    planned = load_timing(workspace, payload_id).planned_utc
+    if planned is None:
+        return None
+    try:
+        payload = GenericPayload.model_validate_json(
+            (workspace / f"{payload_id}.json").read_text()
+        )
+        limit = parse_systemd_timespan(payload.limits)
+    except (OSError, ValidationError, ValueError):
+        return None
+    if math.isinf(limit):
+        return None
+    return planned + timedelta(seconds=limit + STOP_MARGIN)
+
+
+async def wait_for_payloads(
+    workspace: Path, payload_ids: list[str], interval: float = 0.2
+) -> list[str]:
+    """
+    Waits until the payloads exited, at most until the deadline of each one.
+    Used by the server, the client might return before the server payloads
+    of a run exited.
+
+    Returns:
+        The payloads still running.
+    """
+    deadlines = {
+        payload_id: payload_deadline(workspace, payload_id)
+        for payload_id in payload_ids
+    }
+    while True:
+        pending = pending_payloads(workspace, payload_ids)
+        now = datetime.now(UTC)
+        waiting = [
+            payload_id
+            for payload_id in pending
+            if deadlines[payload_id] is not None and deadlines[payload_id] > now
+        ]
+        if not waiting:
+            return pending
+        await asyncio.sleep(interval)
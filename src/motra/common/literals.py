@@ -12,3 +12,8 @@ INSTALLABLE_UNITS = Literal[INSTALLABLE_SERVER_UNITS, INSTALLABLE_SERVER_UNITS]
 MOTRA_UNITS = Literal[
     "motra-client", "motra-client-mexec", "motra-server-mexec", "motra-server"
 ]
+
+# "dbus" creates the transient units of a run through one connection to the
+# systemd manager instead of one systemd-run call per unit, "asyncio" runs the
+# payloads as child processes without systemd
+SCHEDULER_BACKENDS = Literal["systemd-run", "dbus", "asyncio"]
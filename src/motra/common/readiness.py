@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import re
+import subprocess
+import time
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Optional
+
+from pydantic import ValidationError
+
+from motra.common.capcon_protocol import (
+    GenericPayload,
+    HealthGate,
+    PayloadDependency,
+    ReadinessProbe,
+)
+from motra.common.timespan import parse_systemd_timespan
+from motra.common.timing import load_timing
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_FILE_PATTERN = re.compile(
+    r"^(cap|log|att|con|gat|oth)\d{3}-[0-9a-fA-F]{8}\.json$"
+)
+
+COMMAND_LOG_PREFIX = "Executing: "
+
+# time a single port check may take
+CONNECT_TIMEOUT = 0.2
+
+# each check of a probe on the journal starts journalctl, poll it less often
+JOURNAL_POLL_INTERVAL = 1.0
+
+# docker reports the health, if the container has a health check
+CONTAINER_STATE_FORMAT = (
+    "{{if .State.Health}}{{.State.Health.Status}}{{else}}{{.State.Status}}{{end}}"
+)
+
+
+class DependencyError(RuntimeError):
+    """
+    A dependency of a payload was not met in time or can never be met.
+    """
+
+
+def load_payloads(workspace: Path) -> list[GenericPayload]:
+    """
+    Returns the payloads stored in a live workspace, these are the payloads
+    of the current run on this host.
+    """
+    payloads = []
+    for path in sorted(workspace.iterdir()):
+        if not PAYLOAD_FILE_PATTERN.match(path.name):
+            continue
+        try:
+            payloads.append(GenericPayload.model_validate_json(path.read_text()))
+        except (OSError, ValidationError) as e:
+            logger.warning(f"Cannot read payload {path.name}: {e}")
+    return payloads
+
+
+def journal_output(workspace: Path, payload_id: str) -> bool:
+    """
+    True, if the output of a payload is read from the journal.
+    """
+    return not (workspace / f"{payload_id}.log").is_file()
+
+
+def payload_output(
+    workspace: Path, payload_id: str, since: Optional[datetime] = None
+) -> str:
+    """
+    The output of a payload. The asyncio scheduler writes it to a log file in
+    the workspace, otherwise it is in the journal of the mexec unit.
+
+    since: Start of this run of the payload. Payload ids are used again by
+        other runs, the journal of the unit holds their output as well.
+        Defaults to the planned start of the payload.
+    """
+    log_file = workspace / f"{payload_id}.log"
+    if log_file.is_file():
+        return log_file.read_text(errors="replace")
+    if since is None:
+        since = load_timing(workspace, payload_id).planned_utc
+    if since is None:
+        # without a start, the output of earlier runs can not be told apart
+        return ""
+    try:
+        result = subprocess.run(
+            [
+                "journalctl",
+                "--no-pager",
+                "--output=cat",
+                f"--since=@{int(since.timestamp())}",
+                "--unit",
+                f"motra-*-mexec@{payload_id}.service",
+            ],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+    return result.stdout
+
+
+async def docker(*args: str) -> tuple[int, str]:
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "docker",
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+    except OSError as e:
+        return -1, str(e)
+    output, _ = await process.communicate()
+    return process.returncode, output.decode(errors="replace")
+
+
+def describe_probe(probe: ReadinessProbe) -> str:
+    if probe.kind == "file":
+        return f"file {probe.path}"
+    if probe.kind == "port":
+        return f"port {probe.host}:{probe.port}"
+    if probe.kind == "container" and probe.pattern is None:
+        return f"container {probe.container} healthy"
+    if probe.kind == "container":
+        return f"container {probe.container} logged '{probe.pattern}'"
+    return f"output matches '{probe.pattern}'"
+
+
+def probe_interval(
+    probe: ReadinessProbe, workspace: Path, payload: GenericPayload
+) -> float:
+    """
+    Interval between two checks of a probe. Probes on the output in the
+    journal are checked at most every JOURNAL_POLL_INTERVAL.
+    """
+    interval = parse_systemd_timespan(probe.interval)
+    if (
+        probe.kind == "log"
+        and probe.path is None
+        and journal_output(workspace, payload.payload_id)
+    ):
+        interval = max(interval, JOURNAL_POLL_INTERVAL)
+    return interval
+
+
+async def check_probe(
+    probe: ReadinessProbe,
+    workspace: Path,
+    payload: GenericPayload,
+    since: Optional[datetime] = None,
+) -> bool:
+    """
+    Checks a readiness probe once.
+
+    since: Start of the payload, container logs before are ignored.
+    """
+    if probe.kind == "file":
+        return any(workspace.glob(probe.path))
+
+    if probe.kind == "port":
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(probe.host, probe.port), CONNECT_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
+    if probe.kind == "container" and probe.pattern is None:
+        returncode, output = await docker(
+            "inspect", "--format", CONTAINER_STATE_FORMAT, probe.container
+        )
+        return returncode == 0 and output.strip() in ("healthy", "running")
+
+    if probe.kind == "container":
+        args = ["logs"]
+        if since is not None:
+            args += ["--since", since.isoformat()]
+        returncode, output = await docker(*args, probe.container)
+        if returncode != 0:
+            return False
+    elif probe.path is not None:
+        try:
+            output = (workspace / probe.path).read_text(errors="replace")
+        except OSError:
+            return False
+    else:
+        output = await asyncio.to_thread(
+            payload_output, workspace, payload.payload_id, since
+        )
+    # the command line is logged before it runs, it may match the pattern
+    pattern = re.compile(probe.pattern)
+    return any(
+        pattern.search(line)
+        for line in output.splitlines()
+        if not line.startswith(COMMAND_LOG_PREFIX)
+    )
+
+
+async def wait_for_dependency(
+    dependency: PayloadDependency,
+    other: GenericPayload,
+    workspace: Path,
+):
+    """
+    Waits until the other payload reached the state of the dependency.
+
+    Raises:
+        DependencyError: The state was not reached before the timeout, or the
+            other payload exited before it was ready.
+    """
+    deadline = time.monotonic() + parse_systemd_timespan(dependency.timeout)
+    interval = 0.05
+    if other.ready is not None:
+        interval = probe_interval(other.ready, workspace, other)
+    name = dependency.payload
+
+    while True:
+        timing = load_timing(workspace, other.payload_id)
+        started = timing.exec_utc is not None
+        exited = timing.finished_utc is not None
+
+        if dependency.condition == "exited":
+            met = exited
+        elif dependency.condition == "started" or other.ready is None:
+            met = started or exited
+        else:
+            met = started and await check_probe(
+                other.ready, workspace, other, since=timing.exec_utc
+            )
+            if not met and exited:
+                raise DependencyError(f"{name} exited before it was ready")
+
+        if met:
+            break
+        if time.monotonic() > deadline:
+            raise DependencyError(
+                f"{name} was not {dependency.condition} after {dependency.timeout}"
+            )
+        await asyncio.sleep(interval)
+
+    await asyncio.sleep(parse_systemd_timespan(dependency.delay))
+
+
+async def wait_for_dependencies(
+    payload: GenericPayload,
+    workspace: Path,
+    payloads: Optional[list[GenericPayload]] = None,
+):
+    """
+    Waits for all dependencies of a payload. The dependencies are looked up
+    by name in the payloads of the workspace.
+
+    Raises:
+        DependencyError: A dependency is unknown or was not met.
+    """
+    if not payload.depends_on:
+        return
+    if payloads is None:
+        payloads = await asyncio.to_thread(load_payloads, workspace)
+    named = {other.name: other for other in payloads if other.name is not None}
+
+    waits = []
+    for dependency in payload.depends_on:
+        other = named.get(dependency.payload)
+        if other is None:
+            raise DependencyError(
+                f"{dependency.payload} is not part of the run in {workspace}"
+            )
+        waits.append(wait_for_dependency(dependency, other, workspace))
+
+    start = time.monotonic()
+    await asyncio.gather(*waits)
+    logger.info(
+        f"Dependencies of {payload.payload_id} met after "
+        f"{time.monotonic() - start:.3f}s"
+    )
+
+
+async def run_gate(
+    gate: HealthGate, workspace: Path, payload: GenericPayload
+) -> list[ReadinessProbe]:
+    """
+    Checks the probes of a gate until each one succeeded once.
+
+    Returns:
+        The probes, that did not succeed before the timeout of the gate.
+    """
+    since = datetime.now(UTC)
+    deadline = time.monotonic() + parse_systemd_timespan(gate.timeout)
+
+    async def wait(probe: ReadinessProbe) -> bool:
+        interval = probe_interval(probe, workspace, payload)
+        while not await check_probe(probe, workspace, payload, since):
+            if time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(interval)
+        logger.info(f"Gate {payload.payload_id}: {describe_probe(probe)}")
+        return True
+
+    passed = await asyncio.gather(*(wait(probe) for probe in gate.probes))
+    return [probe for probe, ok in zip(gate.probes, passed) if not ok]
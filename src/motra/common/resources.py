@@ -0,0 +1,224 @@
+import logging
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from motra.common.capcon_protocol import GenericPayload
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_REPORT = "resources.json"
+
+IO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+SCHEDULING_POLICIES = {"other": 0, "fifo": 1, "rr": 2, "batch": 3, "idle": 5}
+
+
+def parse_cpu_list(cpus: str) -> set[int]:
+    """
+    Parses a CPU list as used by systemd and taskset, e.g. "0-1,4".
+    """
+    result = set()
+    for part in cpus.replace(" ", ",").split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        result.update(range(int(first), int(last or first) + 1))
+    return result
+
+
+PROPERTY_NAMES = {
+    "cpu_affinity": "CPUAffinity",
+    "allowed_cpus": "AllowedCPUs",
+    "nice": "Nice",
+    "io_scheduling_class": "IOSchedulingClass",
+    "io_scheduling_priority": "IOSchedulingPriority",
+    "cpu_quota": "CPUQuota",
+    "cpu_scheduling_policy": "CPUSchedulingPolicy",
+    "cpu_scheduling_priority": "CPUSchedulingPriority",
+}
+
+
+class ResourceProfile(BaseModel):
+    """
+    CPU and I/O placement of a unit, emitted as properties of the unit. The
+    names follow systemd.exec(5) and systemd.resource-control(5).
+
+    Profiles are selected by payload type, e.g. a capture profile pins perf
+    and tcpdump to cores not used by the testbed and starts them with a
+    real-time policy. The motra profile throttles the archive and upload
+    work of motra itself.
+    """
+
+    cpu_affinity: Optional[str] = Field(
+        description="CPUAffinity, CPUs the processes may run on, e.g. 0-1,4",
+        default=None,
+    )
+    allowed_cpus: Optional[str] = Field(
+        description="AllowedCPUs, cpuset of the cgroup of the unit",
+        default=None,
+    )
+    nice: Optional[int] = Field(description="Nice", default=None, ge=-20, le=19)
+    io_scheduling_class: Optional[Literal["realtime", "best-effort", "idle"]] = (
+        Field(description="IOSchedulingClass", default=None)
+    )
+    io_scheduling_priority: Optional[int] = Field(
+        description="IOSchedulingPriority, 0 is the highest",
+        default=None,
+        ge=0,
+        le=7,
+    )
+    cpu_quota: Optional[str] = Field(
+        description="CPUQuota, e.g. 50% for half of a CPU",
+        default=None,
+        pattern=r"^\d+%$",
+    )
+    cpu_scheduling_policy: Optional[Literal["other", "batch", "idle", "fifo", "rr"]] = (
+        Field(description="CPUSchedulingPolicy", default=None)
+    )
+    cpu_scheduling_priority: Optional[int] = Field(
+        description="CPUSchedulingPriority of the fifo and rr policies",
+        default=None,
+        ge=1,
+        le=99,
+    )
+
+    def properties(self) -> dict[str, str]:
+        """
+        The profile as systemd unit properties.
+        """
+        return {
+            PROPERTY_NAMES[field]: str(value)
+            for field, value in self.model_dump(exclude_none=True).items()
+        }
+
+    @classmethod
+    def from_properties(cls, properties: dict[str, str]) -> "ResourceProfile":
+        fields = {name: field for field, name in PROPERTY_NAMES.items()}
+        return cls.model_validate(
+            {
+                fields[name]: value
+                for name, value in properties.items()
+                if name in fields
+            }
+        )
+
+    def ionice(self) -> list[str]:
+        """
+        The I/O settings as ionice arguments, empty if there are none.
+        """
+        if self.io_scheduling_class is None and self.io_scheduling_priority is None:
+            return []
+        args = ["-c", str(IO_CLASSES[self.io_scheduling_class or "best-effort"])]
+        if self.io_scheduling_priority is not None:
+            args += ["-n", str(self.io_scheduling_priority)]
+        return args
+
+    def cgroup_only(self) -> list[str]:
+        """
+        Settings that need a cgroup of their own, these only apply to units.
+        """
+        properties = self.properties()
+        return [name for name in ("AllowedCPUs", "CPUQuota") if name in properties]
+
+    def apply(self, pid: int = 0):
+        """
+        Applies the CPU settings to a process, 0 is the calling process. Used
+        where the work does not run in a unit of its own. Raises OSError, if
+        a setting is not permitted.
+        """
+        if self.cpu_affinity is not None:
+            os.sched_setaffinity(pid, parse_cpu_list(self.cpu_affinity))
+        if self.cpu_scheduling_policy is not None:
+            policy = SCHEDULING_POLICIES[self.cpu_scheduling_policy]
+            priority = self.cpu_scheduling_priority or 0
+            if self.cpu_scheduling_policy not in ("fifo", "rr"):
+                priority = 0
+            os.sched_setscheduler(pid, policy, os.sched_param(priority))
+        if self.nice is not None:
+            os.setpriority(os.PRIO_PROCESS, pid, self.nice)
+
+
+def profile_for(
+    payload: GenericPayload, profiles: dict[str, ResourceProfile]
+) -> Optional[ResourceProfile]:
+    return profiles.get(payload.payload_type)
+
+
+def apply_own_profile(profile: Optional[ResourceProfile]):
+    """
+    Moves the running motra process into its profile, so archiving and
+    uploading interfere as little as possible with the measurements.
+    """
+    if profile is None:
+        return
+    try:
+        profile.apply()
+    except OSError as e:
+        logger.warning(f"Cannot apply the motra resource profile: {e}")
+    ionice = shutil.which("ionice")
+    if profile.ionice() and ionice is not None:
+        subprocess.run(
+            [ionice, *profile.ionice(), "-p", str(os.getpid())],
+            capture_output=True,
+        )
+    if profile.cgroup_only():
+        logger.warning(
+            f"{profile.cgroup_only()} of the motra profile only apply to units"
+        )
+
+
+class PayloadResources(BaseModel):
+    payload_id: str
+    payload_type: str
+    properties: dict[str, str]
+
+
+class ResourceReport(BaseModel):
+    """
+    The resource profiles of a run on one host, stored in its archive, so the
+    measurement overhead of each run is documented.
+
+    units: True, if the payloads ran as systemd units. Otherwise the cgroup
+        settings (AllowedCPUs, CPUQuota) were not applied.
+    """
+
+    role: str
+    cpus: Optional[int] = Field(default_factory=os.cpu_count)
+    units: bool
+    motra: dict[str, str] = Field(
+        description="Profile of motra itself (archive, upload, scheduling)",
+        default_factory=dict,
+    )
+    payloads: list[PayloadResources] = Field(default_factory=list)
+
+
+def write_resource_report(
+    workspace: Path,
+    role: str,
+    payloads: list[GenericPayload],
+    profiles: dict[str, ResourceProfile],
+    own_profile: Optional[ResourceProfile],
+    units: bool,
+):
+    report = ResourceReport(
+        role=role,
+        units=units,
+        motra={} if own_profile is None else own_profile.properties(),
+    )
+    for payload in payloads:
+        profile = profile_for(payload, profiles)
+        report.payloads.append(
+            PayloadResources(
+                payload_id=payload.payload_id,
+                payload_type=payload.payload_type,
+                properties={} if profile is None else profile.properties(),
+            )
+        )
+    try:
+        (workspace / RESOURCE_REPORT).write_text(report.model_dump_json(indent=2))
+    except OSError as e:
+        logger.warning(f"Cannot store the resource report: {e}")
@@ -2,10 +2,17 @@ import shlex
 import shutil
 import subprocess
 import logging
+from datetime import datetime, timedelta, UTC
+from typing import Optional
 
+from pydantic import BaseModel, Field
+
+from motra.common.capcon_protocol import GenericPayload
 from motra.common.exec_environment import get_current_python_path
 
 from motra.common.literals import MOTRA_UNITS
+from motra.common.resources import ResourceProfile, profile_for
+from motra.common.timespan import parse_systemd_timespan
 
 logger = logging.getLogger(__name__)
 
@@ -13,28 +20,167 @@ logger = logging.getLogger(__name__)
 COMMAND = list[str]
 
 
-def generate_scheduler_template(
+def calendar_spec(instant: datetime) -> str:
+    """
+    Formats an instant as systemd calendar event, e.g.
+    "2025-01-31 12:00:05.250000 UTC".
+    """
+    return instant.astimezone(UTC).strftime("%Y-%m-%d %H:%M:%S.%f UTC")
+
+
+class UnitSpec(BaseModel):
+    """
+    A transient timer starting an installed unit. The scheduler backends
+    create the same timer from it, either through systemd-run or directly
+    through the systemd manager.
+
+    unit: The started service, e.g. motra-client@<id>.service
+    on_active: Delay until the start, as systemd time span.
+    on_calendar: Absolute start instant, replaces on_active if set. A
+        realtime timer elapses at the same wall clock time on every host,
+        regardless of when the timer itself was created.
+    runtime_max: Runtime limit of the started service.
+    accuracy: Accuracy of the timer.
+    properties: Further properties of the started service, e.g. the CPU
+        placement from a ResourceProfile.
+    """
+
+    unit: str
+    on_active: str = "0"
+    on_calendar: Optional[datetime] = None
+    runtime_max: str = "infinity"
+    accuracy: str = "10ms"
+    properties: dict[str, str] = Field(default_factory=dict)
+
+    @property
+    def timer(self) -> str:
+        return self.unit.rsplit(".", 1)[0] + ".timer"
+
+    def command(self) -> COMMAND:
+        if self.on_calendar is not None:
+            calendar = calendar_spec(self.on_calendar)
+            trigger = shlex.quote(f"--on-calendar={calendar}")
+        else:
+            trigger = f"--on-active={self.on_active}"
+
+        limit = ""
+        if self.runtime_max != "infinity":
+            limit = f"--property=RuntimeMaxSec={self.runtime_max}"
+
+        properties = " ".join(
+            shlex.quote(f"--property={name}={value}")
+            for name, value in self.properties.items()
+        )
+
+        command = f"""sudo 
+                    systemd-run 
+                    {trigger} 
+                    {limit}
+                    {properties}
+                    --unit {self.unit} 
+                    --timer-property AccuracySec={self.accuracy}"""
+
+        return shlex.split(command)
+
+
+def parse_trigger(trigger_utc: Optional[str]) -> Optional[datetime]:
+    """
+    Parses the start instant sent with EXECUTE_CAPCON.
+    """
+    if not trigger_utc:
+        return None
+    trigger = datetime.fromisoformat(trigger_utc)
+    if trigger.tzinfo is None:
+        trigger = trigger.replace(tzinfo=UTC)
+    return trigger
+
+
+def generate_unit_spec(
     unit_type: MOTRA_UNITS,
     current_id: str,
     start_time_delta: str,
     runtime_limt: str,
     default_timer_accuracy: str = "10ms",
     template_unit: bool = True,
-) -> COMMAND:
+    trigger: Optional[datetime] = None,
+    profile: Optional[ResourceProfile] = None,
+) -> UnitSpec:
+    """
+    Creates the timer of a unit. Without a trigger, the unit starts
+    start_time_delta after the timer was created. With a trigger, it starts
+    at trigger + start_time_delta, or right away if this instant already
+    passed.
+    """
 
     if template_unit:
         template = "@"
     else:
         template = ""
 
-    command = f"""sudo 
-                    systemd-run 
-                    --on-active={start_time_delta} 
-                    --property=RuntimeMaxSec={runtime_limt}
-                    --unit {unit_type}{template}{current_id}.service 
-                    --timer-property AccuracySec={default_timer_accuracy}"""
+    on_active = start_time_delta
+    on_calendar = None
+    if trigger is not None:
+        start = trigger + timedelta(seconds=parse_systemd_timespan(start_time_delta))
+        if start > datetime.now(UTC):
+            on_calendar = start
+        else:
+            logger.warning(f"Start of {current_id} already passed, starting now")
+            on_active = "0"
+
+    return UnitSpec(
+        unit=f"{unit_type}{template}{current_id}.service",
+        on_active=on_active,
+        on_calendar=on_calendar,
+        runtime_max=runtime_limt,
+        accuracy=default_timer_accuracy,
+        properties={} if profile is None else profile.properties(),
+    )
+
 
-    return shlex.split(command)
+def generate_scheduler_template(
+    unit_type: MOTRA_UNITS,
+    current_id: str,
+    start_time_delta: str,
+    runtime_limt: str,
+    default_timer_accuracy: str = "10ms",
+    template_unit: bool = True,
+) -> COMMAND:
+
+    return generate_unit_spec(
+        unit_type,
+        current_id,
+        start_time_delta,
+        runtime_limt,
+        default_timer_accuracy,
+        template_unit,
+    ).command()
+
+
+def generate_payload_units(
+    unit_type: MOTRA_UNITS,
+    payloads: list[GenericPayload],
+    trigger: Optional[datetime] = None,
+    profiles: Optional[dict[str, ResourceProfile]] = None,
+) -> list[UnitSpec]:
+    """
+    Creates the transient units for a list of payloads. With a trigger, all
+    payloads start at trigger + offset, so the offsets mean the same on the
+    client and the server, as long as their clocks are synchronized.
+
+    profiles: Resource profiles by payload type.
+    """
+    return [
+        generate_unit_spec(
+            unit_type,
+            current_id=payload.payload_id,
+            start_time_delta=payload.offset,
+            runtime_limt=payload.limits,
+            template_unit=True,
+            trigger=trigger,
+            profile=profile_for(payload, profiles or {}),
+        )
+        for payload in payloads
+    ]
 
 
 def execute_scheduler_template(command: COMMAND):
@@ -0,0 +1,614 @@
+import asyncio
+import logging
+import math
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Optional
+
+from motra.common.capcon_protocol import GenericPayload
+from motra.common.completion import claim_completion
+from motra.common.literals import SCHEDULER_BACKENDS
+from motra.common.resources import (
+    IO_CLASSES,
+    SCHEDULING_POLICIES,
+    ResourceProfile,
+    parse_cpu_list,
+)
+from motra.common.readiness import (
+    DependencyError,
+    describe_probe,
+    run_gate,
+    wait_for_dependencies,
+)
+from motra.common.schedule import (
+    UnitSpec,
+    calendar_spec,
+    execute_scheduler_template,
+)
+from motra.common.timespan import parse_systemd_timespan
+from motra.common.timing import load_timing, store_timing
+from motra.mexec.mexec import find_payload_workspace
+
+try:
+    # optional dependency, installed with motra[dbus]
+    import jeepney
+    from jeepney.io.blocking import open_dbus_connection
+except ImportError:
+    jeepney = None
+
+logger = logging.getLogger(__name__)
+
+USEC_INFINITY = 2**64 - 1
+
+
+def timespan_usec(timespan: str) -> int:
+    """
+    Converts a systemd time span into microseconds as used on the bus.
+    """
+    seconds = parse_systemd_timespan(timespan)
+    if math.isinf(seconds):
+        return USEC_INFINITY
+    return round(seconds * 1_000_000)
+
+
+def cpu_mask(cpus: str) -> bytes:
+    """
+    A CPU list as bit mask, as systemd passes CPU sets on the bus.
+    """
+    mask = bytearray()
+    for cpu in parse_cpu_list(cpus):
+        while len(mask) <= cpu // 8:
+            mask.append(0)
+        mask[cpu // 8] |= 1 << (cpu % 8)
+    return bytes(mask)
+
+
+def dbus_property(name: str, value: str) -> tuple[str, tuple[str, object]]:
+    """
+    Converts a unit property as written in a unit file into its bus type.
+    """
+    if name in ("CPUAffinity", "AllowedCPUs"):
+        return name, ("ay", cpu_mask(value))
+    if name == "CPUQuota":
+        percent = int(value.removesuffix("%"))
+        return "CPUQuotaPerSecUSec", ("t", percent * 10_000)
+    if name == "IOSchedulingClass":
+        return name, ("i", IO_CLASSES[value])
+    if name == "CPUSchedulingPolicy":
+        return name, ("i", SCHEDULING_POLICIES[value])
+    return name, ("i", int(value))
+
+
+class SchedulerBackend(ABC):
+    """
+    Creates the transient timers of a run. All units of a run are passed at
+    once, so a backend can start them as a single batch.
+
+    systemd: True, if the units run as systemd units. Their logs are read
+        from the journal and they can be staged before the run.
+    """
+
+    systemd: bool = True
+
+    @abstractmethod
+    def schedule(self, units: list[UnitSpec]) -> list[UnitSpec]:
+        """
+        Creates a timer for each unit.
+
+        Returns:
+            The units that could not be scheduled.
+        """
+
+    def wait_restart(self) -> bool:
+        """
+        Blocks until the client is due to run again, for backends restarting
+        the client inside the same process.
+
+        Returns:
+            False, if the client is restarted by systemd.
+        """
+        return False
+
+    def close(self):
+        pass
+
+
+class SystemdRunScheduler(SchedulerBackend):
+    """
+    Runs one `sudo systemd-run` per unit, one after another. Each call costs a
+    few tens of milliseconds, so the timers of later units start late.
+    """
+
+    def schedule(self, units: list[UnitSpec]) -> list[UnitSpec]:
+        for unit in units:
+            execute_scheduler_template(unit.command())
+        return []
+
+
+class DBusScheduler(SchedulerBackend):
+    """
+    Talks to the systemd manager on the system bus. The calls for all units
+    are written to one connection before the first reply is read, so the
+    timers of a run are created within a few milliseconds.
+
+    For each unit, a transient timer is started, like `systemd-run
+    --on-active` does. Starting units requires root or a polkit rule for the
+    user running motra. If the bus is not reachable, the units are passed to
+    systemd-run instead. Units, that were created before the connection got
+    lost, are not passed again.
+
+    The runtime limit and the resource properties are set on the installed
+    service in calls of their own. systemd only changes some properties of an
+    installed unit at runtime, a rejected call is logged and does not fail
+    the unit. Staged units get all of them through a drop-in.
+
+    connection: A blocking jeepney connection (or an object with its send,
+        receive and close methods), opened on the first batch if not given
+        and kept for later batches.
+    """
+
+    def __init__(self, connection=None, timeout: float = 10.0):
+        if jeepney is None:
+            raise RuntimeError(
+                "The dbus scheduler requires jeepney, install motra[dbus]"
+            )
+        self.connection = connection
+        self.timeout = timeout
+        self.fallback = SystemdRunScheduler()
+        self.manager = jeepney.DBusAddress(
+            "/org/freedesktop/systemd1",
+            bus_name="org.freedesktop.systemd1",
+            interface="org.freedesktop.systemd1.Manager",
+        )
+
+    def messages(self, unit: UnitSpec) -> list:
+        """
+        The calls for a unit. Only the timer is required for the unit to
+        start, the other calls set properties of the installed service.
+
+        Returns:
+            (message, properties) for each call, properties describes what a
+            rejected call loses and is None for the required call.
+        """
+        messages = []
+        runtime_max = timespan_usec(unit.runtime_max)
+        if runtime_max != USEC_INFINITY:
+            # runtime only, the drop-in is gone after a reboot
+            limit = ("RuntimeMaxUSec", ("t", runtime_max))
+            messages.append(
+                (
+                    jeepney.new_method_call(
+                        self.manager,
+                        "SetUnitProperties",
+                        "sba(sv)",
+                        (unit.unit, True, [limit]),
+                    ),
+                    "Runtime limit",
+                )
+            )
+        if unit.properties:
+            properties = [
+                dbus_property(name, value) for name, value in unit.properties.items()
+            ]
+            messages.append(
+                (
+                    jeepney.new_method_call(
+                        self.manager,
+                        "SetUnitProperties",
+                        "sba(sv)",
+                        (unit.unit, True, properties),
+                    ),
+                    "Resource properties",
+                )
+            )
+
+        if unit.on_calendar is not None:
+            calendar = calendar_spec(unit.on_calendar)
+            timer = ("TimersCalendar", ("a(ss)", [("OnCalendar", calendar)]))
+        else:
+            on_active = timespan_usec(unit.on_active)
+            timer = ("TimersMonotonic", ("a(st)", [("OnActiveUSec", on_active)]))
+
+        properties = [
+            ("Description", ("s", f"motra timer for {unit.unit}")),
+            ("Unit", ("s", unit.unit)),
+            timer,
+            ("AccuracyUSec", ("t", timespan_usec(unit.accuracy))),
+            ("RemainAfterElapse", ("b", False)),
+        ]
+        messages.append(
+            (
+                jeepney.new_method_call(
+                    self.manager,
+                    "StartTransientUnit",
+                    "ssa(sv)a(sa(sv))",
+                    (unit.timer, "fail", properties, []),
+                ),
+                None,
+            )
+        )
+        return messages
+
+    def schedule(self, units: list[UnitSpec]) -> list[UnitSpec]:
+        if len(units) == 0:
+            return []
+
+        try:
+            if self.connection is None:
+                self.connection = open_dbus_connection(bus="SYSTEM")
+        except OSError as e:
+            logger.error(f"Cannot connect to the system bus: {e}")
+            return self.fallback.schedule(units)
+
+        # send all calls first, the manager handles them in order
+        pending: dict[int, tuple[UnitSpec, Optional[str]]] = {}
+        start = time.monotonic()
+        try:
+            for unit in units:
+                for message, properties in self.messages(unit):
+                    serial = next(self.connection.outgoing_serial)
+                    self.connection.send(message, serial=serial)
+                    pending[serial] = (unit, properties)
+        except OSError as e:
+            logger.error(f"Lost the connection to the system bus: {e}")
+            self.close()
+            return self.schedule_missing(units)
+
+        failed: list[UnitSpec] = []
+        deadline = start + self.timeout
+        try:
+            while pending:
+                reply = self.connection.receive(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+                serial = reply.header.fields.get(jeepney.HeaderFields.reply_serial)
+                if serial not in pending:
+                    continue
+                unit, properties = pending.pop(serial)
+                if reply.header.message_type != jeepney.MessageType.error:
+                    continue
+                error = reply.header.fields.get(jeepney.HeaderFields.error_name)
+                if properties is not None:
+                    logger.warning(f"{properties} of {unit.unit} rejected: {error}")
+                else:
+                    logger.error(f"Cannot schedule {unit.unit}: {error} {reply.body}")
+                    failed.append(unit)
+        except (TimeoutError, OSError) as e:
+            logger.error(f"No reply from the systemd manager: {e}")
+            self.close()
+            unanswered = []
+            for unit, properties in pending.values():
+                if properties is None:
+                    unanswered.append(unit)
+            failed.extend(self.schedule_missing(unanswered))
+
+        logger.info(
+            f"Scheduled {len(units) - len(failed)} of {len(units)} units "
+            f"in {(time.monotonic() - start) * 1000:.1f}ms"
+        )
+        return failed
+
+    def schedule_missing(self, units: list[UnitSpec]) -> list[UnitSpec]:
+        """
+        Passes the units to systemd-run, that were not created over the bus.
+        A call may have been handled although its reply was lost, starting
+        such a unit again would run its payload twice.
+        """
+        created = created_units(units)
+        if created:
+            logger.info(f"Already created: {', '.join(sorted(created))}")
+        missing = [unit for unit in units if unit.unit not in created]
+        return self.fallback.schedule(missing)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def created_units(units: list[UnitSpec]) -> set[str]:
+    """
+    The units, whose timer is waiting or which are already running.
+    """
+    if len(units) == 0:
+        return set()
+    names = []
+    for unit in units:
+        names.extend((unit.timer, unit.unit))
+    try:
+        result = subprocess.run(
+            ["systemctl", "show", "--property=ActiveState", "--value", *names],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"Cannot check the state of the units: {e}")
+        return set()
+
+    states = result.stdout.split()
+    if len(states) != len(names):
+        return set()
+    created = set()
+    for unit, timer, service in zip(units, states[0::2], states[1::2]):
+        if timer == "active" or service in ("active", "activating", "deactivating"):
+            created.add(unit.unit)
+    return created
+
+
+# the client unit restarts the client after the run
+CLIENT_UNIT_PREFIX = "motra-client@"
+
+# like systemd, a payload gets SIGTERM at its runtime limit and SIGKILL after
+STOP_TIMEOUT = 10.0
+
+
+class AsyncioScheduler(SchedulerBackend):
+    """
+    Runs the payloads as child processes of motra, for hosts without systemd
+    and as fast path on the server. The payloads are started by asyncio
+    timers on an event loop in a background thread, so they keep running
+    while the state machine of the client or the server handles messages.
+
+    Each payload command is started directly inside the workspace, like mexec
+    does in the mexec unit, without starting another python interpreter
+    first. The output goes to `<payload_id>.log`, which replaces the journal
+    of the unit. A payload exceeding its runtime limit is stopped and
+    logged with the result systemd would report, so the quality gate treats
+    both backends alike. Payloads with dependencies wait for them after their
+    offset, the same as in mexec.
+
+    The client unit is not started, wait_restart() blocks until the client
+    is due to run again instead. This is early, once all payloads of a
+    watched run exited (see RunCompletion).
+
+    workspace: Working directory of the payloads, the live workspace.
+    """
+
+    systemd = False
+
+    def __init__(self, workspace: Path):
+        self.workspace = Path(workspace)
+        self.restart_at: Optional[float] = None
+        self._restart = threading.Event()
+        self.processes: dict[str, asyncio.subprocess.Process] = {}
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="motra-scheduler", daemon=True
+        )
+        self._thread.start()
+        self._tasks: set = set()
+
+    @staticmethod
+    def delay(unit: UnitSpec) -> float:
+        if unit.on_calendar is not None:
+            return max(0.0, (unit.on_calendar - datetime.now(UTC)).total_seconds())
+        return parse_systemd_timespan(unit.on_active)
+
+    def schedule(self, units: list[UnitSpec]) -> list[UnitSpec]:
+        failed = []
+        for unit in units:
+            if unit.unit.startswith(CLIENT_UNIT_PREFIX):
+                self.restart_at = time.monotonic() + self.delay(unit)
+                continue
+
+            if "@" not in unit.unit:
+                logger.error(f"Cannot run {unit.unit}, it is not a payload unit")
+                failed.append(unit)
+                continue
+
+            future = asyncio.run_coroutine_threadsafe(self.run(unit), self.loop)
+            self._tasks.add(future)
+            future.add_done_callback(self._tasks.discard)
+        return failed
+
+    async def run(self, unit: UnitSpec):
+        payload_id = unit.unit.split("@", 1)[1].rsplit(".", 1)[0]
+        await asyncio.sleep(self.delay(unit))
+
+        started = datetime.now(UTC)
+
+        # the server keeps a workspace for each client session
+        workspace = find_payload_workspace(payload_id, self.workspace)
+        limit = parse_systemd_timespan(unit.runtime_max)
+        log_file = workspace / f"{payload_id}.log"
+        with open(log_file, "ab") as log:
+            try:
+                payload = GenericPayload.model_validate_json(
+                    (workspace / f"{payload_id}.json").read_text()
+                )
+                command = shlex.split(payload.command)
+                if payload.depends_on:
+                    try:
+                        await wait_for_dependencies(payload, workspace)
+                    except DependencyError as e:
+                        # mexec exits with 1 in this case
+                        message = (
+                            f"Dependency not met: {e}\n"
+                            f"{unit.unit}: Failed with result 'exit-code'.\n"
+                        )
+                        log.write(message.encode())
+                        self.record_finish(workspace, payload_id, "exit-code", 1)
+                        return
+                if payload.payload_type == "gate":
+                    self.record_start(workspace, payload_id, started)
+                    await self.check_gate(unit, payload, workspace, log, limit)
+                    return
+                log.write(f"Executing: {payload.command}\n".encode())
+                log.flush()
+
+                # the settings systemd applies to the unit
+                profile = ResourceProfile.from_properties(unit.properties)
+                ionice = shutil.which("ionice")
+                if profile.ionice() and ionice is not None:
+                    command = [ionice, *profile.ionice(), *command]
+                if profile.cgroup_only():
+                    logger.warning(
+                        f"{profile.cgroup_only()} of {payload_id} require a unit"
+                    )
+
+                self.record_start(workspace, payload_id, started)
+
+                process = await asyncio.create_subprocess_exec(
+                    *command,
+                    cwd=workspace,
+                    stdout=log,
+                    stderr=asyncio.subprocess.STDOUT,
+                    start_new_session=True,
+                    preexec_fn=profile.apply if unit.properties else None,
+                )
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                logger.error(f"Cannot start payload {payload_id}: {e}")
+                message = f"{e}\n{unit.unit}: Failed with result 'resources'.\n"
+                log.write(message.encode())
+                self.record_finish(workspace, payload_id, "resources", None)
+                return
+            self.processes[payload_id] = process
+
+            result = "success"
+            try:
+                await asyncio.wait_for(
+                    process.wait(), None if math.isinf(limit) else limit
+                )
+            except asyncio.TimeoutError:
+                result = "timeout"
+                await self.stop(process)
+            finally:
+                self.processes.pop(payload_id, None)
+
+            if result == "success" and process.returncode != 0:
+                result = "exit-code" if process.returncode > 0 else "signal"
+            if result != "success":
+                # the same message as in the journal of a failed unit
+                log.write(f"{unit.unit}: Failed with result '{result}'.\n".encode())
+
+        logger.info(f"Payload {payload_id} finished: {result}")
+        self.record_finish(workspace, payload_id, result, process.returncode)
+
+    async def check_gate(
+        self,
+        unit: UnitSpec,
+        payload: GenericPayload,
+        workspace: Path,
+        log,
+        limit: float,
+    ):
+        probes = [describe_probe(probe) for probe in payload.gate.probes]
+        log.write(f"Checking gate: {probes}\n".encode())
+        log.flush()
+
+        try:
+            failed = await asyncio.wait_for(
+                run_gate(payload.gate, workspace, payload),
+                None if math.isinf(limit) else limit,
+            )
+            result = "exit-code" if failed else "success"
+        except asyncio.TimeoutError:
+            failed = payload.gate.probes
+            result = "timeout"
+        for probe in failed:
+            message = f"Gate not passed after {payload.gate.timeout}: "
+            log.write(f"{message}{describe_probe(probe)}\n".encode())
+        if result != "success":
+            log.write(f"{unit.unit}: Failed with result '{result}'.\n".encode())
+
+        logger.info(f"Gate {payload.payload_id} finished: {result}")
+        returncode = None if result == "timeout" else int(bool(failed))
+        self.record_finish(workspace, payload.payload_id, result, returncode)
+
+    async def stop(self, process: asyncio.subprocess.Process):
+        # the payload runs in its own session, stop all of its processes
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            os.killpg(process.pid, signal.SIGKILL)
+            await process.wait()
+        except ProcessLookupError:
+            pass
+
+    def record_start(self, workspace: Path, payload_id: str, started: datetime):
+        timing = load_timing(workspace, payload_id)
+        timing.started_utc = started
+        timing.exec_utc = datetime.now(UTC)
+        store_timing(workspace, timing)
+
+    def record_finish(
+        self,
+        workspace: Path,
+        payload_id: str,
+        result: str,
+        returncode: Optional[int],
+    ):
+        timing = load_timing(workspace, payload_id)
+        timing.finished_utc = datetime.now(UTC)
+        timing.result = result
+        timing.exit_status = None if returncode is None else str(returncode)
+        try:
+            store_timing(workspace, timing)
+        except OSError as e:
+            logger.warning(f"Cannot store the timing of {payload_id}: {e}")
+
+        # the last payload of a client run restarts the client early
+        completion = claim_completion(workspace)
+        if completion is not None and self.restart_at is not None:
+            logger.info(f"All payloads of {completion.CapConID} exited")
+            settle = parse_systemd_timespan(completion.settle)
+            self.restart_at = min(self.restart_at, time.monotonic() + settle)
+            self._restart.set()
+
+    def wait_restart(self) -> bool:
+        if self.restart_at is None:
+            return False
+        delay = self.restart_at - time.monotonic()
+        if delay > 0:
+            logger.info(f"Restarting the client in at most {delay:.1f}s")
+        while delay > 0:
+            self._restart.wait(delay)
+            self._restart.clear()
+            delay = self.restart_at - time.monotonic()
+        self.restart_at = None
+        return True
+
+    def close(self):
+        """
+        Stops the running payloads and the event loop.
+        """
+
+        async def shutdown():
+            for process in list(self.processes.values()):
+                await self.stop(process)
+
+        if self.loop.is_running():
+            for future in list(self._tasks):
+                future.cancel()
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+
+
+def create_scheduler(
+    backend: SCHEDULER_BACKENDS = "systemd-run",
+    workspace: Optional[Path] = None,
+) -> SchedulerBackend:
+    """
+    workspace: The live workspace, where the asyncio backend runs payloads.
+    """
+    if backend == "asyncio":
+        return AsyncioScheduler(workspace or Path())
+    if backend == "dbus":
+        if jeepney is not None:
+            return DBusScheduler()
+        logger.warning(
+            "The dbus scheduler requires jeepney (motra[dbus]), using systemd-run"
+        )
+    return SystemdRunScheduler()
@@ -0,0 +1,265 @@
+import logging
+import math
+import os
+import statistics
+import zipfile
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from motra.common.capcon_protocol import GenericPayload
+from motra.common.timespan import parse_systemd_timespan
+
+logger = logging.getLogger(__name__)
+
+SKEW_REPORT = "skew_report.json"
+
+TIMING_ROLES = Literal["client", "server"]
+
+
+def timing_file(workspace: Path, payload_id: str) -> Path:
+    return workspace / f"{payload_id}.timing.json"
+
+
+class PayloadTiming(BaseModel):
+    """
+    Planned and actual start of a payload. The scheduler writes the planned
+    instant, mexec adds the start and the ExecStopPost hook of the unit adds
+    the end. All times are UTC with microsecond resolution.
+
+    started_utc: First statement of mexec, the unit was started by systemd.
+    exec_utc: Right before mexec replaces itself with the payload command.
+    """
+
+    payload_id: str
+    planned_utc: Optional[datetime] = None
+    started_utc: Optional[datetime] = None
+    exec_utc: Optional[datetime] = None
+    finished_utc: Optional[datetime] = None
+    result: Optional[str] = Field(
+        description="Result of the unit as reported by systemd, e.g. success",
+        default=None,
+    )
+    exit_status: Optional[str] = None
+
+    @property
+    def start_skew(self) -> Optional[float]:
+        """Actual minus planned start in seconds."""
+        if self.planned_utc is None or self.started_utc is None:
+            return None
+        return (self.started_utc - self.planned_utc).total_seconds()
+
+    @property
+    def exec_delay(self) -> Optional[float]:
+        """Time spent inside mexec before the payload command runs."""
+        if self.started_utc is None or self.exec_utc is None:
+            return None
+        return (self.exec_utc - self.started_utc).total_seconds()
+
+
+def load_timing(workspace: Path, payload_id: str) -> PayloadTiming:
+    path = timing_file(workspace, payload_id)
+    try:
+        return PayloadTiming.model_validate_json(path.read_text())
+    except (OSError, ValidationError):
+        return PayloadTiming(payload_id=payload_id)
+
+
+def store_timing(workspace: Path, timing: PayloadTiming):
+    path = timing_file(workspace, timing.payload_id)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(timing.model_dump_json(indent=2))
+    tmp.replace(path)
+
+
+def record_planned(
+    workspace: Path,
+    payloads: list[GenericPayload],
+    trigger: Optional[datetime] = None,
+):
+    """
+    Stores the planned start (trigger + offset) of each payload. Without a
+    trigger, the offsets count from now.
+    """
+    start = trigger or datetime.now(UTC)
+    for payload in payloads:
+        try:
+            offset = parse_systemd_timespan(payload.offset)
+        except ValueError:
+            continue
+        timing = PayloadTiming(
+            payload_id=payload.payload_id,
+            planned_utc=start + timedelta(seconds=offset),
+        )
+        try:
+            store_timing(workspace, timing)
+        except OSError as e:
+            logger.warning(f"Cannot store the timing of {payload.payload_id}: {e}")
+
+
+class SkewSummary(BaseModel):
+    """
+    Statistics of the start skew (actual minus planned start) in milliseconds.
+    """
+
+    count: int = 0
+    missing: int = Field(description="Payloads without a recorded start", default=0)
+    mean_ms: Optional[float] = None
+    median_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    min_ms: Optional[float] = None
+    max_ms: Optional[float] = None
+    max_abs_ms: Optional[float] = None
+
+    @classmethod
+    def from_skews(cls, skews: list[float], missing: int = 0) -> "SkewSummary":
+        if not skews:
+            return cls(missing=missing)
+        values = sorted(skew * 1000 for skew in skews)
+        p95 = values[min(len(values) - 1, math.ceil(0.95 * len(values)) - 1)]
+        return cls(
+            count=len(values),
+            missing=missing,
+            mean_ms=statistics.fmean(values),
+            median_ms=statistics.median(values),
+            p95_ms=p95,
+            min_ms=values[0],
+            max_ms=values[-1],
+            max_abs_ms=max(abs(values[0]), abs(values[-1])),
+        )
+
+
+class SkewReport(BaseModel):
+    """
+    Timing of all payloads of a run on one host, stored in its archive.
+    """
+
+    CapConID: str
+    role: TIMING_ROLES
+    payloads: list[PayloadTiming]
+    summary: SkewSummary
+
+
+def write_skew_report(
+    workspace: Path, capcon_id: str, role: TIMING_ROLES
+) -> Optional[SkewReport]:
+    """
+    Collects the timing records of a run into the skew report, called right
+    before the workspace is archived.
+    """
+    timings = []
+    for path in sorted(workspace.glob("*.timing.json")):
+        try:
+            timings.append(PayloadTiming.model_validate_json(path.read_text()))
+        except (OSError, ValidationError) as e:
+            logger.warning(f"Cannot read timing record {path.name}: {e}")
+    if not timings:
+        return None
+
+    skews = [t.start_skew for t in timings if t.start_skew is not None]
+    report = SkewReport(
+        CapConID=capcon_id,
+        role=role,
+        payloads=timings,
+        summary=SkewSummary.from_skews(skews, missing=len(timings) - len(skews)),
+    )
+    (workspace / SKEW_REPORT).write_text(report.model_dump_json(indent=2))
+    summary = report.summary
+    if summary.count:
+        logger.info(
+            f"Start skew of {capcon_id} ({role}): median {summary.median_ms:.1f}ms, "
+            f"max {summary.max_abs_ms:.1f}ms over {summary.count} payload(s)"
+        )
+    return report
+
+
+def read_skew_report(archive: Path) -> Optional[SkewReport]:
+    try:
+        with zipfile.ZipFile(archive, "r") as zf:
+            return SkewReport.model_validate_json(zf.read(SKEW_REPORT))
+    except KeyError:
+        return None
+    except (OSError, zipfile.BadZipFile, ValidationError) as e:
+        logger.warning(f"Cannot read the skew report of {archive}: {e}")
+        return None
+
+
+class TimingSummary(BaseModel):
+    """
+    Start skew over all evaluated runs, by role and overall.
+    """
+
+    runs: int = 0
+    overall: SkewSummary = Field(default_factory=SkewSummary)
+    roles: dict[str, SkewSummary] = Field(default_factory=dict)
+    worst_runs: list[tuple[str, float]] = Field(
+        description="CapConIDs with the largest absolute skew in milliseconds",
+        default_factory=list,
+    )
+
+
+class TimingAggregate:
+    """
+    Collects the skew reports of all runs on the server. Each report is
+    appended to a JSON lines file, the summary is rewritten after each run.
+    """
+
+    def __init__(self, reports_file: Path, summary_file: Path, worst: int = 10):
+        self.reports_file = reports_file
+        self.summary_file = summary_file
+        self.worst = worst
+        self.skews: dict[str, list[float]] = {}
+        self.missing: dict[str, int] = {}
+        self.runs: set[str] = set()
+        self.worst_runs: dict[str, float] = {}
+
+        if reports_file.is_file():
+            for line in reports_file.read_text().splitlines():
+                try:
+                    self._apply(SkewReport.model_validate_json(line))
+                except ValidationError:
+                    logger.warning(f"Skipping invalid line in {reports_file.name}")
+
+    def _apply(self, report: SkewReport):
+        skews = [t.start_skew for t in report.payloads if t.start_skew is not None]
+        self.skews.setdefault(report.role, []).extend(skews)
+        self.missing[report.role] = (
+            self.missing.get(report.role, 0) + report.summary.missing
+        )
+        self.runs.add(report.CapConID)
+        if report.summary.max_abs_ms is not None:
+            self.worst_runs[report.CapConID] = max(
+                report.summary.max_abs_ms, self.worst_runs.get(report.CapConID, 0.0)
+            )
+
+    def add(self, report: SkewReport):
+        self._apply(report)
+        with open(self.reports_file, "a") as f:
+            f.write(report.model_dump_json() + "\n")
+
+    def add_archives(self, *archives: Path):
+        added = False
+        for archive in archives:
+            report = read_skew_report(archive)
+            if report is not None:
+                self.add(report)
+                added = True
+        if added:
+            self.summary_file.write_text(self.summary().model_dump_json(indent=2))
+
+    def summary(self) -> TimingSummary:
+        worst = sorted(self.worst_runs.items(), key=lambda run: run[1], reverse=True)
+        return TimingSummary(
+            runs=len(self.runs),
+            overall=SkewSummary.from_skews(
+                [skew for skews in self.skews.values() for skew in skews],
+                missing=sum(self.missing.values()),
+            ),
+            roles={
+                role: SkewSummary.from_skews(skews, self.missing.get(role, 0))
+                for role, skews in self.skews.items()
+            },
+            worst_runs=worst[: self.worst],
+        )
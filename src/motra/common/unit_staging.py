@@ -0,0 +1,212 @@
+import logging
+import math
+import subprocess
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Optional
+
+from motra.common.schedule import UnitSpec
+from motra.common.timespan import parse_systemd_timespan
+
+logger = logging.getLogger(__name__)
+
+# units in here are gone after a reboot, writing them requires root
+RUNTIME_UNIT_DIRECTORY = Path("/run/systemd/system")
+
+LIMITS_DROP_IN = "motra-limits.conf"
+
+
+class StagedRun:
+    """
+    The units of a run, written to the runtime unit directory while the run
+    is prepared (CAPCON/ACK_CAPCON). Each unit gets a timer with its offset
+    as OnActiveSec, all timers hang off a single trigger target. Starting the
+    run only starts this target, so the expensive work (writing the files,
+    reloading and validating the units) is done before EXECUTE_CAPCON.
+
+    All timers are started in the same transaction as the target, so the
+    offsets count from the same instant. Loading the files needs a daemon
+    reload for each run, which reloads every unit of the host. Staging is
+    therefore only enabled with stage_units.
+
+    prefix: Name of the trigger target, e.g. motra-client or
+        motra-server-mexec. Used to clear left over runs of the same role.
+
+    units: The staged units, the on_active span is used as offset.
+    """
+
+    name: str
+    units: list[UnitSpec]
+    directory: Path
+
+    def __init__(
+        self,
+        prefix: str,
+        name: str,
+        units: list[UnitSpec],
+        directory: Path = RUNTIME_UNIT_DIRECTORY,
+    ):
+        self.prefix = prefix
+        self.name = name
+        self.units = units
+        self.directory = directory
+        self.staged = False
+
+    @property
+    def target(self) -> str:
+        return f"{self.prefix}-trigger-{self.name}.target"
+
+    def files(self) -> list[Path]:
+        files = [self.directory / self.target]
+        for unit in self.units:
+            files.append(self.directory / unit.timer)
+            files.append(self.directory / f"{unit.unit}.d" / LIMITS_DROP_IN)
+        return files
+
+    def timer_file(self, unit: UnitSpec) -> str:
+        return (
+            "[Unit]\n"
+            f"Description=motra timer for {unit.unit}\n"
+            f"PartOf={self.target}\n"
+            "\n"
+            "[Timer]\n"
+            f"OnActiveSec={unit.on_active}\n"
+            f"AccuracySec={unit.accuracy}\n"
+            "RemainAfterElapse=no\n"
+            f"Unit={unit.unit}\n"
+        )
+
+    def limits_file(self, unit: UnitSpec) -> str:
+        """
+        The drop-in with the runtime limit and resource properties of a unit,
+        empty if it has neither.
+        """
+        lines = [f"{name}={value}" for name, value in unit.properties.items()]
+        if not _unlimited(unit.runtime_max):
+            lines.insert(0, f"RuntimeMaxSec={unit.runtime_max}")
+        if not lines:
+            return ""
+        return "[Service]\n" + "".join(f"{line}\n" for line in lines)
+
+    def target_file(self) -> str:
+        timers = " ".join(unit.timer for unit in self.units)
+        return (
+            "[Unit]\n"
+            f"Description=motra trigger for {self.name}\n"
+            f"Wants={timers}\n"
+        )
+
+    def stage(self) -> bool:
+        """
+        Writes and loads the units of the run.
+
+        Returns:
+            False, if the units could not be written or did not load. The run
+            then needs to be scheduled unit by unit.
+        """
+        try:
+            for unit in self.units:
+                (self.directory / unit.timer).write_text(self.timer_file(unit))
+                limits = self.limits_file(unit)
+                if limits:
+                    drop_in = self.directory / f"{unit.unit}.d"
+                    drop_in.mkdir(exist_ok=True)
+                    (drop_in / LIMITS_DROP_IN).write_text(limits)
+            (self.directory / self.target).write_text(self.target_file())
+        except OSError as e:
+            logger.warning(f"Cannot stage the units of {self.name}: {e}")
+            self.clear()
+            return False
+
+        if not self.load():
+            self.clear(reload=True)
+            return False
+
+        self.staged = True
+        logger.info(f"Staged {len(self.units)} units for {self.name}")
+        return True
+
+    def load(self) -> bool:
+        """
+        Reloads systemd and checks that the target and all timers loaded.
+        """
+        names = [self.target] + [unit.timer for unit in self.units]
+        try:
+            subprocess.run(
+                ["systemctl", "daemon-reload"],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            result = subprocess.run(
+                ["systemctl", "show", "--property=LoadState", "--value", *names],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f"Cannot load the staged units of {self.name}: {e}")
+            return False
+
+        states = result.stdout.split()
+        failed = [name for name, state in zip(names, states) if state != "loaded"]
+        if len(states) != len(names) or failed:
+            logger.warning(f"Staged units of {self.name} did not load: {failed}")
+            return False
+        return True
+
+    def trigger_unit(self, trigger: Optional[datetime] = None) -> UnitSpec:
+        """
+        The single timer starting the run, at the trigger instant if set.
+        """
+        unit = UnitSpec(unit=self.target)
+        if trigger is not None and trigger > datetime.now(UTC):
+            unit.on_calendar = trigger
+        return unit
+
+    def clear(self, reload: bool = False):
+        """
+        Removes the unit files, the loaded units are dropped by systemd once
+        they are inactive. Reload, if the unit names are used again right away.
+        """
+        for path in self.files():
+            try:
+                path.unlink(missing_ok=True)
+                if path.name == LIMITS_DROP_IN:
+                    path.parent.rmdir()
+            except OSError:
+                pass
+        self.staged = False
+
+        if reload:
+            try:
+                subprocess.run(["systemctl", "daemon-reload"], capture_output=True)
+            except OSError as e:
+                logger.warning(f"Cannot reload systemd: {e}")
+
+
+def clear_staged_units(prefix: str, directory: Path = RUNTIME_UNIT_DIRECTORY):
+    """
+    Removes the trigger targets, timers and limits left over by earlier runs
+    of a role, e.g. after the client restarted.
+    """
+    try:
+        paths = list(directory.glob(f"{prefix}*"))
+    except OSError:
+        return
+    for path in paths:
+        if path.suffix in (".timer", ".target") and path.is_file():
+            path.unlink(missing_ok=True)
+        elif path.suffix == ".d" and (path / LIMITS_DROP_IN).is_file():
+            (path / LIMITS_DROP_IN).unlink(missing_ok=True)
+            try:
+                path.rmdir()
+            except OSError:
+                pass
+
+
+def _unlimited(timespan: str) -> bool:
+    try:
+        return math.isinf(parse_systemd_timespan(timespan))
+    except ValueError:
+        return False
@@ -1,4 +1,4 @@
-import json, hashlib, base64, logging
+import json, hashlib, base64, logging, uuid
 from pathlib import Path
 from typing import Dict, Any, Optional
 
@@ -156,3 +156,12 @@ def create_base64_file_stream(file: Path):
     # encode the data into a base64 stream for sending
     file_bytes = file.read_bytes()
     return base64.b64encode(file_bytes).decode("ascii")
+
+
+def get_hardware_id() -> str:
+    """
+    Returns the MAC address of this host in the format 00:11:22:33:44:55.
+    Used to identify the client session on the server.
+    """
+    node = uuid.getnode()
+    return ":".join(f"{(node >> shift) & 0xFF:02x}" for shift in range(40, -8, -8))
@@ -1,5 +1,5 @@
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, WatchedFileHandler
 
 from motra.logging.log_config import (
     configure_consoleNoTraceback_logger,
@@ -34,10 +34,19 @@ def server_defaultConsoleLogger(loglevel: str) -> None:
     log.info("Starting MOTRA Server ...")
 
 
-def server_defaultFileLogger(loglevel: str, logfile: str) -> None:
+def server_defaultFileLogger(loglevel: str, logfile: str, rotate: bool = True) -> None:
+    """
+    rotate: False for the worker processes, the log is only appended to and
+        reopened, if it was moved.
+    """
 
     level = getattr(logging, loglevel.upper())
-    file_handler = RotatingFileHandler(logfile, maxBytes=100 * 1024, backupCount=2)
+    if rotate:
+        file_handler = RotatingFileHandler(
+            logfile, maxBytes=100 * 1024, backupCount=2
+        )
+    else:
+        file_handler = WatchedFileHandler(logfile)
 
     serverlogger = logging.getLogger("motra.server")
     configure_contextfile_logger(
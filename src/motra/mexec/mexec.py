@@ -1,15 +1,44 @@
+import asyncio
 import logging
 import shlex
 import os
 import sys
 
+from datetime import datetime, UTC
 from pathlib import Path
+from typing import Optional
 
 from motra.common.capcon_protocol import GenericPayload
+from motra.common.completion import claim_completion, restart_client
+from motra.common.readiness import (
+    DependencyError,
+    describe_probe,
+    run_gate,
+    wait_for_dependencies,
+)
+from motra.common.timing import load_timing, store_timing
 
 logger = logging.getLogger(__name__)
 
 
+def find_payload_workspace(
+    payload_id: str, workspace: Optional[Path] = None
+) -> Path:
+    """
+    Returns the live workspace holding the configuration of a payload.
+    """
+    # get the current path, this sould be inside the live environment of client/server
+    workspace = (workspace or Path()).resolve()
+
+    # the server keeps a live workspace for each client session, the payload
+    # ids are unique, so the session can be found by the payload file
+    if not (workspace / f"{payload_id}.json").exists():
+        candidates = list(workspace.glob(f"*/{payload_id}.json"))
+        if len(candidates) == 1:
+            workspace = candidates[0].parent
+    return workspace
+
+
 def mexec_run(payload_id: str):
     """
     Run a payload using a custom configuration we load from the current environment.
@@ -21,13 +50,16 @@ def mexec_run(payload_id: str):
     Alternatively the main process can get additional information from the env file,
     which was also loaded by sytemd at this point.
     """
+    # taken first, the difference to the planned start is the scheduling skew
+    started = datetime.now(UTC)
+
+    workspace = find_payload_workspace(payload_id)
+    os.chdir(workspace)
+    target_payload = workspace / f"{payload_id}.json"
 
-    # get the current path, this sould be inside the live environment of client/server
-    workspace = Path().resolve()
     print(f"payload_id: {payload_id}")
     print(f"logging files to {workspace}")
 
-    target_payload = workspace / f"{payload_id}.json"
     configuration = None
 
     # load the current payload configuration
@@ -40,12 +72,39 @@ def mexec_run(payload_id: str):
             f"configuration for {payload_id} does not exist in {workspace}. "
         )
 
+    # the offset of the unit is the earliest start, payloads with dependencies
+    # wait for the other payloads of the run
+    if configuration.depends_on:
+        print(f"Waiting for {[d.payload for d in configuration.depends_on]}")
+        sys.stdout.flush()
+        try:
+            asyncio.run(wait_for_dependencies(configuration, workspace))
+        except DependencyError as e:
+            print(f"Dependency not met: {e}")
+            sys.stdout.flush()
+            sys.exit(1)
+
+    # a gate runs its probes instead of a command
+    if configuration.payload_type == "gate":
+        record_start(workspace, payload_id, started)
+        probes = [describe_probe(probe) for probe in configuration.gate.probes]
+        print(f"Checking gate: {probes}")
+        sys.stdout.flush()
+        failed = asyncio.run(run_gate(configuration.gate, workspace, configuration))
+        for probe in failed:
+            print(f"Gate not passed after {configuration.gate.timeout}: ", end="")
+            print(describe_probe(probe))
+        sys.stdout.flush()
+        sys.exit(1 if failed else 0)
+
     # get capcon/payload.command
     # use shlex to parse the command string
     print(f"Executing: {configuration.command}")
     command = shlex.split(configuration.command)
     prog = command[0]
 
+    record_start(workspace, payload_id, started)
+
     # flush all logs to systemd, otherwise these will be lost
     sys.stdout.flush()
 
@@ -53,5 +112,33 @@ def mexec_run(payload_id: str):
     os.execvp(prog, command)
 
 
+def record_start(workspace: Path, payload_id: str, started: datetime):
+    timing = load_timing(workspace, payload_id)
+    timing.started_utc = started
+    timing.exec_utc = datetime.now(UTC)
+    try:
+        store_timing(workspace, timing)
+    except OSError as e:
+        print(f"Cannot store the timing record: {e}")
+
+
+def mexec_finish(payload_id: str):
+    """
+    Records the end of a payload, run by systemd as ExecStopPost of the mexec
+    unit. systemd passes the result of the unit through the environment.
+    """
+    workspace = find_payload_workspace(payload_id)
+    timing = load_timing(workspace, payload_id)
+    timing.finished_utc = datetime.now(UTC)
+    timing.result = os.environ.get("SERVICE_RESULT")
+    timing.exit_status = os.environ.get("EXIT_STATUS")
+    store_timing(workspace, timing)
+
+    # the last payload of a client run starts the client early
+    completion = claim_completion(workspace)
+    if completion is not None:
+        restart_client(completion)
+
+
 if __name__ == "__main__":
     mexec_run()
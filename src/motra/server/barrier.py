@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, UTC
+from typing import Optional
+
+from motra.common.capcon_protocol import CAPCON
+
+logger = logging.getLogger(__name__)
+
+
+def client_targets(capcon: CAPCON) -> set[str]:
+    """
+    Returns the clients (entity ids) targeted by the payloads of a capcon.
+    """
+    targets = set()
+    for payload in capcon.payload or []:
+        targets.update(payload.target)
+    targets.discard("server")
+    return targets
+
+
+class TriggerBarrier:
+    """
+    Synchronizes the start of a capcon, that targets several clients. Each
+    targeted client receives the same capcon. The server holds back
+    EXECUTE_CAPCON until every client sent ACK_CAPCON and then releases all
+    of them at once, with a shared start instant in the near future. All
+    payload offsets count from this instant.
+
+    participants: The entity ids of the targeted clients.
+
+    leader: The first client joining the run. Only the session of the leader
+        runs the server side payloads and holds the lease of the test.
+
+    cancelled: The leader disconnected before the start and the test was
+        returned to the queue, the other clients must not run it.
+    """
+
+    capcon: CAPCON
+    participants: set[str]
+
+    def __init__(self, capcon: CAPCON, participants: set[str]):
+        self.capcon = capcon
+        self.participants = participants
+        self.leader: Optional[str] = None
+        self.joined: set[str] = set()
+        self.acknowledged: set[str] = set()
+        self.trigger_utc: Optional[datetime] = None
+        self.cancelled = False
+        self._released = asyncio.Event()
+
+    @property
+    def capcon_id(self) -> str:
+        return self.capcon.CapConID
+
+    def waiting_for(self, entity_id: str) -> bool:
+        return entity_id in self.participants and entity_id not in self.joined
+
+    def join(self, entity_id: str) -> bool:
+        """
+        Adds a client to the run.
+
+        Returns:
+            True, if the client is the leader of the run.
+        """
+        self.joined.add(entity_id)
+        if self.leader is None:
+            self.leader = entity_id
+        return self.leader == entity_id
+
+    @property
+    def complete(self) -> bool:
+        return self.acknowledged >= self.participants
+
+    def _release(self, trigger_delay: float):
+        if self.trigger_utc is None:
+            self.trigger_utc = datetime.now(UTC) + timedelta(seconds=trigger_delay)
+            self._released.set()
+
+    def cancel(self):
+        """
+        Releases all waiting clients without a start instant.
+        """
+        self.cancelled = True
+        self._released.set()
+
+    async def arrive(
+        self,
+        entity_id: str,
+        timeout: float,
+        trigger_delay: float,
+    ) -> Optional[datetime]:
+        """
+        Waits until all participants acknowledged the capcon. If some client
+        does not arrive within the timeout, the run is started with the
+        clients present.
+
+        Returns:
+            The shared start instant, None if the run was cancelled.
+        """
+        self.acknowledged.add(entity_id)
+        if self.cancelled:
+            return None
+        if self.complete:
+            self._release(trigger_delay)
+
+        try:
+            await asyncio.wait_for(self._released.wait(), timeout)
+        except TimeoutError:
+            missing = ", ".join(sorted(self.participants - self.acknowledged))
+            logger.warning(
+                f"Barrier for {self.capcon_id} timed out, starting without {missing}"
+            )
+            self._release(trigger_delay)
+
+        if self.cancelled:
+            return None
+        return self.trigger_utc
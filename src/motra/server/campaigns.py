@@ -0,0 +1,223 @@
+import logging
+import math
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Iterable, Optional
+
+from pydantic import BaseModel, Field
+
+from motra.common.capcon_protocol import CAPCON
+from motra.common.timespan import parse_systemd_timespan
+from motra.server.capcon_queue import DEFAULT_CAMPAIGN, PendingRuns
+from motra.workspace.workspace_configuration import CampaignConfiguration
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignProgress(BaseModel):
+    """
+    Progress of a single campaign, times are in seconds.
+    """
+
+    campaign: str
+    weight: float
+    deadline: Optional[datetime] = None
+    pending: int = Field(description="Number of pending runs")
+    remaining_runtime: float = Field(description="Summed duration of pending runs")
+    dispatched: int = Field(description="Runs sent to a client by this server")
+    dispatched_runtime: float
+    completed: int = Field(description="Runs completed according to the journal")
+    cancelled: int = 0
+    at_risk: bool = Field(
+        description="The remaining runs do not fit before the deadline",
+        default=False,
+    )
+
+
+class Campaign:
+    """
+    A set of tests loaded from one directory, dispatched side by side with
+    other campaigns.
+
+    virtual_time: The dispatched runtime divided by the weight. The campaign
+        with the smallest virtual time is next, so over time each campaign
+        receives a share of the run time proportional to its weight.
+    """
+
+    name: str
+    directory: Path
+    weight: float
+    deadline: Optional[datetime]
+
+    def __init__(
+        self,
+        name: str,
+        directory: Path,
+        weight: float = 1.0,
+        deadline: Optional[datetime] = None,
+    ):
+        self.name = name
+        self.directory = directory
+        self.weight = weight
+        if deadline is not None and deadline.tzinfo is None:
+            deadline = deadline.replace(tzinfo=UTC)
+        self.deadline = deadline
+
+        self.virtual_time = 0.0
+        self.dispatched = 0
+        self.dispatched_runtime = 0.0
+
+    @classmethod
+    def from_configuration(
+        cls, name: str, configuration: CampaignConfiguration, test_workspace: Path
+    ):
+        directory = configuration.directory or Path(test_workspace) / name
+        return cls(name, directory, configuration.weight, configuration.deadline)
+
+    def charge(self, runtime: float):
+        self.dispatched += 1
+        self.dispatched_runtime += runtime
+        self.virtual_time += runtime / self.weight
+
+    def at_risk(self, remaining_runtime: float, now: datetime) -> bool:
+        """
+        Checks if the remaining runs still fit before the deadline, when run
+        one after another.
+        """
+        if self.deadline is None or remaining_runtime == 0:
+            return False
+        return remaining_runtime >= (self.deadline - now).total_seconds()
+
+
+def load_campaigns(
+    campaigns: dict[str, CampaignConfiguration], test_workspace: Path
+) -> "CampaignScheduler":
+    """
+    Creates the configured campaigns, the test workspace itself is the only
+    campaign if none are configured.
+    """
+    if not campaigns:
+        return CampaignScheduler([Campaign(DEFAULT_CAMPAIGN, Path(test_workspace))])
+    return CampaignScheduler(
+        Campaign.from_configuration(name, configuration, test_workspace)
+        for name, configuration in campaigns.items()
+    )
+
+
+class CampaignScheduler:
+    """
+    Weighted fair interleaving of multiple campaigns (stride scheduling over
+    the run time of the dispatched tests).
+
+    The order of the campaigns for the next request is:
+        1. campaigns with runs in a higher priority lane
+        2. campaigns at risk of missing their deadline, earliest deadline first
+        3. the campaign with the smallest virtual time
+
+    A campaign without pending runs does not collect credit. Once it has runs
+    again, it continues at the virtual time of the other active campaigns.
+    """
+
+    campaigns: dict[str, Campaign]
+
+    def __init__(self, campaigns: Iterable[Campaign]):
+        self.campaigns = {campaign.name: campaign for campaign in campaigns}
+        self._active: set[str] = set()
+
+    @property
+    def default(self) -> str:
+        return next(iter(self.campaigns))
+
+    def campaign_for(self, test_file: Path) -> Optional[str]:
+        """
+        Returns the campaign of a test file by its directory.
+        """
+        directory = test_file.resolve().parent
+        for campaign in self.campaigns.values():
+            if campaign.directory.resolve() == directory:
+                return campaign.name
+        return None
+
+    def test_files(self) -> list[Path]:
+        """
+        Lists the test files inside the directories of all campaigns.
+        """
+        test_files = []
+        for campaign in self.campaigns.values():
+            if not campaign.directory.is_dir():
+                logger.warning(
+                    f"Test directory {campaign.directory} of campaign "
+                    f"{campaign.name} does not exist"
+                )
+                continue
+            test_files.extend(campaign.directory.glob("*.json"))
+        return test_files
+
+    def charge(self, name: str, capcon: CAPCON):
+        """
+        Accounts a dispatched run to its campaign.
+        """
+        try:
+            runtime = parse_systemd_timespan(capcon.duration)
+        except ValueError:
+            runtime = math.inf
+        # every run advances the virtual time, even without a usable duration
+        if math.isinf(runtime) or runtime <= 0:
+            runtime = 1.0
+        self.campaigns[name].charge(runtime)
+        logger.debug(
+            f"Campaign {name}: {capcon.CapConID}, "
+            f"virtual time {self.campaigns[name].virtual_time:.0f}s"
+        )
+
+    def order(
+        self, pending: dict[str, PendingRuns], now: Optional[datetime] = None
+    ) -> list[str]:
+        """
+        Returns the campaigns with pending runs in the order of dispatch.
+        """
+        now = now or datetime.now(UTC)
+        active = [name for name in pending if name in self.campaigns]
+
+        previous = [self.campaigns[name] for name in self._active if name in active]
+        if previous:
+            floor = min(campaign.virtual_time for campaign in previous)
+            for name in active:
+                if name not in self._active:
+                    campaign = self.campaigns[name]
+                    campaign.virtual_time = max(campaign.virtual_time, floor)
+        self._active = set(active)
+
+        def key(name: str):
+            campaign = self.campaigns[name]
+            risk = campaign.at_risk(pending[name].runtime, now)
+            deadline = campaign.deadline.timestamp() if risk else math.inf
+            return (pending[name].lane, deadline, campaign.virtual_time, name)
+
+        return sorted(active, key=key)
+
+    def progress(
+        self,
+        pending: dict[str, PendingRuns],
+        completed: dict[str, int],
+        cancelled: dict[str, int],
+    ) -> list[CampaignProgress]:
+        now = datetime.now(UTC)
+        report = []
+        for campaign in self.campaigns.values():
+            runs = pending.get(campaign.name, PendingRuns())
+            report.append(
+                CampaignProgress(
+                    campaign=campaign.name,
+                    weight=campaign.weight,
+                    deadline=campaign.deadline,
+                    pending=runs.runs,
+                    remaining_runtime=runs.runtime,
+                    dispatched=campaign.dispatched,
+                    dispatched_runtime=campaign.dispatched_runtime,
+                    completed=completed.get(campaign.name, 0),
+                    cancelled=cancelled.get(campaign.name, 0),
+                    at_risk=campaign.at_risk(runs.runtime, now),
+                )
+            )
+        return report
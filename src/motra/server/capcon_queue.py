@@ -0,0 +1,574 @@
+import itertools
+import logging
+import math
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Literal, Optional, get_args
+
+from pydantic import BaseModel, Field
+
+from motra.common.capcon import expand_template, template_capcon_id, template_size
+from motra.common.capcon_protocol import CAPCON, CapConMetadata, CapConTemplate
+from motra.common.timespan import parse_systemd_timespan
+from motra.server.test_index import CapConSummary
+
+logger = logging.getLogger(__name__)
+
+
+# priority lanes of the queue, in the order of dispatch
+QUEUE_LANES = Literal["urgent", "normal", "low"]
+LANES: tuple[str, ...] = get_args(QUEUE_LANES)
+
+# used for tests loaded from the test workspace, if no campaigns are configured
+DEFAULT_CAMPAIGN = "default"
+
+# raised by QueuedCapCon.capcon, if the file of a test was removed or changed
+# after the scan (pydantic's ValidationError is a ValueError)
+LOAD_ERRORS = (OSError, ValueError)
+
+
+def duration_of(summary: CapConSummary) -> float:
+    try:
+        return parse_systemd_timespan(summary.duration)
+    except ValueError:
+        logger.warning(f"Cannot parse duration of {summary.CapConID}")
+        return 0.0
+
+
+class QueueControl(BaseModel):
+    """
+    Changes to the queue made while the server is running, stored next to the
+    journal, so they are kept after a restart.
+    """
+
+    paused: bool = False
+    lanes: dict[str, QUEUE_LANES] = Field(
+        description="Lane of each test, that was moved out of the normal lane",
+        default_factory=dict,
+    )
+
+
+class QueuedCapCon:
+    """
+    A single entry of the server side test queue.
+
+    The entry holds the validated CAPCON model for a test file, so dispatching
+    a test to a client does not need to touch the disk again. If an entry is
+    created without a model, the file is validated on first access and the
+    result is kept for all further requests.
+
+    capcon_id: The CapConID of the test, used as key inside the queue.
+
+    source: The file the test was loaded from, None for tests without a file.
+
+    lane: The priority lane of the entry inside the queue.
+
+    campaign: The name of the campaign the test belongs to.
+    """
+
+    capcon_id: str
+    source: Optional[Path]
+    lane: QUEUE_LANES
+    campaign: str
+
+    def __init__(
+        self,
+        capcon_id: str,
+        source: Optional[Path] = None,
+        capcon: Optional[CAPCON] = None,
+        summary: Optional[CapConSummary] = None,
+    ):
+        if capcon is None and source is None:
+            raise ValueError("A queue entry needs either a model or a source file.")
+
+        self.capcon_id = capcon_id
+        self.source = source
+        self.lane = "normal"
+        self.campaign = DEFAULT_CAMPAIGN
+        self._capcon = capcon
+        self._summary = summary
+
+    @classmethod
+    def from_model(cls, capcon: CAPCON, source: Optional[Path] = None):
+        return cls(capcon.CapConID, source=source, capcon=capcon)
+
+    @property
+    def loaded(self) -> bool:
+        return self._capcon is not None
+
+    @property
+    def summary(self) -> CapConSummary:
+        """
+        The index summary of this entry, created from the model if the entry
+        was not loaded through the index.
+        """
+        if self._summary is None:
+            self._summary = CapConSummary.from_capcon(self.capcon)
+        return self._summary
+
+    @property
+    def capcon(self) -> CAPCON:
+        """
+        The validated model for this entry (memoized).
+        """
+        if self._capcon is None:
+            logger.debug(f"Validating {self.source} on first access")
+            capcon = CAPCON.model_validate_json(self.source.read_text())
+            if capcon.CapConID != self.capcon_id:
+                raise ValueError(
+                    f"{self.source} changed its CapConID from "
+                    f"{self.capcon_id} to {capcon.CapConID}."
+                )
+            self._capcon = capcon
+        return self._capcon
+
+
+class QueuedTemplate(QueuedCapCon):
+    """
+    A queue entry for a parameterized template. The runs are expanded one at a
+    time, when the template reaches the front of the queue, so the memory used
+    by the queue depends on the number of templates instead of the number of
+    runs.
+
+    capcon_id: The TemplateID, runs use the CapConIDs created by the template.
+
+    skip: CapConIDs of runs, that are not expanded again (e.g. completed runs
+        of a resumed campaign). Runs are skipped with skip_runs, which keeps
+        the number of remaining runs up to date.
+    """
+
+    def __init__(
+        self,
+        capcon_id: str,
+        source: Optional[Path] = None,
+        template: Optional[CapConTemplate] = None,
+        summary: Optional[CapConSummary] = None,
+    ):
+        if template is None and source is None:
+            raise ValueError("A queue entry needs either a model or a source file.")
+
+        self.capcon_id = capcon_id
+        self.source = source
+        self.lane = "normal"
+        self.campaign = DEFAULT_CAMPAIGN
+        self._capcon = None
+        self._summary = summary
+        self._template = template
+        self.skip: set[str] = set()
+        self.position = 0
+        # skipped runs at or after the position
+        self._skipped = 0
+        self._run_index: Optional[dict[str, int]] = None
+
+    @property
+    def template(self) -> CapConTemplate:
+        """
+        The validated template (memoized).
+        """
+        if self._template is None:
+            logger.debug(f"Validating template {self.source} on first access")
+            template = CapConTemplate.model_validate_json(self.source.read_text())
+            if template.TemplateID != self.capcon_id:
+                raise ValueError(
+                    f"{self.source} changed its TemplateID from "
+                    f"{self.capcon_id} to {template.TemplateID}."
+                )
+            self._template = template
+        return self._template
+
+    @property
+    def size(self) -> int:
+        if self._summary is not None:
+            return self._summary.expansions
+        return template_size(self.template)
+
+    @property
+    def remaining(self) -> int:
+        return self.size - self.position - self._skipped
+
+    def _index(self) -> dict[str, int]:
+        # created on the first skip, only the ids of the runs are generated
+        if self._run_index is None:
+            self._run_index = {
+                template_capcon_id(self.template, index): index
+                for index in range(self.size)
+            }
+        return self._run_index
+
+    def skip_runs(self, capcon_ids: Iterable[str]) -> int:
+        """
+        Skips runs by their CapConID, ids of other tests are ignored.
+
+        Returns:
+            The number of pending runs, that were skipped.
+
+        Raises:
+            OSError, ValueError: The template can not be loaded.
+        """
+        index = self._index()
+        skipped = 0
+        for capcon_id in capcon_ids:
+            position = index.get(capcon_id)
+            if position is None or capcon_id in self.skip:
+                continue
+            self.skip.add(capcon_id)
+            if position >= self.position:
+                skipped += 1
+        self._skipped += skipped
+        return skipped
+
+    def _advance(self):
+        # skipped runs only need their id, the run itself is not created
+        while (
+            self._skipped
+            and self.position < self.size
+            and template_capcon_id(self.template, self.position) in self.skip
+        ):
+            self.position += 1
+            self._skipped -= 1
+            self._capcon = None
+
+    @property
+    def exhausted(self) -> bool:
+        self._advance()
+        return self.position >= self.size
+
+    @property
+    def capcon(self) -> CAPCON:
+        """
+        The next pending run of the template (memoized until taken).
+        """
+        self._advance()
+        if self._capcon is None:
+            self._capcon = expand_template(self.template, self.position)
+        return self._capcon
+
+    def take(self) -> Optional[QueuedCapCon]:
+        """
+        Returns the next pending run as a single queue entry.
+        """
+        if self.exhausted:
+            return None
+        entry = QueuedCapCon.from_model(self.capcon, source=self.source)
+        entry.lane = self.lane
+        entry.campaign = self.campaign
+        self._capcon = None
+        self.position += 1
+        return entry
+
+    def find(self, capcon_id: str) -> Optional[int]:
+        """
+        Returns the index of a run by its CapConID.
+        """
+        return self._index().get(capcon_id)
+
+    def expand(self) -> Iterator[QueuedCapCon]:
+        """
+        Creates all pending runs, without taking them from the template.
+        """
+        for index in range(self.position, self.size):
+            if template_capcon_id(self.template, index) in self.skip:
+                continue
+            entry = QueuedCapCon.from_model(
+                expand_template(self.template, index), source=self.source
+            )
+            entry.lane = self.lane
+            entry.campaign = self.campaign
+            yield entry
+
+
+class PendingRuns:
+    """
+    The pending runs of a campaign inside the queue.
+
+    lanes: The number of runs in each lane.
+    """
+
+    def __init__(self):
+        self.lanes = [0] * len(LANES)
+        self.runs = 0
+        self.runtime = 0.0
+
+    @property
+    def lane(self) -> int:
+        """
+        Index of the first lane holding a run of the campaign.
+        """
+        return next(
+            (index for index, runs in enumerate(self.lanes) if runs), len(LANES)
+        )
+
+    def add(self, lane: QUEUE_LANES, runs: int, duration: float):
+        """
+        Adds (or removes, if negative) runs of a single entry.
+        """
+        self.lanes[LANES.index(lane)] += runs
+        self.runs += runs
+        if self.runs == 0:
+            self.runtime = 0.0
+        elif not math.isinf(duration):
+            self.runtime += runs * duration
+
+
+def pending_of(entry: QueuedCapCon) -> int:
+    return entry.remaining if isinstance(entry, QueuedTemplate) else 1
+
+
+class CapConQueue:
+    """
+    FIFO queue of pending tests with O(1) access to both ends and an index by
+    CapConID. The index is used to keep all CapConIDs inside the queue unique.
+
+    Tests are kept in priority lanes, a lane is only dispatched once all lanes
+    before it are empty. Entries are added to the lane stored in the entry.
+    Each lane is ordered by CapConID, so tests are removed or replaced without
+    searching the lane.
+
+    The pending runs of each campaign are counted on every change, so the
+    campaign scheduler does not walk the queue on each request.
+
+    version: Changes with every change of the queue.
+    """
+
+    def __init__(self):
+        self._lanes: dict[str, OrderedDict[str, QueuedCapCon]] = {
+            lane: OrderedDict() for lane in LANES
+        }
+        self._ids: dict[str, QueuedCapCon] = {}
+        self._templates: dict[str, QueuedTemplate] = {}
+        self._pending: dict[str, PendingRuns] = {}
+        self.version = 0
+
+    def __len__(self) -> int:
+        # the number of pending runs, templates count each of their runs
+        return sum(pending.runs for pending in self._pending.values())
+
+    def __iter__(self) -> Iterator[QueuedCapCon]:
+        return itertools.chain.from_iterable(
+            entries.values() for entries in self._lanes.values()
+        )
+
+    def __contains__(self, capcon_id: str) -> bool:
+        return capcon_id in self._ids
+
+    def get(self, capcon_id: str) -> Optional[QueuedCapCon]:
+        return self._ids.get(capcon_id)
+
+    def lane(self, lane: QUEUE_LANES) -> Iterator[QueuedCapCon]:
+        return iter(self._lanes[lane].values())
+
+    def pending(self) -> dict[str, PendingRuns]:
+        """
+        The pending runs of each campaign with runs inside the queue.
+        """
+        return {
+            campaign: pending
+            for campaign, pending in self._pending.items()
+            if pending.runs > 0
+        }
+
+    def _count(self, entry: QueuedCapCon, runs: int):
+        self.version += 1
+        if runs == 0:
+            return
+        pending = self._pending.setdefault(entry.campaign, PendingRuns())
+        pending.add(entry.lane, runs, duration_of(entry.summary))
+
+    def _register(self, entry: QueuedCapCon):
+        if entry.capcon_id in self._ids:
+            raise ValueError(f"CapConID '{entry.capcon_id}' is not unique.")
+        self._ids[entry.capcon_id] = entry
+        if isinstance(entry, QueuedTemplate):
+            self._templates[entry.capcon_id] = entry
+        self._count(entry, pending_of(entry))
+
+    def _unregister(self, entry: QueuedCapCon):
+        self._ids.pop(entry.capcon_id)
+        self._templates.pop(entry.capcon_id, None)
+        self._count(entry, -pending_of(entry))
+
+    def append(self, entry: QueuedCapCon):
+        self._register(entry)
+        self._lanes[entry.lane][entry.capcon_id] = entry
+
+    def appendleft(self, entry: QueuedCapCon):
+        self._register(entry)
+        entries = self._lanes[entry.lane]
+        entries[entry.capcon_id] = entry
+        entries.move_to_end(entry.capcon_id, last=False)
+
+    def _drop_exhausted(self):
+        for entries in self._lanes.values():
+            while entries:
+                entry = next(iter(entries.values()))
+                if not isinstance(entry, QueuedTemplate) or not entry.exhausted:
+                    break
+                entries.popitem(last=False)
+                self._unregister(entry)
+
+    def _front(self) -> Optional[OrderedDict[str, QueuedCapCon]]:
+        self._drop_exhausted()
+        for entries in self._lanes.values():
+            if entries:
+                return entries
+        return None
+
+    def peek(self) -> Optional[QueuedCapCon]:
+        entries = self._front()
+        if entries is None:
+            return None
+        return next(iter(entries.values()))
+
+    def _take(self, template: QueuedTemplate) -> Optional[QueuedCapCon]:
+        # a template, whose runs can not be created, would block the queue
+        try:
+            run = template.take()
+        except LOAD_ERRORS:
+            self.remove(template.capcon_id)
+            raise
+        if run is not None:
+            self._count(template, -1)
+        return run
+
+    def popleft(self) -> Optional[QueuedCapCon]:
+        """
+        Removes the first test. For a template the next run is returned and
+        the template stays in front of the queue until all runs are taken.
+
+        Raises:
+            OSError, ValueError: The next run of a template can not be
+                created, the template is removed from the queue.
+        """
+        entries = self._front()
+        if entries is None:
+            return None
+
+        capcon_id, entry = next(iter(entries.items()))
+        if isinstance(entry, QueuedTemplate):
+            run = self._take(entry)
+            self._drop_exhausted()
+            return run
+
+        del entries[capcon_id]
+        self._unregister(entry)
+        return entry
+
+    def pop_matching(
+        self,
+        accept: Optional[Callable[[CapConMetadata], bool]] = None,
+        campaign: Optional[str] = None,
+    ) -> Optional[QueuedCapCon]:
+        """
+        Removes the first test of a campaign accepted by the predicate, tests
+        skipped over keep their position. Only the index summary is checked,
+        so tests of other clients are not loaded.
+
+        The queue is walked only up to the first match, usually the head.
+        """
+
+        def matches(entry: QueuedCapCon) -> bool:
+            if campaign is not None and entry.campaign != campaign:
+                return False
+            return accept is None or accept(entry.summary.metadata)
+
+        head = self.peek()
+        if head is None:
+            return None
+        if matches(head):
+            return self.popleft()
+
+        for entries in self._lanes.values():
+            for capcon_id, entry in entries.items():
+                if isinstance(entry, QueuedTemplate) and entry.exhausted:
+                    continue
+                if not matches(entry):
+                    continue
+
+                # the queue is changed, the iteration ends here
+                if isinstance(entry, QueuedTemplate):
+                    run = self._take(entry)
+                    if entry.exhausted:
+                        self.remove(entry.capcon_id)
+                    return run
+
+                del entries[capcon_id]
+                self._unregister(entry)
+                return entry
+        return None
+
+    def move(self, capcon_id: str, lane: QUEUE_LANES, front: bool = False) -> bool:
+        """
+        Moves an entry to the end (or the front) of another lane.
+        """
+        entry = self.remove(capcon_id)
+        if entry is None:
+            return False
+
+        entry.lane = lane
+        if front:
+            self.appendleft(entry)
+        else:
+            self.append(entry)
+        return True
+
+    def templates(self) -> list[QueuedTemplate]:
+        return [e for e in self if isinstance(e, QueuedTemplate)]
+
+    def skip(self, capcon_ids: Iterable[str]):
+        """
+        Removes single tests and runs of templates by their CapConID.
+        """
+        capcon_ids = set(capcon_ids)
+        for capcon_id in capcon_ids:
+            self.remove(capcon_id)
+        if not capcon_ids:
+            return
+
+        for template in list(self._templates.values()):
+            try:
+                skipped = template.skip_runs(capcon_ids)
+            except LOAD_ERRORS as e:
+                logger.error(f"Removing template {template.capcon_id}: {e}")
+                self.remove(template.capcon_id)
+                continue
+            self._count(template, -skipped)
+
+    def expanded(self) -> Iterable[QueuedCapCon]:
+        """
+        Iterates over all pending runs, templates are expanded.
+        """
+        for entry in self:
+            if isinstance(entry, QueuedTemplate):
+                yield from entry.expand()
+            else:
+                yield entry
+
+    def replace(self, entry: QueuedCapCon) -> bool:
+        """
+        Replaces the entry with the same CapConID, keeping its position.
+        """
+        current = self._ids.get(entry.capcon_id)
+        if current is None:
+            return False
+
+        entry.lane = current.lane
+        entry.campaign = current.campaign
+        self._lanes[current.lane][entry.capcon_id] = entry
+        self._unregister(current)
+        self._register(entry)
+        return True
+
+    def remove(self, capcon_id: str) -> Optional[QueuedCapCon]:
+        entry = self._ids.get(capcon_id)
+        if entry is not None:
+            del self._lanes[entry.lane][capcon_id]
+            self._unregister(entry)
+        return entry
+
+    def clear(self):
+        for entries in self._lanes.values():
+            entries.clear()
+        self._ids.clear()
+        self._templates.clear()
+        self._pending.clear()
+        self.version += 1
@@ -1,9 +1,56 @@
+from datetime import datetime, timedelta, UTC
 from pathlib import Path
+import asyncio
+import fcntl
+import glob
+import heapq
 import logging
+import os
+import shutil
+import time
 
-from motra.common import util
-from motra.common.response_types import Status
-from motra.common.schedule import COMMAND
+from motra.common.capcon import derive_capcon, expand_template
+from motra.common.capcon_protocol import CAPCON, CapConTemplate
+from motra.common.scheduler_backend import SchedulerBackend, create_scheduler
+from motra.common.timing import TimingAggregate
+from motra.common.unit_staging import clear_staged_units
+from motra.server.barrier import TriggerBarrier, client_targets
+from motra.server.campaigns import CampaignProgress, load_campaigns
+from motra.server.capcon_queue import (
+    LOAD_ERRORS,
+    QUEUE_LANES,
+    CapConQueue,
+    QueueControl,
+    QueuedCapCon,
+    QueuedTemplate,
+)
+from motra.server.journal import CampaignJournal
+from motra.server.ordering import OrderingReport, classify, optimize_order
+from motra.server.quality import (
+    QualityReport,
+    evaluate_run,
+    read_archive_capcon,
+    retry_attempt,
+    retry_capcon_id,
+)
+from motra.server.queue_backend import (
+    LocalQueueBackend,
+    QueueBackend,
+    SQLiteQueueBackend,
+)
+from motra.server.session import ClientSession
+from motra.server.session_store import (
+    LocalSessionStore,
+    SessionStore,
+    SQLiteSessionStore,
+)
+from motra.server.test_index import (
+    CapConIndex,
+    CapConSummary,
+    summarize_capcon_file,
+)
+from motra.server.testbed_health import HealthReport, evaluate_health
+from motra.workspace.workspace import get_validated_workspace_configuration
 from motra.workspace.workspace_configuration import FileConfiguration
 
 # this would be the module specific logger
@@ -26,13 +73,18 @@ class MotraServerConfig:
         files. Each test inside this directory is parsed by the server on startup
         and loaded into the execution stack.
 
-    pending_tests: This is the list of currently available tests. For the server
-        this will be sent to the client test by test on each request.
+    test_queue: This is the queue of currently available tests. Each entry holds
+        the validated CAPCON, so the server can send it to the client test by
+        test on each request without reading the file again. The queue is
+        shared by all clients, a test is handed to the first client asking.
+
+    sessions: The state of each connected client, keyed by the client id.
 
     """
 
     test_configuration_location: Path
-    test_queue: list
+    test_queue: CapConQueue
+    sessions: dict[str, ClientSession]
 
     def __init__(
         self,
@@ -54,15 +106,105 @@ class MotraServerConfig:
         self.live_workspace = app.configuration.live_workspace
         self.archive_workspace = app.configuration.archive_workspace
         self.test_configuration_location = app.configuration.test_workspace
+        self.test_watch = app.configuration.test_watch
+        self.test_poll_interval = app.configuration.test_poll_interval
+        self.campaign_ordering = app.configuration.campaign_ordering
+        self.max_runs_between_resets = app.configuration.max_runs_between_resets
+        self.reset_policy = app.configuration.reset_policy
+        self.testbed_health = app.configuration.testbed_health
+        self.ordering_report_file = app.entity_storage_root / "ordering_report.json"
+
+        # campaigns share the dispatch by their weight, without configured
+        # campaigns the test workspace is loaded as a single campaign
+        self.campaigns = load_campaigns(
+            app.configuration.campaigns, self.test_configuration_location
+        )
 
         # setup tests
         # this might be extended using a external KV store like redis in the future
-        self.test_queue = list()
+        self.test_queue = CapConQueue()
+        self.test_index = CapConIndex(app.entity_storage_root / "test_index.json")
+        self.test_sources: dict[Path, str] = {}
+        # reset tests held back by the adaptive reset policy, by CapConID
+        self.reset_tests: dict[str, QueuedCapCon] = {}
+
+        # the backend decides which test is dispatched next, the sqlite backend
+        # shares a single campaign between multiple servers or worker processes
+        self.workers = app.configuration.workers
+        queue_backend = app.configuration.queue_backend
+        if self.workers > 1 and queue_backend == "local":
+            main_log.info(f"Using the sqlite queue for {self.workers} workers")
+            queue_backend = "sqlite"
+
+        self.queue_backend: QueueBackend
+        if queue_backend == "sqlite":
+            self.queue_backend = create_sqlite_backend(app)
+        else:
+            self.queue_backend = LocalQueueBackend(self.test_queue)
+        # last change of the shared queue applied to the local queue and the
+        # tests leased by any server, these return when they are released
+        self.queue_version = 0
+        self.leased_tests: set[str] = set()
+
+        # failed runs wait here until their backoff passed, the derived
+        # configurations are stored, so a restart keeps pending retries
+        self.max_retries = app.configuration.max_retries
+        self.retry_backoff = app.configuration.retry_backoff
+        self.retry_workspace = app.entity_storage_root / "retries"
+        self.retries: list[tuple[float, str, CAPCON]] = []
+
+        # runs across several clients, keyed by CapConID
+        self.barriers: dict[str, TriggerBarrier] = {}
+        self.barrier_timeout = app.configuration.barrier_timeout
+        self.trigger_delay = app.configuration.trigger_delay
+
+        # planned and actual start of the payloads of all runs
+        self.timing = TimingAggregate(
+            app.entity_storage_root / "skew_reports.jsonl",
+            app.entity_storage_root / "timing_summary.json",
+        )
 
-        # payload state for the current measurement iteration
-        self.capture_jobs: dict[str, Path] = {}
-        self.schedule_units: list[COMMAND] = list()
-        self.last_capcon: str = ""
+        # progress of the campaign, used to resume after a restart
+        self.journal = CampaignJournal(app.entity_storage_root / "campaign.journal")
+
+        # changes made through the queue api, tests enqueued at runtime are
+        # stored, so they are loaded again after a restart
+        self.enqueued_workspace = app.entity_storage_root / "enqueued"
+        self.queue_control_file = app.entity_storage_root / "queue_control.json"
+        self.queue_control = QueueControl()
+        self._queue_control_mtime = 0
+        if self.queue_control_file.is_file():
+            self.queue_control = QueueControl.model_validate_json(
+                self.queue_control_file.read_text()
+            )
+            self._queue_control_mtime = self.queue_control_file.stat().st_mtime_ns
+        self.dispatch_resumed = asyncio.Event()
+        if not self.queue_control.paused:
+            self.dispatch_resumed.set()
+
+        # payload state for each client, the queue is shared between clients
+        # the state is kept in a database, if the workers share the clients
+        self.sessions: dict[str, ClientSession] = {}
+        self.session_store: SessionStore
+        if self.workers > 1:
+            self.session_store = create_session_store(app)
+        else:
+            self.session_store = LocalSessionStore()
+        self.queue_lock = asyncio.Lock()
+        # changes of the test directories are applied one batch at a time
+        self.test_changes_lock = asyncio.Lock()
+        # held by the worker, that watches the test directories
+        self.primary_lock_file = app.entity_storage_root / "primary.lock"
+        self._primary_lock = None
+
+        # creates the timers of the server side payloads
+        self.scheduler: SchedulerBackend = create_scheduler(
+            app.configuration.scheduler_backend, self.live_workspace
+        )
+        # staged units are only started by systemd
+        self.stage_units = app.configuration.stage_units and self.scheduler.systemd
+        self.resource_profiles = app.configuration.resource_profiles
+        self.motra_profile = app.configuration.motra_profile
 
     @property
     def live_data(self):
@@ -72,22 +214,19 @@ class MotraServerConfig:
     def archive_data(self):
         return self.archive_workspace
 
-    @property
-    def jobs_active(self):
-        return len(self.capture_jobs) != 0
-
-    def add_to_active_jobslist(self, payload_id: str, payload_file: Path):
-        self.capture_jobs.update({payload_id: payload_file})
-
-    def pop_from_active_jobslist(self) -> dict[str, Path] | None:
-        if len(self.capture_jobs) == 0:
-            return None
-        return self.capture_jobs.popitem()
-
-    def clear_active_jobslist(self) -> None:
-        return self.capture_jobs.clear()
+    def get_session(self, client_id: str) -> ClientSession:
+        """
+        Returns the session of a client, a new session is created on the first
+        connection of a client.
+        """
+        session = self.sessions.get(client_id)
+        if session is None:
+            session = ClientSession(client_id, self.live_data, self.archive_data)
+            self.sessions[client_id] = session
+            main_log.info(f"Created session for client {client_id}")
+        return session
 
-    def scan_tests(self) -> list[Path]:
+    def scan_tests(self, workers: int | None = None) -> CapConQueue:
         """
         We collect a set of preconfigured tests to run when the server starts
         the dict containing the tests is updated once the server runs
@@ -95,28 +234,490 @@ class MotraServerConfig:
         final test data
         this way we only store one set of test configurations and can run
         many different tests in succession
+
+        Validated files are recorded in a persistent index, so a restart
+        only validates new or changed files. The models are loaded into the
+        queue ahead of the request, requesting a test is a lookup in memory.
         """
         # scan the configured directory and return a list containing Path and testID
-        self.test_queue = list(self.test_configuration_location.glob("*.json"))
+        test_files = self.test_files()
         main_log.debug(
-            f"Server: Found {len(self.test_queue)} tests to upload to the client ",
-            extra={"data": self.test_queue},
+            f"Server: Found {len(test_files)} tests to upload to the client ",
+            extra={"data": test_files},
         )
 
-        loaded_data = util.load_json_files_into_list(self.test_queue)
-        if loaded_data.status is not Status.SUCCESS:
+        # unchanged files are taken from the index, new files are validated
+        summaries, errors = self.test_index.refresh(test_files, workers=workers)
+        if errors:
+            for test_file, error in errors.items():
+                main_log.error(f"Failed to load test file {test_file}: {error}")
             exit(1)
 
-        uniqueness = util.check_id_uniqueness(
-            loaded_data.payload,
-            "CapConID",
-        )
-        if uniqueness.status is not Status.SUCCESS:
-            exit(1)
+        self.test_queue.clear()
+        self.test_sources.clear()
+        for summary in summaries:
+            try:
+                entry = self.create_entry(summary, Path(summary.path))
+                self.test_queue.append(entry)
+                self.test_sources[entry.source] = entry.capcon_id
+            except ValueError:
+                main_log.error(
+                    f"A non unique key has been found in the test files",
+                    extra={"data": summary.path},
+                )
+                exit(1)
+        self.hold_back_resets()
+
+        # the first test is requested right after startup, load it now
+        self.prefetch()
 
         return self.test_queue
 
-    def get_test_list(self) -> list[Path]:
+    def test_files(self) -> list[Path]:
+        """
+        Lists the test files inside the directories of all campaigns.
+        """
+        return self.campaigns.test_files()
+
+    def create_entry(self, summary: CapConSummary, source: Path) -> QueuedCapCon:
+        """
+        Creates the queue entry for an indexed file. Runs of a template, that
+        were already dispatched according to the journal, are skipped.
+        """
+        if summary.template:
+            entry = QueuedTemplate(summary.CapConID, source=source, summary=summary)
+            progress = self.journal.state.progress
+            if progress:
+                try:
+                    entry.skip_runs(progress)
+                except LOAD_ERRORS as e:
+                    main_log.error(f"Cannot skip dispatched runs of {source}: {e}")
+        else:
+            entry = QueuedCapCon(summary.CapConID, source=source, summary=summary)
+        entry.campaign = self.campaign_for(source)
+        return entry
+
+    def campaign_for(self, source: Path) -> str:
+        """
+        Returns the campaign of a test file. Tests enqueued at runtime are
+        stored in a directory named after their campaign.
+        """
+        campaign = self.campaigns.campaign_for(source)
+        if campaign is None and source.parent.parent == self.enqueued_workspace:
+            campaign = source.parent.name
+        if campaign not in self.campaigns.campaigns:
+            return self.campaigns.default
+        return campaign
+
+    def campaign_of(self, capcon_id: str) -> str:
+        """
+        Returns the campaign of a dispatched test, retries belong to the
+        campaign of the failed run.
+        """
+        campaigns = self.journal.state.campaigns
+        base, _ = retry_attempt(capcon_id)
+        campaign = campaigns.get(capcon_id) or campaigns.get(base)
+        if campaign not in self.campaigns.campaigns:
+            return self.campaigns.default
+        return campaign
+
+    def prefetch(self):
+        """
+        Loads the model of the next pending test into the cache, so it is
+        available in memory once the next request arrives. Tests, that can
+        no longer be loaded, are dropped.
+        """
+        while (entry := self.test_queue.peek()) is not None:
+            try:
+                entry.capcon
+                return
+            except LOAD_ERRORS as e:
+                self.drop_broken(entry, e)
+
+    async def prefetch_async(self):
+        """
+        Like prefetch, the file is read and validated in a worker thread. Used
+        after a test was sent, so requests do not wait for the next file.
+        """
+        while (entry := self.test_queue.peek()) is not None and not entry.loaded:
+            try:
+                await asyncio.to_thread(getattr, entry, "capcon")
+                return
+            except LOAD_ERRORS as e:
+                self.drop_broken(entry, e)
+
+    def drop_broken(self, entry: QueuedCapCon, error: Exception):
+        """
+        Removes a test, whose file was changed or removed after the scan and
+        can no longer be loaded. A fixed file is queued again by the watcher.
+        """
+        if self.test_queue.remove(entry.capcon_id) is not None:
+            main_log.error(f"Dropped test {entry.capcon_id}: {error}")
+
+    async def apply_test_changes(self, changed: set[Path], removed: set[Path]):
+        """
+        Incrementally updates the queue for files that were added, modified or
+        removed inside the test directory while the server is running.
+
+        Tests that were already dispatched according to the journal are not
+        queued again. A changed test, that is still pending, keeps its position
+        inside the queue, also after it was leased and released again.
+        CapConIDs stay unique across the whole queue.
+
+        The files are validated and the campaign is ordered in worker threads,
+        requests for tests wait until the queue is updated.
+        """
+        async with self.test_changes_lock:
+            results = await asyncio.to_thread(
+                self.index_test_changes, changed, removed
+            )
+            async with self.queue_lock:
+                self.queue_test_changes(results, removed)
+                self.hold_back_resets()
+                if self.campaign_ordering == "optimized":
+                    await self.order_campaign_async()
+                self.publish_tests()
+            await self.prefetch_async()
+
+    def index_test_changes(
+        self, changed: set[Path], removed: set[Path]
+    ) -> dict[Path, tuple[CapConSummary | None, str | None]]:
+        """
+        Validates the changed files, the index is written once for all files.
+
+        Returns:
+            The summary or the error message for each changed file.
+        """
+        for test_file in removed:
+            self.test_index.discard(test_file.resolve(), store=False)
+        results = {}
+        for test_file in changed:
+            test_file = test_file.resolve()
+            results[test_file] = self.test_index.update(test_file, store=False)
+        self.test_index.store()
+        return results
+
+    def queue_test_changes(
+        self,
+        results: dict[Path, tuple[CapConSummary | None, str | None]],
+        removed: set[Path],
+    ):
+        self.sync_queue()
+        # tests dispatched by other servers sharing the queue
+        dispatched = self.queue_backend.dispatched(
+            summary.CapConID for summary, _ in results.values() if summary is not None
+        )
+
+        for test_file in removed:
+            test_file = test_file.resolve()
+            capcon_id = self.test_sources.pop(test_file, None)
+            if capcon_id is not None and self.test_queue.remove(capcon_id):
+                main_log.info(f"Withdrawn test {capcon_id}, file was removed")
+            if capcon_id is not None and self.reset_tests.pop(capcon_id, None):
+                main_log.info(f"Withdrawn reset {capcon_id}, file was removed")
+
+        for test_file, (summary, error) in results.items():
+            previous_id = self.test_sources.pop(test_file, None)
+
+            if summary is None:
+                main_log.error(f"Ignoring invalid test file {test_file}: {error}")
+                if previous_id is not None and self.test_queue.remove(previous_id):
+                    main_log.info(f"Withdrawn test {previous_id}, file is invalid")
+                continue
+
+            capcon_id = summary.CapConID
+            entry = self.create_entry(summary, test_file)
+
+            if previous_id is not None and previous_id != capcon_id:
+                self.test_queue.remove(previous_id)
+
+            # a released test was dispatched as well, but is pending again
+            progress = self.journal.state.progress
+            if (capcon_id in progress or capcon_id in dispatched) and (
+                capcon_id not in self.test_queue
+            ):
+                main_log.warning(f"Test {capcon_id} was already dispatched, ignoring")
+                self.test_sources[test_file] = capcon_id
+                continue
+
+            held = self.reset_tests.get(capcon_id)
+            if held is not None and held.source == test_file:
+                # held back again below, if it is still a reset
+                del self.reset_tests[capcon_id]
+
+            current = self.test_queue.get(capcon_id) or self.reset_tests.get(capcon_id)
+            if current is not None and current.source != test_file:
+                main_log.error(
+                    f"A non unique key has been found in the test files",
+                    extra={"data": str(test_file)},
+                )
+                continue
+
+            if current is not None:
+                self.test_queue.replace(entry)
+                main_log.info(f"Updated pending test {capcon_id}")
+            else:
+                self.test_queue.append(entry)
+                main_log.info(f"Queued new test {capcon_id}")
+            self.test_sources[test_file] = capcon_id
+
+    def resume_campaign(self) -> int:
+        """
+        Restores the campaign progress from the journal after a restart. Tests
+        that were executed are removed from the queue, tests that were sent to
+        a client but never executed are moved to the front of the queue.
+        If the last executed test of a client was not archived yet, the server
+        side state is restored, so the archive is created on the next
+        CLIENT_HELLO of that client.
+
+        Returns:
+            The number of tests that were skipped.
+        """
+        state = self.journal.replay()
+
+        self.test_queue.skip(state.completed)
+
+        for capcon_id in reversed(state.interrupted):
+            entry = self.test_queue.remove(capcon_id)
+            if entry is None:
+                entry = self.take_template_run(capcon_id)
+            if entry is not None:
+                self.test_queue.appendleft(entry)
+                main_log.info(f"Requeued interrupted test {capcon_id}")
+
+        for client_id, (capcon_id, jobs) in state.pending_archives.items():
+            session = self.get_session(client_id)
+            session.last_capcon = capcon_id
+            for payload_id in jobs:
+                session.add_to_active_jobslist(
+                    payload_id, session.live_data / f"{payload_id}.json"
+                )
+            main_log.info(
+                f"Restored pending server archive for {capcon_id} ({client_id})"
+            )
+
+        # retries, that were not executed before the restart
+        if self.retry_workspace.is_dir():
+            for retry_file in sorted(self.retry_workspace.glob("*.json")):
+                capcon = CAPCON.model_validate_json(retry_file.read_text())
+                if capcon.CapConID in state.completed:
+                    continue
+                if capcon.CapConID in self.test_queue:
+                    continue
+                heapq.heappush(self.retries, (0.0, capcon.CapConID, capcon))
+
+        # tests enqueued at runtime and their lanes
+        if self.enqueued_workspace.is_dir():
+            for test_file in sorted(self.enqueued_workspace.glob("*/*.json")):
+                _, summary, error = summarize_capcon_file(str(test_file))
+                if summary is None:
+                    main_log.error(f"Ignoring invalid test file {test_file}: {error}")
+                    continue
+                summary = CapConSummary.model_validate(summary)
+                if summary.CapConID in state.completed:
+                    continue
+                if summary.CapConID not in self.test_queue:
+                    self.test_queue.append(self.create_entry(summary, test_file))
+
+        for capcon_id, lane in self.queue_control.lanes.items():
+            entry = self.take_pending(capcon_id)
+            if entry is not None:
+                entry.lane = lane
+                self.test_queue.append(entry)
+
+        self.prefetch()
+        return len(state.completed)
+
+    def order_campaign(self) -> OrderingReport:
+        """
+        Reorders the pending tests to minimize the number of testbed resets,
+        based on the metadata stored in the test index. After a restart of an
+        interrupted campaign the state of the testbed is unknown, so the
+        campaign starts with a reset.
+
+        The report is written next to the index and returned.
+        """
+        resets = self.ordering_resets()
+        ordered, report = self.plan_order(list(self.test_queue), resets)
+        self.apply_order(ordered, report)
+        self.prefetch()
+        return report
+
+    async def order_campaign_async(self) -> OrderingReport:
+        """
+        Like order_campaign, the order is computed in a worker thread. If the
+        queue changed meanwhile, e.g. a test was cancelled, the order is
+        computed again, the last attempt runs inside the event loop.
+        """
+        for _ in range(3):
+            version = self.test_queue.version
+            ordered, report = await asyncio.to_thread(
+                self.plan_order, list(self.test_queue), self.ordering_resets()
+            )
+            if self.test_queue.version == version:
+                self.apply_order(ordered, report)
+                return report
+        return self.order_campaign()
+
+    def ordering_resets(self) -> list[QueuedCapCon]:
+        # held back resets still separate the segments of the ordering
+        if self.reset_policy == "adaptive":
+            return self.unused_resets()
+        return []
+
+    def plan_order(
+        self, entries: list[QueuedCapCon], resets: list[QueuedCapCon]
+    ) -> tuple[list[QueuedCapCon], OrderingReport]:
+        # the order is computed for single runs, templates are expanded
+        runs = []
+        for entry in entries:
+            if isinstance(entry, QueuedTemplate):
+                runs.extend(entry.expand())
+            else:
+                runs.append(entry)
+        runs.extend(resets)
+        resumed = len(self.journal.state.progress) != 0
+        return optimize_order(
+            runs,
+            max_runs_between_resets=self.max_runs_between_resets,
+            initial_reset=resumed,
+        )
+
+    def apply_order(self, ordered: list[QueuedCapCon], report: OrderingReport):
+        self.test_queue.clear()
+        for entry in ordered:
+            self.test_queue.append(entry)
+
+        for capcon_id in report.unresolved:
+            main_log.warning(f"Ordering constraints of {capcon_id} can not be met")
+        main_log.info(
+            f"Campaign ordering: {report.original_resets} -> "
+            f"{report.planned_resets} reset(s), saved {report.saved_time:.0f}s "
+            f"of {report.original_duration:.0f}s"
+        )
+        self.ordering_report_file.write_text(report.model_dump_json(indent=2))
+
+    def hold_back_resets(self):
+        """
+        With the adaptive reset policy, tests tagged "reset" are removed from
+        the queue. A copy is dispatched once the health checks of a run fail.
+        Tests, that only contain config payloads, but are not tagged, run in
+        the order of the campaign.
+        """
+        if self.reset_policy != "adaptive":
+            return
+        for entry in list(self.test_queue):
+            if isinstance(entry, QueuedTemplate):
+                continue
+            if "reset" not in entry.summary.metadata.tags:
+                continue
+            self.test_queue.remove(entry.capcon_id)
+            if entry.capcon_id not in self.reset_tests:
+                main_log.info(
+                    f"Holding back reset {entry.capcon_id}, it runs once the "
+                    "testbed is reported unhealthy"
+                )
+            self.reset_tests[entry.capcon_id] = entry
+
+    def unused_resets(self) -> list[QueuedCapCon]:
+        """
+        The held back resets, that were not dispatched yet. Once all of them
+        were dispatched, a single copy is returned.
+        """
+        progress = self.journal.state.progress
+        unused = [
+            entry
+            for capcon_id, entry in self.reset_tests.items()
+            if capcon_id not in progress
+        ]
+        if not unused and self.reset_tests:
+            copy = self.derive_reset(next(iter(self.reset_tests.values())).campaign)
+            if copy is not None:
+                unused.append(copy)
+        return unused
+
+    def derive_reset(self, campaign: str) -> QueuedCapCon | None:
+        """
+        Copies a held back reset test, preferably one of the campaign, using a
+        CapConID that was not used before.
+        """
+        if not self.reset_tests:
+            return None
+        resets = list(self.reset_tests.values())
+        reset = next((e for e in resets if e.campaign == campaign), resets[0])
+
+        used = set(self.journal.state.progress) | set(self.reset_tests)
+        used |= {retry_id for _, retry_id, _ in self.retries}
+        count = 1
+        while (capcon_id := f"{reset.capcon_id}_{count:03}") in used or (
+            capcon_id in self.test_queue
+        ):
+            count += 1
+
+        entry = QueuedCapCon.from_model(derive_capcon(reset.capcon, capcon_id))
+        entry.campaign = reset.campaign
+        return entry
+
+    def inject_reset(self, capcon_id: str) -> str | None:
+        """
+        Moves a copy of a reset test to the front of the queue, after the run
+        capcon_id reported an unhealthy testbed. No copy is added, if the next
+        test is a reset already.
+
+        Returns:
+            The CapConID of the injected reset.
+        """
+        pending = self.test_queue.peek()
+        if pending is not None and classify(pending.summary) == "reset":
+            main_log.info(f"Testbed reset {pending.capcon_id} is already next")
+            return None
+
+        entry = self.derive_reset(self.campaign_of(capcon_id))
+        if entry is None:
+            main_log.error(
+                f"Run {capcon_id} reported an unhealthy testbed, but the "
+                "campaign has no reset test"
+            )
+            return None
+
+        entry.lane = "urgent"
+        self.test_queue.appendleft(entry)
+        if self.queue_backend.shared:
+            self.queue_backend.publish([entry])
+        self.prefetch()
+        main_log.info(f"Injected testbed reset {entry.capcon_id} after {capcon_id}")
+        return entry.capcon_id
+
+    def check_testbed(self, capcon_id: str, report: HealthReport) -> HealthReport:
+        """
+        Handles the testbed state reported by the logs payloads of a run. With
+        the adaptive reset policy, a failed check injects a reset before the
+        next run.
+        """
+        if report.healthy:
+            return report
+
+        for failure in report.failures:
+            main_log.warning(f"Testbed after {capcon_id}: {failure}")
+        if self.reset_policy == "adaptive":
+            report.reset = self.inject_reset(capcon_id)
+        return report
+
+    def take_template_run(self, capcon_id: str) -> QueuedCapCon | None:
+        """
+        Removes a single run from the template that creates it.
+        """
+        for template in self.test_queue.templates():
+            index = template.find(capcon_id)
+            if index is not None:
+                self.test_queue.skip([capcon_id])
+                capcon = expand_template(template.template, index)
+                entry = QueuedCapCon.from_model(capcon, source=template.source)
+                entry.campaign = template.campaign
+                return entry
+        return None
+
+    def get_test_list(self) -> CapConQueue:
         """
         Returns the current set of unscheduled tests from the server. This list
         holds the references to all tests, that were found during the initialization
@@ -124,24 +725,657 @@ class MotraServerConfig:
         """
         return self.test_queue
 
-    def get_pending_test(self) -> Path | None:
+    def get_pending_test(self) -> CAPCON | None:
         """
         Returns the next test, that is on the first position of the queue, without
         poping from the list.
         """
-        if len(self.test_queue) == 0:
+        self.prefetch()
+        entry = self.test_queue.peek()
+        if entry is None:
             return None
 
-        return self.test_queue[0]
+        return entry.capcon
+
+    def pop_test(self) -> CAPCON | None:
+        """
+        Removes the first test from the queue. Similar to deque.popleft().
+        """
+        while True:
+            try:
+                entry = self.test_queue.popleft()
+                if entry is None:
+                    return None
+                return entry.capcon
+            except LOAD_ERRORS as e:
+                main_log.error(f"Dropped a test, that can no longer be loaded: {e}")
+
+    def publish_tests(self):
+        """
+        Makes the pending tests of the local queue available to the backend.
+        """
+        self.queue_backend.publish(self.test_queue.expanded())
+
+    async def lease_test(self, session: ClientSession) -> CAPCON | None:
+        """
+        Hands the next test to a client. The test is leased from the backend
+        before it is sent, so no other client (or server) receives the same
+        test.
+
+        A test targeting several clients is handed to each of them. The first
+        targeted client leases the test, the others join the run with their
+        next request. Clients, that are not targeted, continue with the next
+        test in the queue.
+
+        Tests requiring capabilities the client did not report are skipped
+        and stay in the queue for other clients.
+
+        While dispatch is paused, the request is held until dispatch resumes.
+        Clients joining a run across several clients are not held.
+        """
+        session.barrier, session.leader = None, True
+        self.reload_queue_control()
+        if not self.dispatch_resumed.is_set():
+            capcon = self.join_barrier(session)
+            if capcon is not None:
+                return capcon
+            main_log.info(f"Dispatch is paused, holding the request of {session.name}")
+            while not self.dispatch_resumed.is_set():
+                # other workers change the flag through the shared file
+                try:
+                    await asyncio.wait_for(self.dispatch_resumed.wait(), 5)
+                except TimeoutError:
+                    self.reload_queue_control()
+
+        async with self.queue_lock:
+            capcon = self.join_barrier(session)
+            if capcon is not None:
+                return capcon
+
+            # the campaigns are ordered by the runs pending on all workers
+            self.sync_queue()
+
+            self.release_due_retries()
+            while True:
+                capcon, campaign = self.lease_next(session)
+                if capcon is not None and self.queue_backend.shared:
+                    # the test might have been published by this server as well
+                    self.test_queue.skip([capcon.CapConID])
+                    self.leased_tests.add(capcon.CapConID)
+                if capcon is None:
+                    break
+
+                targets = client_targets(capcon)
+                if len(targets) < 2:
+                    break
 
-    def pop_test(self) -> Path | None:
+                barrier = TriggerBarrier(capcon, targets)
+                self.barriers[capcon.CapConID] = barrier
+                if barrier.waiting_for(session.entity_id):
+                    session.barrier = barrier
+                    session.leader = barrier.join(session.entity_id)
+                    break
+                main_log.info(
+                    f"Holding {capcon.CapConID} for {', '.join(sorted(targets))}"
+                )
+
+            if capcon is not None:
+                self.journal.record(
+                    "dispatched",
+                    capcon.CapConID,
+                    client=session.client_id,
+                    campaign=campaign,
+                )
+            elif len(self.test_queue) > 0:
+                main_log.warning(
+                    f"None of the {len(self.test_queue)} pending tests matches "
+                    f"the capabilities of {session.name}"
+                )
+            return capcon
+
+    def lease_next(self, session: ClientSession) -> tuple[CAPCON | None, str]:
         """
-        Removes the first test from the list. Similar to list.pop(0).
+        Leases the next test for a client from the campaign, that is next in
+        line according to the campaign scheduler.
+
+        Returns:
+            The test and the name of its campaign.
         """
-        if len(self.test_queue) == 0:
+        # clients without reported capabilities accept every test, the
+        # local queue then pops its head
+        accepts = session.accepts if session.capabilities is not None else None
+
+        if len(self.campaigns.campaigns) == 1:
+            capcon = self.queue_backend.lease(session.client_id, accepts)
+            campaign = self.campaigns.default
+        else:
+            capcon, campaign = None, self.campaigns.default
+            for name in self.campaigns.order(self.test_queue.pending()):
+                capcon = self.queue_backend.lease(
+                    session.client_id, accepts, campaign=name
+                )
+                if capcon is not None:
+                    campaign = name
+                    break
+
+            # tests published by other servers are not in the local queue
+            if capcon is None and self.queue_backend.shared:
+                capcon = self.queue_backend.lease(session.client_id, accepts)
+                if capcon is not None:
+                    campaign = self.campaign_of(capcon.CapConID)
+
+        if capcon is not None:
+            self.campaigns.charge(campaign, capcon)
+        return capcon, campaign
+
+    def sync_queue(self):
+        """
+        Applies the changes of other workers and servers sharing the campaign:
+        the records they wrote to the journal and the tests they leased,
+        completed, released or cancelled through the shared queue. Leased
+        tests are removed from the local queue and return to its front, once
+        they are released.
+        """
+        self.journal.refresh()
+        if not self.queue_backend.shared:
+            return
+
+        changes, self.queue_version = self.queue_backend.changes(self.queue_version)
+        settled, released = [], []
+        for capcon_id, state, campaign, capcon in changes:
+            if state == "leased":
+                self.leased_tests.add(capcon_id)
+                settled.append(capcon_id)
+            elif state != "pending":
+                self.leased_tests.discard(capcon_id)
+                settled.append(capcon_id)
+            elif capcon_id in self.leased_tests:
+                self.leased_tests.discard(capcon_id)
+                if capcon_id not in self.test_queue:
+                    entry = QueuedCapCon.from_model(capcon)
+                    entry.campaign = campaign or self.campaign_of(capcon_id)
+                    released.append(entry)
+
+        if settled:
+            self.test_queue.skip(settled)
+        for entry in reversed(released):
+            self.test_queue.appendleft(entry)
+
+    def campaign_progress(self) -> list[CampaignProgress]:
+        self.sync_queue()
+        state = self.journal.state
+        return self.campaigns.progress(
+            self.test_queue.pending(),
+            completed=state.campaign_counts(("executed", "archived", "rejected")),
+            cancelled=state.campaign_counts(("cancelled",)),
+        )
+
+    def join_barrier(self, session: ClientSession) -> CAPCON | None:
+        """
+        Adds the client to a run across several clients, that is waiting for
+        it.
+        """
+        for barrier in self.barriers.values():
+            if barrier.waiting_for(session.entity_id):
+                session.barrier = barrier
+                session.leader = barrier.join(session.entity_id)
+                self.journal.record(
+                    "dispatched", barrier.capcon_id, client=session.client_id
+                )
+                return barrier.capcon
+        return None
+
+    async def await_trigger(self, session: ClientSession) -> datetime | None:
+        """
+        Waits for all clients of a synchronized run.
+
+        Returns:
+            The start instant of the run, trigger_delay seconds in the future.
+            All payloads on the clients and the server start at this instant
+            plus their offset. None, if the leader of the run disconnected.
+        """
+        barrier = session.barrier
+        if barrier is None:
+            return datetime.now(UTC) + timedelta(seconds=self.trigger_delay)
+
+        trigger = await barrier.arrive(
+            session.entity_id, self.barrier_timeout, self.trigger_delay
+        )
+        self.barriers.pop(barrier.capcon_id, None)
+        return trigger
+
+    def release_test(self, capcon_id: str):
+        """
+        Returns a test to the queue, that was leased by a client which
+        disconnected before acknowledging it. In a run across several clients
+        the other clients are released from the barrier without running it.
+        """
+        barrier = self.barriers.pop(capcon_id, None)
+        if barrier is not None:
+            logger.warning(f"Cancelling the synchronized run of {capcon_id}")
+            barrier.cancel()
+        self.queue_backend.release(capcon_id)
+        self.prefetch()
+
+    async def evaluate_upload(
+        self, session: ClientSession, file_name: str
+    ) -> list[QualityReport]:
+        """
+        Runs the quality gate, once both archives of a run are available. The
+        client archive is named after the CapConID, the server archive uses
+        the _server suffix. Failed runs are requeued with a new CapConID until
+        max_retries is reached. The testbed health reported by the run decides
+        on a reset before the next run.
+
+        In a run across several clients, the server archive is written by the
+        session of the leader. Archives of the other clients, that were
+        uploaded before it, are checked once it is available.
+
+        The archives are read in a thread, the queue is changed on the event
+        loop.
+        """
+        capcon_id = Path(file_name).stem
+        server_archive = await asyncio.to_thread(
+            self.find_server_archive, session, capcon_id
+        )
+        if server_archive is None:
+            return []
+
+        reports = []
+        client_archives = await asyncio.to_thread(self.unchecked_archives, capcon_id)
+        for client_archive in client_archives:
+            report = await self.evaluate_run(session, server_archive, client_archive)
+            reports.append(report)
+        return reports
+
+    def find_server_archive(
+        self, session: ClientSession, capcon_id: str
+    ) -> Path | None:
+        name = f"{capcon_id}_server.zip"
+        if (session.archive_data / name).is_file():
+            return session.archive_data / name
+        # the run was led by another session
+        return next(self.archive_data.glob(f"*/{glob.escape(name)}"), None)
+
+    def unchecked_archives(self, capcon_id: str) -> list[Path]:
+        """
+        The client archives of a run in all sessions, that have no quality
+        report yet.
+        """
+        return [
+            archive
+            for archive in self.archive_data.glob(f"*/{glob.escape(capcon_id)}.zip")
+            if not archive.with_suffix(".quality.json").is_file()
+        ]
+
+    def check_run(
+        self, server_archive: Path, client_archive: Path
+    ) -> tuple[QualityReport, HealthReport]:
+        """
+        Reads the archives of a run, blocking.
+        """
+        self.timing.add_archives(client_archive, server_archive)
+        report = evaluate_run(server_archive, client_archive)
+        health = evaluate_health(
+            server_archive,
+            client_archive,
+            self.testbed_health.containers,
+            self.testbed_health.error_markers,
+            clean_exit=self.testbed_health.allow_clean_exit,
+        )
+        return report, health
+
+    async def evaluate_run(
+        self, session: ClientSession, server_archive: Path, client_archive: Path
+    ) -> QualityReport:
+        capcon_id = client_archive.stem
+        report, health = await asyncio.to_thread(
+            self.check_run, server_archive, client_archive
+        )
+
+        if report.passed:
+            main_log.info(f"Run {capcon_id} passed the quality gate")
+        else:
+            for failure in report.failures:
+                main_log.warning(f"Run {capcon_id} failed: {failure}")
+            retry = await asyncio.to_thread(
+                self.derive_retry, server_archive, capcon_id
+            )
+            if retry is not None:
+                # a failed gate leaves the testbed broken, the reset is
+                # repeated before any other run
+                report.retry = self.schedule_retry(
+                    retry, immediate=report.testbed_failed
+                )
+            self.journal.record(
+                "rejected", capcon_id, client=session.client_id, retry=report.retry
+            )
+
+        # the next run of the client is requested after the upload
+        health = self.check_testbed(capcon_id, health)
+
+        await asyncio.to_thread(
+            client_archive.with_suffix(".quality.json").write_text,
+            report.model_dump_json(indent=2),
+        )
+        await asyncio.to_thread(
+            client_archive.with_suffix(".health.json").write_text,
+            health.model_dump_json(indent=2),
+        )
+        return report
+
+    def derive_retry(self, server_archive: Path, capcon_id: str) -> CAPCON | None:
+        """
+        Derives a new run from a failed one and stores it in the retry
+        workspace, blocking.
+        """
+        base, attempt = retry_attempt(capcon_id)
+        if attempt >= self.max_retries:
+            main_log.error(f"Run {base} failed {attempt + 1} time(s), giving up")
+            return None
+
+        capcon = read_archive_capcon(server_archive)
+        if capcon is None:
             return None
 
-        return self.test_queue.pop(0)
+        retry = derive_capcon(capcon, retry_capcon_id(capcon_id))
+        retry.timestamp_utc = ""
+
+        self.retry_workspace.mkdir(exist_ok=True)
+        (self.retry_workspace / f"{retry.CapConID}.json").write_text(
+            retry.model_dump_json()
+        )
+        return retry
+
+    def schedule_retry(self, retry: CAPCON, immediate: bool = False) -> str:
+        """
+        Queues a retry again after retry_backoff seconds, doubled for every
+        further retry, or right away if immediate is set. Each client of a
+        run across several clients reports the failure, the retry is queued
+        once.
+        """
+        base, attempt = retry_attempt(retry.CapConID)
+        if any(retry_id == retry.CapConID for _, retry_id, _ in self.retries) or (
+            retry.CapConID in self.test_queue
+        ):
+            return retry.CapConID
+
+        delay = 0.0 if immediate else self.retry_backoff * 2 ** (attempt - 1)
+        heapq.heappush(self.retries, (time.monotonic() + delay, retry.CapConID, retry))
+        main_log.info(f"Requeued {base} as {retry.CapConID} in {delay:.0f}s")
+        return retry.CapConID
+
+    def release_due_retries(self):
+        """
+        Moves retries, whose backoff passed, to the front of the queue.
+        """
+        now = time.monotonic()
+        due = []
+        while self.retries and self.retries[0][0] <= now:
+            _, _, capcon = heapq.heappop(self.retries)
+            entry = QueuedCapCon.from_model(capcon)
+            entry.campaign = self.campaign_of(capcon.CapConID)
+            due.append(entry)
+
+        for entry in reversed(due):
+            if entry.capcon_id not in self.test_queue:
+                self.test_queue.appendleft(entry)
+        if due and self.queue_backend.shared:
+            self.queue_backend.publish(due)
+
+    def complete_test(self, capcon_id: str):
+        """
+        Marks a leased test as executed, after the client acknowledged it.
+        """
+        self.queue_backend.complete(capcon_id)
+
+    def take_pending(self, capcon_id: str) -> QueuedCapCon | None:
+        """
+        Removes a pending test from the queue. The test can be a template, a
+        single run of a template or a retry waiting for its backoff.
+        """
+        entry = self.test_queue.remove(capcon_id)
+        if entry is None:
+            entry = self.take_template_run(capcon_id)
+        if entry is None:
+            for index, (_, retry_id, capcon) in enumerate(self.retries):
+                if retry_id == capcon_id:
+                    self.retries.pop(index)
+                    heapq.heapify(self.retries)
+                    entry = QueuedCapCon.from_model(capcon)
+                    entry.campaign = self.campaign_of(capcon_id)
+                    break
+        return entry
+
+    def enqueue_test(
+        self,
+        test: CAPCON | CapConTemplate,
+        lane: QUEUE_LANES = "normal",
+        front: bool = False,
+        campaign: str | None = None,
+    ) -> QueuedCapCon:
+        """
+        Adds a test or a template while the server is running. The test is
+        stored and validated like a file inside the test directory, so it is
+        loaded again after a restart.
+
+        Raises:
+            ValueError: The CapConID is already used, the campaign is unknown
+                or the test is invalid.
+        """
+        capcon_id = test.CapConID if isinstance(test, CAPCON) else test.TemplateID
+        self.sync_queue()
+        if (
+            capcon_id in self.test_queue
+            or capcon_id in self.journal.state.progress
+            or self.queue_backend.dispatched([capcon_id])
+        ):
+            raise ValueError(f"CapConID '{capcon_id}' is already used.")
+
+        campaign = campaign or self.campaigns.default
+        if campaign not in self.campaigns.campaigns:
+            raise ValueError(f"Unknown campaign '{campaign}'.")
+
+        directory = self.enqueued_workspace / campaign
+        directory.mkdir(parents=True, exist_ok=True)
+        test_file = directory / f"{capcon_id}.json"
+        test_file.write_text(test.model_dump_json(indent=2))
+        _, summary, error = summarize_capcon_file(str(test_file))
+        if summary is None:
+            test_file.unlink()
+            raise ValueError(error)
+
+        entry = self.create_entry(CapConSummary.model_validate(summary), test_file)
+        entry.lane = lane
+        if front:
+            self.test_queue.appendleft(entry)
+        else:
+            self.test_queue.append(entry)
+        self.set_lane(capcon_id, lane)
+        main_log.info(f"Enqueued {capcon_id} in lane {lane} of campaign {campaign}")
+
+        self.publish_tests()
+        self.prefetch()
+        return entry
+
+    def cancel_test(self, capcon_id: str) -> list[str]:
+        """
+        Withdraws a pending test. Cancelling a template withdraws all of its
+        remaining runs, tests already sent to a client are not affected.
+
+        Returns:
+            The CapConIDs of the withdrawn runs, empty if the test is not
+            pending.
+        """
+        entry = self.take_pending(capcon_id)
+        if entry is None:
+            return []
+
+        if isinstance(entry, QueuedTemplate):
+            cancelled = [run.capcon_id for run in entry.expand()]
+        else:
+            cancelled = [capcon_id]
+        self.journal.record("cancelled", capcon_id, campaign=entry.campaign)
+        self.queue_backend.cancel(cancelled)
+        self.set_lane(capcon_id, "normal")
+        main_log.info(f"Cancelled {capcon_id} ({len(cancelled)} run(s))")
+
+        self.prefetch()
+        return cancelled
+
+    def prioritize_test(
+        self, capcon_id: str, lane: QUEUE_LANES, front: bool = False
+    ) -> bool:
+        """
+        Moves a pending test to the end (or the front) of a lane. A single run
+        of a template is taken from the template, a retry is released without
+        waiting for its backoff.
+
+        Returns:
+            False, if the test is not pending.
+        """
+        entry = self.take_pending(capcon_id)
+        if entry is None:
+            return False
+
+        entry.lane = lane
+        if front:
+            self.test_queue.appendleft(entry)
+        else:
+            self.test_queue.append(entry)
+        self.set_lane(capcon_id, lane)
+        main_log.info(f"Moved {capcon_id} to lane {lane}")
+
+        self.publish_tests()
+        self.prefetch()
+        return True
+
+    def set_lane(self, capcon_id: str, lane: QUEUE_LANES):
+        if lane == "normal":
+            self.queue_control.lanes.pop(capcon_id, None)
+        else:
+            self.queue_control.lanes[capcon_id] = lane
+        self.save_queue_control()
+
+    def pause_dispatch(self):
+        """
+        Holds all further test requests, runs already started continue.
+        """
+        self.queue_control.paused = True
+        self.dispatch_resumed.clear()
+        self.save_queue_control()
+        main_log.info("Dispatch paused")
+
+    def resume_dispatch(self):
+        self.queue_control.paused = False
+        self.dispatch_resumed.set()
+        self.save_queue_control()
+        main_log.info("Dispatch resumed")
+
+    def save_queue_control(self):
+        temp_file = self.queue_control_file.with_suffix(f".{os.getpid()}.tmp")
+        temp_file.write_text(self.queue_control.model_dump_json(indent=2))
+        temp_file.replace(self.queue_control_file)
+        self._queue_control_mtime = self.queue_control_file.stat().st_mtime_ns
+
+    def reload_queue_control(self):
+        """
+        Picks up changes to the queue control made by other worker processes.
+        """
+        if self.workers == 1 or not self.queue_control_file.is_file():
+            return
+        mtime = self.queue_control_file.stat().st_mtime_ns
+        if mtime == self._queue_control_mtime:
+            return
+
+        self._queue_control_mtime = mtime
+        self.queue_control = QueueControl.model_validate_json(
+            self.queue_control_file.read_text()
+        )
+        if self.queue_control.paused:
+            self.dispatch_resumed.clear()
+        else:
+            self.dispatch_resumed.set()
+
+    def reset_queue_control(self):
+        """
+        Forgets the changes made at runtime, used when starting a new campaign.
+        """
+        self.queue_control = QueueControl()
+        self.queue_control_file.unlink(missing_ok=True)
+        shutil.rmtree(self.enqueued_workspace, ignore_errors=True)
+        self.dispatch_resumed.set()
+
+    def claim_primary(self) -> bool:
+        """
+        Decides, whether this process watches the test directories. With
+        several workers, the first worker to lock the primary lock file keeps
+        it until it exits, a restarted worker takes over.
+        """
+        if self.workers == 1:
+            return True
+        if self._primary_lock is None:
+            self._primary_lock = open(self.primary_lock_file, "w")
+        try:
+            fcntl.flock(self._primary_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def close(self):
+        self.journal.close()
+        self.queue_backend.close()
+        self.session_store.close()
+        self.scheduler.close()
+        if self._primary_lock is not None:
+            self._primary_lock.close()
+            self._primary_lock = None
+
+
+def create_sqlite_backend(app: FileConfiguration) -> SQLiteQueueBackend:
+    database = app.configuration.queue_database
+    if database is None:
+        database = app.entity_storage_root / "queue.sqlite"
+    return SQLiteQueueBackend(
+        database,
+        server_id=f"{app.entity_id}/{os.getpid()}",
+        lease_timeout=app.configuration.queue_lease_timeout,
+        # a database on a shared filesystem can not use the WAL
+        wal=app.configuration.queue_database is None,
+    )
+
+
+def create_session_store(app: FileConfiguration) -> SQLiteSessionStore:
+    return SQLiteSessionStore(
+        app.entity_storage_root / "sessions.sqlite",
+        timeout=app.configuration.queue_lease_timeout,
+    )
+
+
+def prepare_workers(app: FileConfiguration, resume: bool):
+    """
+    Runs the steps of the server command, that are shared by all worker
+    processes, before uvicorn starts them: starting a new campaign, removing
+    units staged by an earlier server and indexing the tests once, so all
+    workers start from the index.
+    """
+    if not resume:
+        main_log.info("Starting a new campaign, removing the existing journal.")
+        CampaignJournal(app.entity_storage_root / "campaign.journal").reset()
+        for store in (create_sqlite_backend(app), create_session_store(app)):
+            store.reset()
+            store.close()
+        (app.entity_storage_root / "queue_control.json").unlink(missing_ok=True)
+        shutil.rmtree(app.entity_storage_root / "enqueued", ignore_errors=True)
+
+    if app.configuration.stage_units:
+        clear_staged_units("motra-server-mexec")
+
+    campaigns = load_campaigns(
+        app.configuration.campaigns, app.configuration.test_workspace
+    )
+    test_index = CapConIndex(app.entity_storage_root / "test_index.json")
+    test_index.refresh(campaigns.test_files())
 
 
 # Create a single instance that will be shared
@@ -155,10 +1389,32 @@ def get_server_config() -> MotraServerConfig:
     """Dependency to provide the application configuration."""
     global _server_instance
     if _server_instance is None:
-        _server_instance = MotraServerConfig()
+        _server_instance = load_server_config()
     return _server_instance
 
 
+# set by the server command, worker processes load the configuration and the
+# log level from it
+SERVER_WORKSPACE_ENV = "MOTRA_SERVER_WORKSPACE"
+SERVER_LOGLEVEL_ENV = "MOTRA_SERVER_LOGLEVEL"
+
+
+def load_server_config() -> MotraServerConfig:
+    """
+    Creates the configuration inside a worker process of uvicorn. The workers
+    import the application on their own, the configuration of the server
+    command is not inherited.
+    """
+    workspace = os.environ.get(SERVER_WORKSPACE_ENV)
+    if workspace is None:
+        raise RuntimeError(f"{SERVER_WORKSPACE_ENV} is not set.")
+
+    app = get_validated_workspace_configuration(Path(workspace), "server")
+    if app is None:
+        raise RuntimeError(f"No server configuration found in {workspace}.")
+    return MotraServerConfig(app)
+
+
 # This can be used to create non default configurations
 def set_server_config(config) -> MotraServerConfig:
     """
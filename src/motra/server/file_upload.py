@@ -1,16 +1,23 @@
 import base64
+import hashlib
 import logging
 from pathlib import Path
+from typing import Optional
+from motra.common import util
 from motra.common.capcon_protocol import REQUEST_UPLOAD
 
 
 logger = logging.getLogger(__name__)
 
 
-def handle_file_payload(request: REQUEST_UPLOAD, workspace: Path):
+def handle_file_payload(request: REQUEST_UPLOAD, workspace: Path) -> Optional[str]:
     """
     Stores a received file to disk. Uses the encoding provided by the request
     to decode a file into a bytestream and writes the raw file to disk.
+
+    Returns:
+        The hash of the stored archive, if it matches the hash sent by the
+        client. None, if the archive could not be stored or verified.
     """
 
     try:
@@ -18,27 +25,38 @@ def handle_file_payload(request: REQUEST_UPLOAD, workspace: Path):
         filename = request.file_name
         base64_str = request.payload
 
-        # TODO add hash handling
-        # received_file_hash = request["file_hash"]
-        # hash_type = request["hash_type"]
-
         logger.info(f"Receiving file: {filename}")
 
         file_path = workspace / f"{filename}"
         file_path = file_path.resolve()
 
-        # TODO what happens, if files are existing
+        if request.hash_type != "sha256":
+            raise RuntimeError(f"Unsupported hash type '{request.hash_type}'.")
+
+        # a retransmission of an archive we already stored is fine, as long as
+        # the contents are identical. The client can then release the archive.
         if file_path.exists():
+            if util.create_sha256(file_path) == request.file_hash:
+                logger.info(f"Archive {filename} was already stored, skipping.")
+                return request.file_hash
             raise RuntimeError("Capture archive already exists.")
 
         file_bytes = base64.b64decode(base64_str)
+        received_hash = hashlib.sha256(file_bytes).hexdigest()
+        if received_hash != request.file_hash:
+            raise RuntimeError(
+                f"Hash mismatch, expected {request.file_hash} got {received_hash}."
+            )
+
         with open(file_path, "wb") as f:
             f.write(file_bytes)
 
         logger.info(f"Successfully saved file to: {file_path}")
+        return received_hash
 
     except base64.binascii.Error as e:
         logger.error(f"Base64 decoding error for {filename}: {e}")
     except Exception as e:
         logger.error(f"An error occurred while saving {filename}: {e}")
-        # TODO missing return statement!
+
+    return None
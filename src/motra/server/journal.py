@@ -0,0 +1,233 @@
+import fcntl
+import json
+import logging
+import os
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Literal, Optional
+
+logger = logging.getLogger(__name__)
+
+
+JOURNAL_EVENTS = Literal[
+    "dispatched", "executed", "archived", "rejected", "cancelled"
+]
+
+# journals written before client sessions used this id for every client
+LEGACY_CLIENT_ID = "00:00:00:00:00:00"
+
+
+class JournalState:
+    """
+    The campaign state reconstructed from the journal.
+
+    progress: The latest event for each CapConID, in the order of dispatch.
+
+    pending_archives: The last executed test of each client, that was not yet
+        archived by the server together with the ids of its server side
+        payloads.
+
+    campaigns: The campaign of each test, recorded with dispatch.
+    """
+
+    def __init__(self):
+        self.progress: dict[str, JOURNAL_EVENTS] = {}
+        self.pending_archives: dict[str, tuple[str, list[str]]] = {}
+        self.campaigns: dict[str, str] = {}
+
+    def apply(
+        self,
+        event: JOURNAL_EVENTS,
+        capcon_id: str,
+        jobs: list[str],
+        client: str = LEGACY_CLIENT_ID,
+        campaign: Optional[str] = None,
+    ):
+        # keep the order of dispatch for requeuing interrupted tests
+        self.progress.pop(capcon_id, None)
+        self.progress[capcon_id] = event
+        if campaign is not None:
+            self.campaigns[capcon_id] = campaign
+
+        if event == "executed":
+            self.pending_archives[client] = (capcon_id, jobs)
+        elif event == "archived" and client in self.pending_archives:
+            if self.pending_archives[client][0] == capcon_id:
+                del self.pending_archives[client]
+
+    @property
+    def completed(self) -> set[str]:
+        """Tests that were executed or cancelled, these are not run again."""
+        return {
+            capcon_id
+            for capcon_id, event in self.progress.items()
+            if event in ("executed", "archived", "rejected", "cancelled")
+        }
+
+    def campaign_counts(self, events: tuple[str, ...]) -> dict[str, int]:
+        """
+        Counts the tests of each campaign, whose latest event is listed.
+        """
+        counts: dict[str, int] = {}
+        for capcon_id, campaign in self.campaigns.items():
+            if self.progress.get(capcon_id) in events:
+                counts[campaign] = counts.get(campaign, 0) + 1
+        return counts
+
+    @property
+    def interrupted(self) -> list[str]:
+        """Tests that were sent to a client, but never executed."""
+        return [
+            capcon_id
+            for capcon_id, event in self.progress.items()
+            if event == "dispatched"
+        ]
+
+
+class CampaignJournal:
+    """
+    Append only journal for the progress of the current campaign. Every state
+    change of a test is written as a single JSON line, so a crashed server can
+    continue with the remaining tests after a restart.
+
+    The file is kept open in append mode, each record is a single write
+    followed by fdatasync. This skips the metadata update of a full fsync.
+    Worker processes of the same server share the file, a record is written
+    while holding an exclusive lock on it. The records of the other workers
+    are applied to the state before each write and on refresh().
+
+    journal_file: Location of the journal on disk.
+    """
+
+    journal_file: Path
+
+    def __init__(self, journal_file: Path):
+        self.journal_file = journal_file
+        self.state = JournalState()
+        self._stream = None
+        self._terminate = False
+        # bytes of the file applied to the state
+        self._offset = 0
+
+    def _open(self):
+        if self._stream is None:
+            self._stream = open(self.journal_file, "a", encoding="utf-8")
+            self._terminate = True
+        return self._stream
+
+    def _terminate_line(self, stream):
+        # terminate a line left over from a crash, so the next record is not
+        # appended to the broken one, checked once the file is locked
+        if not self._terminate:
+            return
+        self._terminate = False
+        if os.fstat(stream.fileno()).st_size == 0:
+            return
+        with open(self.journal_file, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                stream.write("\n")
+
+    def record(self, event: JOURNAL_EVENTS, capcon_id: str, **data):
+        """
+        Appends a single event to the journal and flushes it to disk.
+        """
+        if capcon_id == "":
+            return
+
+        entry = {
+            "event": event,
+            "CapConID": capcon_id,
+            "timestamp_utc": str(datetime.now(UTC)),
+        }
+        entry.update(data)
+
+        stream = self._open()
+        fcntl.flock(stream.fileno(), fcntl.LOCK_EX)
+        try:
+            self._read_records()
+            self._terminate_line(stream)
+            stream.write(json.dumps(entry) + "\n")
+            stream.flush()
+            os.fdatasync(stream.fileno())
+            self._offset = os.fstat(stream.fileno()).st_size
+        finally:
+            fcntl.flock(stream.fileno(), fcntl.LOCK_UN)
+        logger.debug(f"Journal: {event} {capcon_id}")
+
+        self._apply(entry)
+
+    def _apply(self, entry: dict):
+        self.state.apply(
+            entry["event"],
+            entry["CapConID"],
+            entry.get("jobs", []),
+            entry.get("client", LEGACY_CLIENT_ID),
+            entry.get("campaign"),
+        )
+
+    def _read_records(self) -> list[str]:
+        """
+        Applies the complete lines written after the last read. A partially
+        written last line (crash while writing) is ignored.
+
+        Returns:
+            The CapConIDs of the applied records.
+        """
+        try:
+            with open(self.journal_file, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        end = data.rfind(b"\n") + 1
+        applied = []
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Journal: skipping broken line {line[:80]!r}")
+                continue
+            self._apply(entry)
+            applied.append(entry["CapConID"])
+        self._offset += end
+        return applied
+
+    def refresh(self) -> list[str]:
+        """
+        Applies the records written by other workers since the last read.
+
+        Returns:
+            The CapConIDs of the applied records.
+        """
+        try:
+            if self.journal_file.stat().st_size <= self._offset:
+                return []
+        except FileNotFoundError:
+            return []
+        return self._read_records()
+
+    def replay(self) -> JournalState:
+        """
+        Reads the journal and reconstructs the campaign progress.
+        A partially written last line (crash while writing) is ignored.
+        """
+        self.state = JournalState()
+        self._offset = 0
+        self._read_records()
+        return self.state
+
+    def reset(self):
+        """
+        Starts a new campaign by removing the existing journal.
+        """
+        self.close()
+        self.journal_file.unlink(missing_ok=True)
+        self.state = JournalState()
+        self._offset = 0
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
@@ -1,19 +1,46 @@
 import logging
+import os
 from contextlib import asynccontextmanager
+from pathlib import Path
 from fastapi import FastAPI
 
 # we may want to check the server side configuration of the measurement folders
-from motra.server.configuration import get_server_config
+from motra.common.resources import apply_own_profile
+from motra.common.unit_staging import clear_staged_units
+from motra.logging.server_config import (
+    server_defaultConsoleLogger,
+    server_defaultFileLogger,
+)
+from motra.server.configuration import (
+    SERVER_LOGLEVEL_ENV,
+    SERVER_WORKSPACE_ENV,
+    get_server_config,
+)
+from motra.server.test_watcher import TestDirectoryWatcher
 
 logger = logging.getLogger(__name__)
 
 
+def configure_worker_logging():
+    """
+    The worker processes of uvicorn import the application on their own, the
+    loggers of the server command only exist in the parent process.
+    """
+    workspace = os.environ.get(SERVER_WORKSPACE_ENV)
+    if workspace is None:
+        return
+    server_defaultConsoleLogger(os.environ.get(SERVER_LOGLEVEL_ENV, "Info"))
+    # processes can not share a rotating log, the workers append to it
+    server_defaultFileLogger("debug", Path(workspace) / "server.log", rotate=False)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Manages the application's startup and shutdown events.
     """
     # --- Code to run ON STARTUP ---
+    configure_worker_logging()
     config = get_server_config()
     logger.info("Motra Server Startup: Initializing testing infrastructure...")
     logger.info(
@@ -22,6 +49,56 @@ async def lifespan(app: FastAPI):
     tests = config.scan_tests()
     logger.info(f"Found {len(tests)} test(s) in the configured directory.")
 
+    # continue an interrupted campaign, if the journal has any progress
+    skipped = config.resume_campaign()
+    if skipped:
+        logger.info(
+            f"Resuming campaign: skipped {skipped} completed test(s), "
+            f"{len(tests)} test(s) remaining."
+        )
+
+    # archiving and the quality gate run inside the server process
+    apply_own_profile(config.motra_profile)
+
+    # units staged for runs, that were never started, several workers share
+    # the units, the server command removes them before starting the workers
+    if config.stage_units and config.workers == 1:
+        clear_staged_units("motra-server-mexec")
+
+    if config.workers > 1:
+        logger.info(
+            f"Worker {os.getpid()} started, runs across several clients need "
+            "all of their clients on the same worker"
+        )
+
+    if config.campaign_ordering == "optimized":
+        config.order_campaign()
+    config.publish_tests()
+
+    for progress in config.campaign_progress():
+        logger.info(
+            f"Campaign {progress.campaign} (weight {progress.weight}): "
+            f"{progress.pending} run(s) pending, {progress.completed} completed"
+        )
+
+    # new or changed tests are added to the queue without a restart, a single
+    # worker watches the directories and publishes the changes to the others
+    watchers = []
+    primary = config.claim_primary()
+    if config.workers > 1 and primary:
+        logger.info(f"Worker {os.getpid()} watches the test directories")
+    for campaign in config.campaigns.campaigns.values():
+        if not primary or not campaign.directory.is_dir():
+            continue
+        watcher = TestDirectoryWatcher(
+            Path(campaign.directory),
+            on_change=config.apply_test_changes,
+            mode=config.test_watch,
+            poll_interval=config.test_poll_interval,
+        )
+        watcher.start()
+        watchers.append(watcher)
+
     # this is suspended until fastAPI stops
     yield
 
@@ -29,6 +106,8 @@ async def lifespan(app: FastAPI):
     # This code will execute after the server receives a shutdown signal (e.g., Ctrl+C)
     logger.info("Motra Server Shutdown: Cleaning up resources...")
 
-    # tbd
+    for watcher in watchers:
+        watcher.stop()
+    config.close()
 
     logger.info("--- Server has shut down. ---")
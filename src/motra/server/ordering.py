@@ -0,0 +1,252 @@
+import heapq
+import logging
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from motra.common.capcon import derive_capcon
+from motra.server.capcon_queue import QueuedCapCon, duration_of
+from motra.server.test_index import CapConSummary
+
+logger = logging.getLogger(__name__)
+
+
+CAPCON_KIND = Literal["reset", "destructive", "normal"]
+
+
+class OrderingReport(BaseModel):
+    """
+    Summary of a campaign ordering, all times are in seconds.
+    """
+
+    tests: int = Field(description="Number of tests without resets")
+    original_resets: int
+    planned_resets: int
+    dropped_resets: list[str] = Field(default_factory=list)
+    derived_resets: list[str] = Field(default_factory=list)
+    unresolved: list[str] = Field(
+        description="Tests with cyclic or unsatisfiable ordering constraints",
+        default_factory=list,
+    )
+    original_duration: float
+    planned_duration: float
+    saved_time: float
+    idle_time: float = Field(
+        description="Time between the last payload ending and the next run"
+    )
+
+
+def classify(summary: CapConSummary) -> CAPCON_KIND:
+    """
+    Determines the role of a test inside a campaign. Tests that only contain
+    config and gate payloads are treated as testbed resets, unless tagged
+    otherwise.
+    """
+    tags = summary.metadata.tags
+    if "reset" in tags:
+        return "reset"
+    if "destructive" in tags:
+        return "destructive"
+    if summary.payload_types and all(
+        payload_type in ("config", "gate") for payload_type in summary.payload_types
+    ):
+        return "reset"
+    return "normal"
+
+
+def campaign_duration(entries: list[QueuedCapCon]) -> float:
+    return sum(duration_of(entry.summary) for entry in entries)
+
+
+def plan_segments(
+    tests: list[QueuedCapCon],
+    max_runs_between_resets: Optional[int] = None,
+    initial_reset: bool = False,
+) -> tuple[list[Optional[QueuedCapCon]], list[str]]:
+    """
+    Orders tests into segments, that are separated by a testbed reset. A reset
+    is represented by None inside the returned plan.
+
+    Each segment starts on a fresh testbed, so a test that requires a reset is
+    placed first. A destructive test is always the last run of a segment and
+    all remaining slots are filled with regular tests. This keeps the number
+    of segments at the lower bound given by the number of destructive tests,
+    tests requiring a reset and the maximum number of runs between resets.
+    Ordering constraints (metadata.after) are respected, constraints that can
+    not be satisfied are reported and the affected tests keep their position.
+
+    Returns:
+        The plan and the list of CapConIDs with unsatisfiable constraints.
+    """
+    known_ids = {test.capcon_id for test in tests}
+    unresolved: list[str] = list()
+
+    # tests are referenced by their position, a heap holds the ready tests of
+    # a kind, so the first ready test keeps the original order
+    requires_reset: list[int] = []
+    regular: list[int] = []
+    destructive: list[int] = []
+    kinds: list[list[int]] = []
+    for test in tests:
+        if test.summary.metadata.requires_reset:
+            kinds.append(requires_reset)
+        elif classify(test.summary) == "destructive":
+            kinds.append(destructive)
+        else:
+            kinds.append(regular)
+
+    # number of constraints not met yet and the tests waiting for a test
+    missing: list[int] = []
+    waiting: dict[str, list[int]] = {}
+    for position, test in enumerate(tests):
+        after = {d for d in test.summary.metadata.after if d in known_ids}
+        missing.append(len(after))
+        for dependency in after:
+            waiting.setdefault(dependency, []).append(position)
+        if not after:
+            # positions are increasing, the lists stay valid heaps
+            kinds[position].append(position)
+
+    placed = [False] * len(tests)
+    left = len(tests)
+    first_left = 0
+
+    def first(heap: list[int]) -> Optional[int]:
+        while heap and placed[heap[0]]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def place(position: int):
+        placed[position] = True
+        for waiter in waiting.pop(tests[position].capcon_id, []):
+            missing[waiter] -= 1
+            if missing[waiter] == 0 and not placed[waiter]:
+                heapq.heappush(kinds[waiter], waiter)
+
+    plan: list[Optional[QueuedCapCon]] = list()
+    if initial_reset:
+        plan.append(None)
+
+    runs = 0
+    fresh = True
+    while left:
+        first_reset = first(requires_reset)
+        first_regular = first(regular)
+        first_destructive = first(destructive)
+        if first_reset is None and first_regular is None and first_destructive is None:
+            # cyclic constraints, fall back to the original order
+            while placed[first_left]:
+                first_left += 1
+            if not unresolved or unresolved[-1] != tests[first_left].capcon_id:
+                unresolved.append(tests[first_left].capcon_id)
+            kind = kinds[first_left]
+            first_reset = first_left if kind is requires_reset else None
+            first_regular = first_left if kind is regular else None
+            first_destructive = first_left if kind is destructive else None
+
+        pick = None
+        if fresh:
+            pick = first_reset
+
+        if pick is None:
+            slots = None
+            if max_runs_between_resets is not None:
+                slots = max_runs_between_resets - runs
+
+            # keep the last slot of a segment for a destructive test
+            if first_regular is not None and (
+                first_destructive is None or slots is None or slots > 1
+            ):
+                pick = first_regular
+            elif first_destructive is not None:
+                pick = first_destructive
+
+        if pick is None:
+            # only tests requiring a fresh testbed are left
+            plan.append(None)
+            runs, fresh = 0, True
+            continue
+
+        test = tests[pick]
+        plan.append(test)
+        place(pick)
+        left -= 1
+        runs, fresh = runs + 1, False
+
+        segment_full = (
+            max_runs_between_resets is not None and runs >= max_runs_between_resets
+        )
+        if left and (classify(test.summary) == "destructive" or segment_full):
+            plan.append(None)
+            runs, fresh = 0, True
+
+    return plan, unresolved
+
+
+def optimize_order(
+    entries: list[QueuedCapCon],
+    max_runs_between_resets: Optional[int] = None,
+    initial_reset: bool = False,
+) -> tuple[list[QueuedCapCon], OrderingReport]:
+    """
+    Computes an order for a campaign, that needs the least number of testbed
+    resets. The reset tests found in the campaign are reused in their original
+    order, surplus resets are dropped. If more resets are needed, the last
+    reset is copied using a derived CapConID.
+
+    Returns:
+        The new order and a report about the saved time.
+    """
+    resets = [entry for entry in entries if classify(entry.summary) == "reset"]
+    tests = [entry for entry in entries if classify(entry.summary) != "reset"]
+
+    plan, unresolved = plan_segments(tests, max_runs_between_resets, initial_reset)
+    needed = plan.count(None)
+
+    known_ids = {entry.capcon_id for entry in entries}
+    derived: list[str] = list()
+    if needed > len(resets) and resets:
+        template = resets[-1]
+        count = 1
+        while len(resets) < needed:
+            capcon_id = f"{template.capcon_id}_{count:03}"
+            count += 1
+            if capcon_id in known_ids:
+                continue
+            capcon = derive_capcon(template.capcon, capcon_id)
+            resets.append(QueuedCapCon.from_model(capcon))
+            derived.append(capcon_id)
+
+    if needed > len(resets):
+        logger.warning(
+            f"Campaign needs {needed} reset(s), but no reset test was found. "
+            "Keeping the original order."
+        )
+        ordered = list(entries)
+        dropped: list[str] = list()
+    else:
+        reset_pool = iter(resets)
+        ordered = [entry if entry is not None else next(reset_pool) for entry in plan]
+        dropped = [entry.capcon_id for entry in reset_pool]
+
+    original = campaign_duration(entries)
+    planned = campaign_duration(ordered)
+    idle = sum(
+        max(0.0, duration_of(entry.summary) - entry.summary.runtime)
+        for entry in ordered
+        if entry.summary.runtime is not None
+    )
+
+    report = OrderingReport(
+        tests=len(tests),
+        original_resets=len([e for e in entries if classify(e.summary) == "reset"]),
+        planned_resets=len([e for e in ordered if classify(e.summary) == "reset"]),
+        dropped_resets=dropped,
+        derived_resets=derived,
+        unresolved=unresolved,
+        original_duration=original,
+        planned_duration=planned,
+        saved_time=original - planned,
+        idle_time=idle,
+    )
+    return ordered, report
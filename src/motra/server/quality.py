@@ -0,0 +1,154 @@
+import fnmatch
+import logging
+import re
+import zipfile
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from motra.common.capcon_protocol import CAPCON, GenericPayload, PayloadExpectation
+
+logger = logging.getLogger(__name__)
+
+
+# systemd logs the reason, if a unit did not exit cleanly
+UNIT_RESULT = re.compile(r"Failed with result '([\w-]+)'")
+RETRY_SUFFIX = re.compile(r"^(?P<base>.+)_retry(?P<attempt>\d+)$")
+
+
+class QualityReport(BaseModel):
+    """
+    Result of the quality gate for a single run.
+    """
+
+    CapConID: str
+    passed: bool
+    failures: list[str] = Field(default_factory=list)
+    retry: Optional[str] = Field(
+        description="CapConID of the requeued run, None if not requeued",
+        default=None,
+    )
+    testbed_failed: bool = Field(
+        description="A gate payload failed, the testbed is not ready",
+        default=False,
+    )
+    timestamp_utc: str = Field(default_factory=lambda: str(datetime.now(UTC)))
+
+
+def retry_attempt(capcon_id: str) -> tuple[str, int]:
+    """
+    Splits a CapConID into the original id and the number of the retry.
+    """
+    match = RETRY_SUFFIX.match(capcon_id)
+    if match is None:
+        return capcon_id, 0
+    return match.group("base"), int(match.group("attempt"))
+
+
+def retry_capcon_id(capcon_id: str) -> str:
+    base, attempt = retry_attempt(capcon_id)
+    return f"{base}_retry{attempt + 1}"
+
+
+def read_archive_capcon(archive: Path) -> Optional[CAPCON]:
+    """
+    Loads the capture configuration stored inside a run archive.
+    """
+    try:
+        with zipfile.ZipFile(archive, "r") as zf:
+            return CAPCON.model_validate_json(zf.read("capcon.json"))
+    except (OSError, KeyError, zipfile.BadZipFile, ValidationError) as e:
+        logger.error(f"Cannot read capcon.json from {archive}: {e}")
+        return None
+
+
+def check_payload(payload: GenericPayload, zf: zipfile.ZipFile) -> list[str]:
+    """
+    Checks the files and the unit log of a payload inside a run archive.
+
+    Returns:
+        A message for each failed check.
+    """
+    # gate payloads are always checked for the result of their unit
+    expect = payload.expect or PayloadExpectation()
+    pid = payload.payload_id
+    failures = []
+
+    # the unit log is created from the journal before archiving
+    try:
+        log = zf.read(f"{pid}.log").decode(errors="replace")
+        for result in UNIT_RESULT.findall(log):
+            if result == "timeout" and expect.allow_timeout:
+                continue
+            failures.append(f"{pid}: unit failed with result '{result}'")
+    except KeyError:
+        failures.append(f"{pid}: no unit log in archive")
+
+    members = {info.filename: info for info in zf.infolist() if not info.is_dir()}
+    for pattern in expect.files:
+        matches = fnmatch.filter(members.keys(), pattern)
+        if not matches:
+            failures.append(f"{pid}: no file matches '{pattern}'")
+            continue
+
+        for name in matches:
+            info = members[name]
+            if info.file_size < expect.min_bytes:
+                failures.append(
+                    f"{pid}: {name} has {info.file_size} bytes, "
+                    f"expected at least {expect.min_bytes}"
+                )
+            elif expect.min_lines is not None:
+                with zf.open(info) as f:
+                    lines = sum(1 for line in f if line.strip())
+                if lines < expect.min_lines:
+                    failures.append(
+                        f"{pid}: {name} has {lines} lines, "
+                        f"expected at least {expect.min_lines}"
+                    )
+
+    return failures
+
+
+def evaluate_run(server_archive: Path, client_archive: Path) -> QualityReport:
+    """
+    Evaluates a completed run against the expectations of its payloads.
+    Server payloads are checked in the server archive, all others in the
+    archive uploaded by the client.
+    """
+    capcon = read_archive_capcon(server_archive)
+    if capcon is None:
+        capcon = read_archive_capcon(client_archive)
+    if capcon is None:
+        return QualityReport(
+            CapConID=client_archive.stem,
+            passed=False,
+            failures=["capcon.json is missing in both archives"],
+        )
+
+    failures = []
+    testbed_failed = False
+    for payload in capcon.payload or []:
+        if payload.expect is None and payload.payload_type != "gate":
+            continue
+
+        archive = server_archive if "server" in payload.target else client_archive
+        try:
+            with zipfile.ZipFile(archive, "r") as zf:
+                payload_failures = check_payload(payload, zf)
+        except (OSError, zipfile.BadZipFile) as e:
+            payload_failures = [
+                f"{payload.payload_id}: cannot open {archive.name}: {e}"
+            ]
+        failures.extend(payload_failures)
+        if payload_failures and payload.payload_type == "gate":
+            testbed_failed = True
+
+    return QualityReport(
+        CapConID=capcon.CapConID,
+        passed=len(failures) == 0,
+        failures=failures,
+        testbed_failed=testbed_failed,
+    )
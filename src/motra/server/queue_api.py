@@ -0,0 +1,171 @@
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel, Field
+
+from motra.common.capcon_protocol import CAPCON, CapConTemplate
+from motra.server.campaigns import CampaignProgress
+from motra.server.capcon_queue import (
+    LANES,
+    QUEUE_LANES,
+    QueuedCapCon,
+    QueuedTemplate,
+)
+from motra.server.configuration import MotraServerConfig, get_server_config
+
+logger = logging.getLogger(__name__)
+
+# all handlers are coroutines, so they run inside the event loop together with
+# the websocket handlers and never change the queue while a test is leased
+router = APIRouter(prefix="/queue", tags=["queue"])
+
+
+class QueueEntryStatus(BaseModel):
+    CapConID: str
+    lane: QUEUE_LANES
+    campaign: str
+    template: bool = False
+    runs: int = Field(description="Number of pending runs, 1 for single tests")
+    source: Optional[str] = None
+
+
+class QueueStatus(BaseModel):
+    paused: bool
+    pending: int = Field(description="Number of pending runs in all lanes")
+    lanes: dict[str, list[QueueEntryStatus]]
+    retries: list[str] = Field(
+        description="Requeued runs waiting for their backoff",
+        default_factory=list,
+    )
+    synchronized: list[str] = Field(
+        description="Runs waiting for all of their clients",
+        default_factory=list,
+    )
+
+
+class PlacementRequest(BaseModel):
+    lane: QUEUE_LANES = "normal"
+    front: bool = Field(
+        description="Insert at the front of the lane instead of the end",
+        default=False,
+    )
+
+
+class CancelResponse(BaseModel):
+    CapConID: str
+    cancelled: list[str]
+
+
+def entry_status(entry: QueuedCapCon) -> QueueEntryStatus:
+    template = isinstance(entry, QueuedTemplate)
+    return QueueEntryStatus(
+        CapConID=entry.capcon_id,
+        lane=entry.lane,
+        campaign=entry.campaign,
+        template=template,
+        runs=entry.remaining if template else 1,
+        source=None if entry.source is None else str(entry.source),
+    )
+
+
+@router.get("", response_model=QueueStatus)
+async def queue_status(config: MotraServerConfig = Depends(get_server_config)):
+    config.sync_queue()
+    queue = config.test_queue
+    return QueueStatus(
+        paused=not config.dispatch_resumed.is_set(),
+        pending=len(queue),
+        lanes={lane: [entry_status(e) for e in queue.lane(lane)] for lane in LANES},
+        retries=sorted(capcon_id for _, capcon_id, _ in config.retries),
+        synchronized=sorted(config.barriers.keys()),
+    )
+
+
+@router.get("/campaigns", response_model=list[CampaignProgress])
+async def campaign_progress(config: MotraServerConfig = Depends(get_server_config)):
+    return config.campaign_progress()
+
+
+def enqueue(
+    config: MotraServerConfig,
+    test: CAPCON | CapConTemplate,
+    lane: QUEUE_LANES,
+    front: bool,
+    campaign: Optional[str],
+) -> QueueEntryStatus:
+    try:
+        entry = config.enqueue_test(test, lane=lane, front=front, campaign=campaign)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return entry_status(entry)
+
+
+@router.post(
+    "/capcons",
+    response_model=QueueEntryStatus,
+    status_code=status.HTTP_201_CREATED,
+)
+async def enqueue_capcon(
+    capcon: CAPCON,
+    lane: QUEUE_LANES = "normal",
+    front: bool = False,
+    campaign: Optional[str] = None,
+    config: MotraServerConfig = Depends(get_server_config),
+):
+    return enqueue(config, capcon, lane, front, campaign)
+
+
+@router.post(
+    "/templates",
+    response_model=QueueEntryStatus,
+    status_code=status.HTTP_201_CREATED,
+)
+async def enqueue_template(
+    template: CapConTemplate,
+    lane: QUEUE_LANES = "normal",
+    front: bool = False,
+    campaign: Optional[str] = None,
+    config: MotraServerConfig = Depends(get_server_config),
+):
+    return enqueue(config, template, lane, front, campaign)
+
+
+@router.delete("/{capcon_id}", response_model=CancelResponse)
+async def cancel(
+    capcon_id: str,
+    config: MotraServerConfig = Depends(get_server_config),
+):
+    cancelled = config.cancel_test(capcon_id)
+    if not cancelled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{capcon_id} is not pending",
+        )
+    return CancelResponse(CapConID=capcon_id, cancelled=cancelled)
+
+
+@router.put("/{capcon_id}/lane", response_model=QueueEntryStatus)
+async def prioritize(
+    capcon_id: str,
+    placement: PlacementRequest,
+    config: MotraServerConfig = Depends(get_server_config),
+):
+    if not config.prioritize_test(capcon_id, placement.lane, placement.front):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{capcon_id} is not pending",
+        )
+    return entry_status(config.test_queue.get(capcon_id))
+
+
+@router.post("/pause", response_model=QueueStatus)
+async def pause(config: MotraServerConfig = Depends(get_server_config)):
+    config.pause_dispatch()
+    return await queue_status(config)
+
+
+@router.post("/resume", response_model=QueueStatus)
+async def resume(config: MotraServerConfig = Depends(get_server_config)):
+    config.resume_dispatch()
+    return await queue_status(config)
@@ -0,0 +1,390 @@
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from motra.common.capcon_protocol import CAPCON, CapConMetadata
+from motra.server.capcon_queue import LOAD_ERRORS, CapConQueue, QueuedCapCon
+
+logger = logging.getLogger(__name__)
+
+# decides if a test can be handed to the requesting client
+Accept = Callable[[CapConMetadata], bool]
+
+# number of a state change, statements run inside a write lock
+NEXT_CHANGE = "(SELECT COALESCE(MAX(changed), 0) + 1 FROM tests)"
+
+
+class QueueBackend(ABC):
+    """
+    Source of the tests handed out to clients. The local queue of a server is
+    always filled from the test directory, a backend decides which of these
+    tests is dispatched next.
+
+    Tests are leased to a client on REQUEST_CAPCON and completed once the
+    client acknowledged the run. A lease, that is not completed in time, is
+    handed out again.
+
+    shared: True, if other servers dispatch tests from the same campaign.
+    """
+
+    shared: bool = False
+
+    @abstractmethod
+    def publish(self, entries: Iterable[QueuedCapCon]):
+        """
+        Makes the pending tests of the local queue available, templates are
+        passed as single runs.
+        """
+
+    @abstractmethod
+    def lease(
+        self,
+        owner: str,
+        accept: Optional[Accept] = None,
+        campaign: Optional[str] = None,
+    ) -> Optional[CAPCON]:
+        """
+        Hands the next pending test to the owner, None if all are done. Tests
+        rejected by `accept` stay in the queue for other clients. If a
+        campaign is given, only tests of this campaign are considered.
+        """
+
+    @abstractmethod
+    def complete(self, capcon_id: str):
+        """Marks a leased test as executed."""
+
+    @abstractmethod
+    def release(self, capcon_id: str):
+        """Returns a leased test to the queue, e.g. after a failed dispatch."""
+
+    def cancel(self, capcon_ids: Iterable[str]):
+        """
+        Withdraws pending tests. The local queue is the source of the local
+        backend, removing the entries from the queue is sufficient.
+        """
+
+    def changes(self, since: int) -> tuple[list[tuple], int]:
+        """
+        The tests leased, completed, released or cancelled by any server or
+        worker after the change `since`, to update the local queue.
+
+        Returns:
+            (capcon_id, state, campaign, capcon) for each changed test, the
+            capcon only for tests that are pending again, and the last change.
+        """
+        return [], since
+
+    def dispatched(self, capcon_ids: Iterable[str]) -> set[str]:
+        """
+        The tests out of capcon_ids, that were leased, completed or cancelled
+        by any server or worker. The journal of the local backend knows them.
+        """
+        return set()
+
+    def reset(self):
+        """Forgets the progress of the campaign."""
+
+    def close(self):
+        pass
+
+
+class LocalQueueBackend(QueueBackend):
+    """
+    Dispatches the tests of the local queue in order, used when a single
+    server runs the campaign.
+    """
+
+    def __init__(self, queue: CapConQueue):
+        self.queue = queue
+        self._leased: dict[str, QueuedCapCon] = {}
+
+    def publish(self, entries: Iterable[QueuedCapCon]):
+        # the local queue is the source of truth
+        pass
+
+    def lease(
+        self,
+        owner: str,
+        accept: Optional[Accept] = None,
+        campaign: Optional[str] = None,
+    ) -> Optional[CAPCON]:
+        while True:
+            try:
+                if accept is None and campaign is None:
+                    entry = self.queue.popleft()
+                else:
+                    entry = self.queue.pop_matching(accept, campaign)
+                if entry is None:
+                    return None
+                capcon = entry.capcon
+            except LOAD_ERRORS as e:
+                # the entry is gone from the queue, continue with the next one
+                logger.error(f"Dropped a test, that can no longer be loaded: {e}")
+                continue
+            self._leased[entry.capcon_id] = entry
+            return capcon
+
+    def complete(self, capcon_id: str):
+        self._leased.pop(capcon_id, None)
+
+    def release(self, capcon_id: str):
+        entry = self._leased.pop(capcon_id, None)
+        if entry is not None and capcon_id not in self.queue:
+            self.queue.appendleft(entry)
+
+
+class SQLiteQueueBackend(QueueBackend):
+    """
+    A queue shared by multiple servers through a SQLite database. Every server
+    publishes the tests of its test directory, a CapConID is only stored once,
+    so servers sharing a campaign folder do not duplicate tests. The models are
+    stored with the test, a server can dispatch tests it has not loaded.
+
+    Leasing uses BEGIN IMMEDIATE, which takes the write lock of the database
+    before reading, so two servers never lease the same test. Leases of
+    servers that stopped (or clients that never acknowledged) expire after
+    `lease_timeout` seconds and the test is handed out again.
+
+    Every change of the state of a test is numbered, so a server applies the
+    leases of the others to its local queue without reading all tests.
+
+    database: Location of the database, needs to be on a local filesystem or a
+        network filesystem with working POSIX locks.
+
+    server_id: Stored as owner of a lease, for debugging.
+
+    wal: Use the write-ahead log of SQLite, readers do not block the writer.
+        Only possible, if all servers run on the same host.
+    """
+
+    database: Path
+    server_id: str
+    shared = True
+
+    def __init__(
+        self,
+        database: Path,
+        server_id: str,
+        lease_timeout: float = 300,
+        wal: bool = False,
+    ):
+        self.database = database
+        self.server_id = server_id
+        self.lease_timeout = lease_timeout
+
+        self._connection = sqlite3.connect(
+            database, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        if wal:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tests (
+                capcon_id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expiry REAL,
+                sha256 TEXT NOT NULL DEFAULT '',
+                capcon TEXT NOT NULL,
+                metadata TEXT NOT NULL DEFAULT '{}',
+                campaign TEXT NOT NULL DEFAULT '',
+                changed INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        # databases created before tests had requirements, campaigns and
+        # numbered changes
+        for column in (
+            "metadata TEXT NOT NULL DEFAULT '{}'",
+            "campaign TEXT NOT NULL DEFAULT ''",
+            "changed INTEGER NOT NULL DEFAULT 0",
+        ):
+            try:
+                self._connection.execute(f"ALTER TABLE tests ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS pending ON tests (state, position)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS pending_campaign "
+            "ON tests (state, campaign, position)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS changes ON tests (changed)"
+        )
+
+    def publish(self, entries: Iterable[QueuedCapCon]):
+        cursor = self._connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            known = {
+                row[0]: (row[1], row[2])
+                for row in cursor.execute("SELECT capcon_id, state, sha256 FROM tests")
+            }
+            for position, entry in enumerate(entries):
+                sha256 = entry.summary.sha256
+                metadata = entry.summary.metadata.model_dump_json()
+                state, stored = known.get(entry.capcon_id, (None, None))
+                changed = state == "pending" and (stored != sha256 or not sha256)
+                if state is None or changed:
+                    try:
+                        capcon = entry.capcon.model_dump_json()
+                    except LOAD_ERRORS as e:
+                        logger.error(f"Not publishing {entry.capcon_id}: {e}")
+                        continue
+                if state is None:
+                    cursor.execute(
+                        "INSERT INTO tests "
+                        "(capcon_id, position, sha256, capcon, metadata, campaign) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            entry.capcon_id,
+                            position,
+                            sha256,
+                            capcon,
+                            metadata,
+                            entry.campaign,
+                        ),
+                    )
+                elif changed:
+                    # a test not yet started follows changes of its file
+                    cursor.execute(
+                        "UPDATE tests SET position = ?, sha256 = ?, capcon = ?, "
+                        "metadata = ?, campaign = ? WHERE capcon_id = ?",
+                        (
+                            position,
+                            sha256,
+                            capcon,
+                            metadata,
+                            entry.campaign,
+                            entry.capcon_id,
+                        ),
+                    )
+                elif state == "pending":
+                    # keep the order of the local queue for tests not yet started
+                    cursor.execute(
+                        "UPDATE tests SET position = ? WHERE capcon_id = ?",
+                        (position, entry.capcon_id),
+                    )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def lease(
+        self,
+        owner: str,
+        accept: Optional[Accept] = None,
+        campaign: Optional[str] = None,
+    ) -> Optional[CAPCON]:
+        now = time.time()
+        cursor = self._connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            expired = cursor.execute(
+                "UPDATE tests SET state = 'pending', owner = NULL, "
+                f"lease_expiry = NULL, changed = {NEXT_CHANGE} "
+                "WHERE state = 'leased' AND lease_expiry < ?",
+                (now,),
+            ).rowcount
+            if expired:
+                logger.warning(f"Re-leasing {expired} abandoned test(s)")
+
+            if campaign is None:
+                candidates = cursor.execute(
+                    "SELECT capcon_id, capcon, metadata FROM tests "
+                    "WHERE state = 'pending' ORDER BY position, capcon_id"
+                )
+            else:
+                candidates = cursor.execute(
+                    "SELECT capcon_id, capcon, metadata FROM tests "
+                    "WHERE state = 'pending' AND campaign = ? "
+                    "ORDER BY position, capcon_id",
+                    (campaign,),
+                )
+
+            row = None
+            for candidate in candidates:
+                if accept is None or accept(
+                    CapConMetadata.model_validate_json(candidate[2])
+                ):
+                    row = candidate
+                    break
+            if row is not None:
+                cursor.execute(
+                    "UPDATE tests SET state = 'leased', owner = ?, lease_expiry = ?, "
+                    f"changed = {NEXT_CHANGE} WHERE capcon_id = ?",
+                    (f"{self.server_id}/{owner}", now + self.lease_timeout, row[0]),
+                )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+        return CAPCON.model_validate_json(row[1])
+
+    def complete(self, capcon_id: str):
+        self._connection.execute(
+            "UPDATE tests SET state = 'done', lease_expiry = NULL, "
+            f"changed = {NEXT_CHANGE} WHERE capcon_id = ?",
+            (capcon_id,),
+        )
+
+    def release(self, capcon_id: str):
+        self._connection.execute(
+            "UPDATE tests SET state = 'pending', owner = NULL, lease_expiry = NULL, "
+            f"changed = {NEXT_CHANGE} WHERE capcon_id = ? AND state = 'leased'",
+            (capcon_id,),
+        )
+
+    def cancel(self, capcon_ids: Iterable[str]):
+        # the row is kept, so other servers do not publish the test again
+        self._connection.executemany(
+            f"UPDATE tests SET state = 'cancelled', changed = {NEXT_CHANGE} "
+            "WHERE capcon_id = ? AND state = 'pending'",
+            [(capcon_id,) for capcon_id in capcon_ids],
+        )
+
+    def changes(self, since: int) -> tuple[list[tuple], int]:
+        rows = self._connection.execute(
+            "SELECT capcon_id, state, campaign, "
+            "CASE WHEN state = 'pending' THEN capcon END, changed "
+            "FROM tests WHERE changed > ? ORDER BY changed",
+            (since,),
+        ).fetchall()
+        if not rows:
+            return [], since
+        changes = []
+        for capcon_id, state, campaign, capcon, _ in rows:
+            if capcon is not None:
+                capcon = CAPCON.model_validate_json(capcon)
+            changes.append((capcon_id, state, campaign, capcon))
+        return changes, rows[-1][4]
+
+    def dispatched(self, capcon_ids: Iterable[str]) -> set[str]:
+        capcon_ids = list(capcon_ids)
+        dispatched = set()
+        # stay below the number of parameters SQLite accepts
+        for start in range(0, len(capcon_ids), 500):
+            chunk = capcon_ids[start : start + 500]
+            rows = self._connection.execute(
+                "SELECT capcon_id FROM tests WHERE state != 'pending' "
+                f"AND capcon_id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            dispatched.update(row[0] for row in rows)
+        return dispatched
+
+    def reset(self):
+        self._connection.execute("DELETE FROM tests")
+
+    def close(self):
+        self._connection.close()
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 from motra.common.capcon_protocol import *
 from datetime import datetime, timezone
 
@@ -20,21 +21,17 @@ def parse_SERVER_HELLO() -> SERVER_HELLO:
     return response
 
 
-def parse_CAPCON(pending_test: Path) -> CAPCON:
+def parse_CAPCON(pending_test: Optional[CAPCON]) -> CAPCON:
     """
     Creates a pydantic PREPARE_TEST model for further parsing. Can return an
     empyt model, in case the server does not have anymore tests to run.
+    The pending test is the cached model from the queue and is copied, so
+    changes for sending do not alter the queue.
     """
     response = None
     if pending_test:
-
-        # parsed_file_for_sending = util.parse_json_file_to_dict(pending_test)
-        # print(parsed_file_for_sending.get("payload"))
-
-        if pending_test.exists():
-            capcon_json = pending_test.read_text()
-            logger.info(f"Loading Capcon {pending_test}")
-            response = CAPCON.model_validate_json(capcon_json)
+        logger.info(f"Loading Capcon {pending_test.CapConID}")
+        response = pending_test.model_copy(deep=True)
     else:
         logger.info("Server: Executed all available tests, stopping... ")
         response = CAPCON(
@@ -52,15 +49,20 @@ def parse_CAPCON(pending_test: Path) -> CAPCON:
     return response
 
 
-def parse_UPLOAD_COMPLETE(request: BaseModel) -> UPLOAD_COMPLETE:
+def parse_UPLOAD_COMPLETE(
+    request: BaseModel,
+    stored_hash: Optional[str],
+) -> UPLOAD_COMPLETE:
     """
     Creates a pydantic UPLOAD_COMPLETE model for further parsing. Uses the
     initial request to pass additional data between server and client.
+    The hash of the stored archive is sent back, so the client can verify the
+    upload. An empty hash signals, that the archive was not stored.
     """
     response = UPLOAD_COMPLETE(
         timestamp_utc=str(datetime.now(timezone.utc)),
         file_name=request.file_name,
-        file_hash=request.file_hash,
+        file_hash=stored_hash or "",
     )
     logger.debug(
         "Server: Parsing UPLOAD_COMPLETE header... ",
@@ -70,15 +72,19 @@ def parse_UPLOAD_COMPLETE(request: BaseModel) -> UPLOAD_COMPLETE:
     return response
 
 
-def parse_EXECUTE_CAPCON(current_test_id: str) -> EXECUTE_CAPCON:
+def parse_EXECUTE_CAPCON(
+    current_test_id: str,
+    trigger_utc: Optional[datetime] = None,
+) -> EXECUTE_CAPCON:
     """
     Creates a pydantic EXECUTE_TEST model for further parsing. Execute test
     serves as a custom trigger with an additional timestamp for logging
-    purposes. Does not server any other purpose.
+    purposes. For synchronized runs the shared start instant is attached.
     """
     response = EXECUTE_CAPCON(
         timestamp_utc=str(datetime.now(timezone.utc)),
         CapConID=current_test_id,
+        trigger_utc=trigger_utc.isoformat() if trigger_utc else None,
     )
     logger.debug(
         "Server: Parsing EXECUTE_TEST heades... ",
@@ -1,3 +1,4 @@
+import asyncio
 import uvicorn
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
 
@@ -7,18 +8,21 @@ from motra.common import util
 from motra.common.archive import create_archive, clean_workspace
 from motra.common.capcon import write_capcon_to_file, write_payload_to_file
 from motra.common.capcon_protocol import *
-from motra.common.schedule import (
-    execute_scheduler_template,
-    generate_scheduler_template,
-)
+from motra.common.completion import wait_for_payloads
+from motra.common.resources import write_resource_report
+from motra.common.schedule import generate_payload_units, parse_trigger
 from motra.common.systemd import generate_logfile_from_jobid
+from motra.common.timing import record_planned, write_skew_report
+from motra.common.unit_staging import StagedRun
 from motra.server.configuration import MotraServerConfig, get_server_config
 from motra.server.file_upload import handle_file_payload
 from motra.server.lifespan import lifespan
-from motra.server import requests
+from motra.server.session import ClientSession
+from motra.server import queue_api, requests
 
 logger = logging.getLogger(__name__)
 app = FastAPI(lifespan=lifespan)
+app.include_router(queue_api.router)
 
 
 @app.get("/")
@@ -31,12 +35,22 @@ async def websocket_endpoint(
     websocket: WebSocket, config: MotraServerConfig = Depends(get_server_config)
 ):
     await websocket.accept()
+
+    # the session is bound to this connection with CLIENT_HELLO
+    session: ClientSession | None = None
+    # a test leased in this connection, released if the client never acknowledges it
+    leased: str = ""
     try:
         while True:
             data = await websocket.receive_json()
             message = data.get("message_type")
             logger.info(f"Server: < {message} ", extra={"data": data})
 
+            if session is None and message != "CLIENT_HELLO":
+                logger.error("Got a request before CLIENT_HELLO.", extra={"data": data})
+                await websocket.close(reason="missing CLIENT_HELLO")
+                break
+
             # ------------------ CLIENT_HELLO ------------------
             if data.get("message_type") == "CLIENT_HELLO":
 
@@ -45,38 +59,75 @@ async def websocket_endpoint(
                     await websocket.close(reason="failed validation")
                     break
 
+                # a client can only have a single active connection
+                if session is None:
+                    candidate = config.get_session(request.client_id)
+                    if not await config.session_store.acquire(candidate):
+                        logger.error(
+                            f"Client {request.client_id} is already connected.",
+                        )
+                        await websocket.close(reason="session already active")
+                        break
+                    session = candidate
+                elif session.client_id != request.client_id:
+                    await websocket.close(reason="client id changed")
+                    break
+                session.entity_id = request.entity_id
+                if request.capabilities is not None:
+                    session.capabilities = request.capabilities
+
                 response = requests.parse_SERVER_HELLO()
                 logger.info(
-                    f"Server: > {response.message_type} ",
+                    f"Server: > {response.message_type} <{session.name}>",
                     extra={"data": response},
                 )
 
                 # when requesting a new connection, we should clean all old stuff
                 # ... we need some state
-                workspace_contents = list(config.live_workspace.iterdir())
+                workspace_contents = list(session.live_data.iterdir())
                 if workspace_contents:
 
+                    # the client restarts once its own payloads exited, the
+                    # server payloads of the run might still be running
+                    running = await wait_for_payloads(
+                        session.live_data, list(session.capture_jobs.keys())
+                    )
+                    if running:
+                        logger.warning(
+                            f"Archiving {session.last_capcon} while {running} did"
+                            " not exit"
+                        )
+
                     # collect the logs of all pending unit files (the server side payloads)
-                    while config.jobs_active:
-                        job_id, _ = config.pop_from_active_jobslist()
-                        generate_logfile_from_jobid(job_id, "server", config.live_data)
+                    # the asyncio scheduler writes the logs while running them
+                    while session.jobs_active:
+                        job_id, _ = session.pop_from_active_jobslist()
+                        if config.scheduler.systemd:
+                            generate_logfile_from_jobid(
+                                job_id, "server", session.live_data
+                            )
 
                     # call the archiver to create a back of all server side files
+                    write_skew_report(session.live_data, session.last_capcon, "server")
                     logger.info("Generating new zip archive for previous capture run.")
                     create_archive(
-                        archive_name=f"{config.last_capcon}_server",
-                        source_directory=config.live_data,
-                        target_directory=config.archive_data,
+                        archive_name=f"{session.last_capcon}_server",
+                        source_directory=session.live_data,
+                        target_directory=session.archive_data,
                         run_post_archive_checks=True,
                     )
+                    config.journal.record(
+                        "archived", session.last_capcon, client=session.client_id
+                    )
 
                 # archiver cleans the current workspace (clean metadata, logs or payload files)
                 # configuration units can in some cases create files inside the workspace, without any
                 # additional payloads. In this case we need to clean the config to keep the server active
-                clean_workspace(config.live_data)
+                clean_workspace(session.live_data)
 
                 # remove all old systemd configurations
-                config.schedule_units.clear()
+                session.schedule_units.clear()
+                session.active_payloads.clear()
 
                 await websocket.send_json(util.serialize(response))
 
@@ -89,12 +140,16 @@ async def websocket_endpoint(
                     break
 
                 # use the base64 stream to create a file on disk
-                handle_file_payload(
+                stored_hash = handle_file_payload(
                     request=request,
-                    workspace=config.archive_data,
+                    workspace=session.archive_data,
                 )
 
-                response = requests.parse_UPLOAD_COMPLETE(request)
+                # both archives of a run are available now, check the data
+                if stored_hash is not None:
+                    await config.evaluate_upload(session, request.file_name)
+
+                response = requests.parse_UPLOAD_COMPLETE(request, stored_hash)
                 logger.info(
                     f"Server: > {response.message_type} ",
                     extra={"data": response},
@@ -109,29 +164,36 @@ async def websocket_endpoint(
                     await websocket.close(reason="failed validation")
                     break
 
-                pending_capcon = config.get_pending_test()
+                pending_capcon = await config.lease_test(session)
                 response = requests.parse_CAPCON(pending_capcon)
                 logger.info(
                     f"Server: > {response.message_type} <{response.CapConID}>",
                     extra={"data": response},
                 )
 
+                # in a run across several clients, only the session of the
+                # leader holds the lease and runs the server side payloads
+                if not session.leader:
+                    await websocket.send_json(util.serialize(response))
+                    await config.prefetch_async()
+                    continue
+                leased = response.CapConID
+
                 # we need to store the ID and the base configuration for the next activation,
                 # so we can create a new archive for the server.
-                config.last_capcon = response.CapConID
+                session.last_capcon = response.CapConID
 
                 if response.CapConID != "":
                     response.timestamp_utc = str(datetime.now(UTC))
                     write_capcon_to_file(
-                        workspace=config.live_data,
+                        workspace=session.live_data,
                         current_test=response,
                     )
 
                 # store the configurations locally
                 # the server needs to schedule a new run for the payloads,
-                # also cleaning now gets an issue
-                # handle_response_payload(...)
-                active_payloads: list[GenericPayload] = list()
+                # the units are created once the start instant is known
+                session.active_payloads.clear()
                 if response.payload:
 
                     for payload in response.payload:
@@ -141,25 +203,33 @@ async def websocket_endpoint(
 
                             # add the current id to our joblist
                             pid = payload.payload_id
-                            active_payloads.append(payload)
-                            current_job = config.live_data / f"{pid}.json"
-                            config.add_to_active_jobslist(pid, current_job)
+                            session.active_payloads.append(payload)
+                            current_job = session.live_data / f"{pid}.json"
+                            session.add_to_active_jobslist(pid, current_job)
                             write_payload_to_file(current_job, payload=payload)
 
-                # create a list of payloads with preconfigured timers to start when sending EXECUTE
-                if active_payloads:
-                    for payload in active_payloads:
-                        payload_unit = generate_scheduler_template(
+                # the previous run of this client finished, prepare the units
+                # of this run, so EXECUTE_CAPCON only starts a trigger
+                if session.staged is not None:
+                    session.staged.clear()
+                    session.staged = None
+                if config.stage_units and session.active_payloads:
+                    staged = StagedRun(
+                        "motra-server-mexec",
+                        response.CapConID,
+                        generate_payload_units(
                             "motra-server-mexec",
-                            current_id=payload.payload_id,
-                            start_time_delta=payload.offset,
-                            runtime_limt=payload.limits,
-                            template_unit=True,
-                        )
-                        config.schedule_units.append(payload_unit)
+                            session.active_payloads,
+                            profiles=config.resource_profiles,
+                        ),
+                    )
+                    if await asyncio.to_thread(staged.stage):
+                        session.staged = staged
 
                 await websocket.send_json(util.serialize(response))
-                config.pop_test()
+
+                # the next test is loaded while the client runs this one
+                await config.prefetch_async()
 
             # ------------------ ACK_CAPCON ------------------
             elif data.get("message_type") == "ACK_CAPCON":
@@ -169,19 +239,76 @@ async def websocket_endpoint(
                     await websocket.close(reason="failed validation")
                     break
 
-                response = requests.parse_EXECUTE_CAPCON(request.CapConID)
+                # runs across several clients start on all clients at once
+                trigger = await config.await_trigger(session)
+                if trigger is None:
+                    # the leader disconnected, the test is back in the queue
+                    logger.warning(f"Run {request.CapConID} was cancelled.")
+                    session.barrier = None
+                    await websocket.close(reason="run cancelled")
+                    break
+
+                response = requests.parse_EXECUTE_CAPCON(request.CapConID, trigger)
                 logger.info(
                     f"Server: > {response.message_type} ",
                     extra={"data": response},
                 )
                 await websocket.send_json(util.serialize(response))
 
-                # do scheduled stuff...
-                for command in config.schedule_units:
-                    execute_scheduler_template(command)
+                if session.leader:
+                    # the payloads start at trigger + offset on all hosts
+                    trigger = parse_trigger(response.trigger_utc)
+                    record_planned(session.live_data, session.active_payloads, trigger)
+                    write_resource_report(
+                        session.live_data,
+                        "server",
+                        session.active_payloads,
+                        config.resource_profiles,
+                        config.motra_profile,
+                        units=config.scheduler.systemd,
+                    )
+                    # the scheduler blocks on systemd, requests of other
+                    # clients are handled meanwhile
+                    failed = []
+                    if session.staged is not None:
+                        failed = await asyncio.to_thread(
+                            config.scheduler.schedule,
+                            [session.staged.trigger_unit(trigger)],
+                        )
+                    if failed:
+                        # drop the staged timers, the names are used again
+                        await asyncio.to_thread(session.staged.clear, reload=True)
+                        session.staged = None
+                    if session.staged is None:
+                        session.schedule_units = generate_payload_units(
+                            "motra-server-mexec",
+                            session.active_payloads,
+                            trigger,
+                            profiles=config.resource_profiles,
+                        )
+                        # all timers of the run are created as one batch
+                        failed = await asyncio.to_thread(
+                            config.scheduler.schedule, session.schedule_units
+                        )
+                        if failed:
+                            # the quality check of the upload requeues the run
+                            logger.error(
+                                f"{request.CapConID}: cannot schedule "
+                                f"{', '.join(unit.unit for unit in failed)}"
+                            )
+
+                    # the server side jobs are needed to create the archive after a restart
+                    config.journal.record(
+                        "executed",
+                        request.CapConID,
+                        jobs=list(session.capture_jobs.keys()),
+                        client=session.client_id,
+                    )
+                    config.complete_test(request.CapConID)
+                    leased = ""
 
                 # remove all old systemd configurations for the next run
-                config.schedule_units.clear()
+                session.schedule_units.clear()
 
                 await websocket.close()
                 logger.info("Server: Sent EXECUTE and closed connection. ")
@@ -198,6 +325,15 @@ async def websocket_endpoint(
         logger.info(
             f"Client disconnected. Details: <{e.code}; {e.reason}> ",
         )
+    finally:
+        if leased:
+            logger.warning(f"Returning unacknowledged test {leased} to the queue.")
+            config.release_test(leased)
+            if session is not None and session.staged is not None:
+                session.staged.clear()
+                session.staged = None
+        if session is not None:
+            config.session_store.release(session)
 
 
 def run(
@@ -205,8 +341,19 @@ def run(
     loglevel,
     port: int = 12400,
     host: str = "0.0.0.0",
+    workers: int = 1,
 ):
-    uvicorn.run(app, host=host, port=port, reload=reload, log_level=loglevel)
+    if workers > 1:
+        # every worker imports the app and loads the configuration itself
+        uvicorn.run(
+            "motra.server.server:app",
+            host=host,
+            port=port,
+            workers=workers,
+            log_level=loglevel,
+        )
+    else:
+        uvicorn.run(app, host=host, port=port, reload=reload, log_level=loglevel)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional
+
+from motra.common.capcon_protocol import (
+    CapConMetadata,
+    ClientCapabilities,
+    GenericPayload,
+)
+from motra.common.schedule import UnitSpec
+from motra.common.unit_staging import StagedRun
+from motra.server.barrier import TriggerBarrier
+
+logger = logging.getLogger(__name__)
+
+
+def session_key(client_id: str) -> str:
+    """
+    Converts a client id (MAC address) into a name usable for directories.
+    """
+    return client_id.lower().replace(":", "-")
+
+
+class ClientSession:
+    """
+    The server side state of a single client. Each client gets its own live
+    workspace for the server side payloads and its own archive directory, so
+    multiple clients can run their tests at the same time.
+
+    client_id: The hardware id sent with CLIENT_HELLO.
+
+    lock: Held while a connection of this client is active. A second
+        connection using the same id is rejected instead of sharing the state.
+
+    capabilities: Sent with CLIENT_HELLO and kept for later connections, None
+        for clients that do not report them.
+    """
+
+    client_id: str
+    live_workspace: Path
+    archive_workspace: Path
+
+    def __init__(self, client_id: str, live_workspace: Path, archive_workspace: Path):
+        self.client_id = client_id
+        self.entity_id = ""
+        self.capabilities: Optional[ClientCapabilities] = None
+        self.live_workspace = live_workspace / session_key(client_id)
+        self.archive_workspace = archive_workspace / session_key(client_id)
+        self.live_workspace.mkdir(parents=True, exist_ok=True)
+        self.archive_workspace.mkdir(parents=True, exist_ok=True)
+
+        self.lock = asyncio.Lock()
+
+        # payload state for the current measurement iteration
+        self.capture_jobs: dict[str, Path] = {}
+        self.active_payloads: list[GenericPayload] = list()
+        self.schedule_units: list[UnitSpec] = list()
+        self.last_capcon: str = ""
+
+        # units of the current run, written before EXECUTE_CAPCON
+        self.staged: Optional[StagedRun] = None
+
+        # set while the session takes part in a run across several clients
+        self.barrier: Optional[TriggerBarrier] = None
+        self.leader: bool = True
+
+    @property
+    def name(self) -> str:
+        return self.entity_id or self.client_id
+
+    def accepts(self, metadata: Optional[CapConMetadata]) -> bool:
+        """
+        Checks the capability requirements of a test against this client.
+        Clients without reported capabilities accept every test.
+        """
+        if self.capabilities is None or metadata is None or metadata.requires is None:
+            return True
+        return not metadata.requires.missing(self.capabilities)
+
+    @property
+    def live_data(self):
+        return self.live_workspace
+
+    @property
+    def archive_data(self):
+        return self.archive_workspace
+
+    @property
+    def jobs_active(self):
+        return len(self.capture_jobs) != 0
+
+    def add_to_active_jobslist(self, payload_id: str, payload_file: Path):
+        self.capture_jobs.update({payload_id: payload_file})
+
+    def pop_from_active_jobslist(self) -> dict[str, Path] | None:
+        if len(self.capture_jobs) == 0:
+            return None
+        return self.capture_jobs.popitem()
+
+    def clear_active_jobslist(self) -> None:
+        return self.capture_jobs.clear()
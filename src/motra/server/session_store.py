@@ -0,0 +1,182 @@
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from motra.common.capcon_protocol import ClientCapabilities
+from motra.server.session import ClientSession
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    """
+    Keeps the state of the client sessions between two connections of a
+    client. A connection acquires the session of its client on CLIENT_HELLO
+    and releases it, once the connection is closed. All messages of a single
+    run use the same connection, so the session is only read on acquire and
+    written on release.
+
+    shared: True, if the sessions are shared with other server processes.
+    """
+
+    shared: bool = False
+
+    @abstractmethod
+    async def acquire(self, session: ClientSession) -> bool:
+        """
+        Binds the session to the current connection.
+
+        Returns:
+            False, if another connection of the client is active.
+        """
+
+    @abstractmethod
+    def release(self, session: ClientSession):
+        """Stores the session and allows the next connection of the client."""
+
+    def reset(self):
+        """Forgets all sessions, used when starting a new campaign."""
+
+    def close(self):
+        pass
+
+
+class LocalSessionStore(SessionStore):
+    """
+    Sessions of a single server process, kept in memory.
+    """
+
+    async def acquire(self, session: ClientSession) -> bool:
+        if session.lock.locked():
+            return False
+        await session.lock.acquire()
+        return True
+
+    def release(self, session: ClientSession):
+        session.lock.release()
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions shared by the worker processes of a server through a SQLite
+    database in WAL mode, so readers do not block the writer. A client can
+    connect to any worker, the worker handling a connection loads the session
+    from the database and writes it back on release.
+
+    The connection, that holds a session, is stored as owner. If a worker
+    stops without releasing a session, the session is taken over after
+    `timeout` seconds.
+
+    database: Location of the database, needs to be on a local filesystem.
+    """
+
+    database: Path
+    shared = True
+
+    def __init__(self, database: Path, timeout: float = 300):
+        self.database = database
+        self.timeout = timeout
+
+        self._connection = sqlite3.connect(
+            database, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                client_id TEXT PRIMARY KEY,
+                entity_id TEXT NOT NULL DEFAULT '',
+                capabilities TEXT,
+                last_capcon TEXT NOT NULL DEFAULT '',
+                jobs TEXT NOT NULL DEFAULT '[]',
+                owner TEXT,
+                acquired REAL
+            )
+            """
+        )
+        self._owners: dict[str, str] = {}
+
+    async def acquire(self, session: ClientSession) -> bool:
+        # the local lock covers connections handled by this worker
+        if session.lock.locked():
+            return False
+
+        owner = uuid.uuid4().hex
+        now = time.time()
+        cursor = self._connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            created = cursor.execute(
+                "INSERT OR IGNORE INTO sessions (client_id) VALUES (?)",
+                (session.client_id,),
+            ).rowcount
+            row = cursor.execute(
+                "SELECT entity_id, capabilities, last_capcon, jobs, owner, acquired "
+                "FROM sessions WHERE client_id = ?",
+                (session.client_id,),
+            ).fetchone()
+            entity_id, capabilities, last_capcon, jobs, current, acquired = row
+            if current is not None and acquired + self.timeout > now:
+                cursor.execute("ROLLBACK")
+                return False
+
+            cursor.execute(
+                "UPDATE sessions SET owner = ?, acquired = ? WHERE client_id = ?",
+                (owner, now, session.client_id),
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+        await session.lock.acquire()
+        self._owners[session.client_id] = owner
+
+        # a new record keeps the state restored from the journal, otherwise
+        # the previous connection might have been handled by another worker
+        if created:
+            return True
+        session.entity_id = entity_id
+        if capabilities is not None:
+            session.capabilities = ClientCapabilities.model_validate_json(
+                capabilities
+            )
+        session.last_capcon = last_capcon
+        session.clear_active_jobslist()
+        for payload_id in json.loads(jobs):
+            session.add_to_active_jobslist(
+                payload_id, session.live_data / f"{payload_id}.json"
+            )
+        return True
+
+    def release(self, session: ClientSession):
+        owner = self._owners.pop(session.client_id, None)
+        capabilities = None
+        if session.capabilities is not None:
+            capabilities = session.capabilities.model_dump_json()
+
+        self._connection.execute(
+            "UPDATE sessions SET entity_id = ?, capabilities = ?, last_capcon = ?, "
+            "jobs = ?, owner = NULL, acquired = NULL "
+            "WHERE client_id = ? AND owner = ?",
+            (
+                session.entity_id,
+                capabilities,
+                session.last_capcon,
+                json.dumps(list(session.capture_jobs.keys())),
+                session.client_id,
+                owner,
+            ),
+        )
+        session.lock.release()
+
+    def reset(self):
+        self._connection.execute("DELETE FROM sessions")
+
+    def close(self):
+        self._connection.close()
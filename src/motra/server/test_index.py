@@ -0,0 +1,284 @@
+import hashlib
+import json
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from motra.common.capcon import (
+    expand_template,
+    template_capcon_id,
+    template_samples,
+    template_size,
+)
+from motra.common.capcon_protocol import CAPCON, CapConMetadata, CapConTemplate
+from motra.common.timespan import parse_systemd_timespan
+
+logger = logging.getLogger(__name__)
+
+
+# validating a handful of files is faster than spawning a process pool
+POOL_THRESHOLD = 32
+
+
+class CapConSummary(BaseModel):
+    """
+    Index record for a single, successfully validated test file. The record is
+    valid as long as the modification time and size of the file are unchanged.
+    """
+
+    path: str = Field(description="Resolved path of the test file")
+    mtime_ns: int = Field(description="Modification time of the indexed file")
+    size: int = Field(description="File size of the indexed file")
+
+    CapConID: str
+    duration: str
+    payload_count: int
+    sha256: str = Field(description="Hash over the raw file contents")
+
+    # used to order a campaign without loading every test
+    payload_types: list[str]
+    runtime: Optional[float] = Field(
+        description="Latest payload end (offset + limits) in seconds, None if unbounded"
+    )
+    metadata: CapConMetadata
+
+    # templates are indexed with their TemplateID and the first run
+    template: bool = False
+    expansions: int = 1
+
+    @classmethod
+    def from_capcon(
+        cls,
+        capcon: CAPCON,
+        path: str = "",
+        mtime_ns: int = 0,
+        size: int = 0,
+        sha256: str = "",
+    ):
+        payloads = capcon.payload or []
+
+        runtime = 0.0
+        for payload in payloads:
+            end = parse_systemd_timespan(payload.offset) + parse_systemd_timespan(
+                payload.limits
+            )
+            runtime = max(runtime, end)
+
+        return cls(
+            path=path,
+            mtime_ns=mtime_ns,
+            size=size,
+            CapConID=capcon.CapConID,
+            duration=capcon.duration,
+            payload_count=len(payloads),
+            sha256=sha256,
+            payload_types=[payload.payload_type for payload in payloads],
+            runtime=None if math.isinf(runtime) else runtime,
+            metadata=capcon.metadata or CapConMetadata(),
+        )
+
+
+def summarize_capcon_file(path: str) -> tuple[str, Optional[dict], Optional[str]]:
+    """
+    Validates a single test file and creates the summary for the index.
+    Runs inside the worker processes, so only plain data is returned.
+
+    Returns:
+        A tuple of (path, summary, error), either summary or error is None.
+    """
+    try:
+        stat = os.stat(path)
+        raw = Path(path).read_bytes()
+        data = json.loads(raw)
+        if isinstance(data, dict) and "TemplateID" in data:
+            return (path, summarize_template(data, path, stat, raw), None)
+
+        capcon = CAPCON.model_validate(data)
+        summary = CapConSummary.from_capcon(
+            capcon,
+            path=path,
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            sha256=hashlib.sha256(raw).hexdigest(),
+        )
+    except (OSError, ValidationError, ValueError) as e:
+        return (path, None, str(e))
+    except (KeyError, IndexError) as e:
+        return (path, None, f"Invalid template field: {e}")
+
+    return (path, summary.model_dump(), None)
+
+
+def summarize_template(
+    data: dict,
+    path: str,
+    stat: os.stat_result,
+    raw: bytes,
+) -> dict:
+    """
+    Validates a template by expanding the runs, that use every value of each
+    parameter (see template_samples). The CapConIDs of all runs need to be
+    unique, only the ids are generated for this check.
+    """
+    template = CapConTemplate.model_validate(data)
+    size = template_size(template)
+    if size == 0:
+        raise ValueError(f"Template {template.TemplateID} has no runs")
+
+    capcon_ids = {template_capcon_id(template, index) for index in range(size)}
+    if len(capcon_ids) != size:
+        raise ValueError(
+            f"Template {template.TemplateID} creates duplicate CapConIDs, "
+            "add {index} to the CapConID"
+        )
+
+    first = expand_template(template, 0)
+    for index in template_samples(template)[1:]:
+        expand_template(template, index)
+
+    summary = CapConSummary.from_capcon(
+        first,
+        path=path,
+        mtime_ns=stat.st_mtime_ns,
+        size=stat.st_size,
+        sha256=hashlib.sha256(raw).hexdigest(),
+    )
+    summary.CapConID = template.TemplateID
+    summary.template = True
+    summary.expansions = size
+    return summary.model_dump()
+
+
+class CapConIndex:
+    """
+    Persistent index of validated test files, stored as JSON next to the
+    server configuration.
+
+    On startup only files, that are new or changed their mtime or size since
+    the last run, are validated again. New files are validated in parallel
+    using a process pool.
+
+    index_file: The location of the JSON index on disk.
+    """
+
+    index_file: Path
+
+    def __init__(self, index_file: Path):
+        self.index_file = index_file
+        self.records: dict[str, CapConSummary] = {}
+
+    def load(self):
+        self.records = {}
+        if not self.index_file.is_file():
+            return
+
+        try:
+            raw_records = json.loads(self.index_file.read_text())
+            for record in raw_records:
+                summary = CapConSummary.model_validate(record)
+                self.records[summary.path] = summary
+        except (json.JSONDecodeError, ValidationError):
+            logger.warning(f"Test index {self.index_file} is invalid, rebuilding.")
+            self.records = {}
+
+    def store(self):
+        records = [record.model_dump() for record in self.records.values()]
+        # worker processes of the server store the index at the same time
+        temp_path = self.index_file.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_text(json.dumps(records))
+        temp_path.replace(self.index_file)
+
+    def lookup(self, path: Path) -> Optional[CapConSummary]:
+        """
+        Returns the indexed summary, if the file did not change since indexing.
+        A file, that was removed in the meantime, has no summary.
+        """
+        record = self.records.get(str(path))
+        if record is None:
+            return None
+
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        if record.mtime_ns != stat.st_mtime_ns or record.size != stat.st_size:
+            return None
+        return record
+
+    def refresh(
+        self,
+        test_files: list[Path],
+        workers: Optional[int] = None,
+    ) -> tuple[list[CapConSummary], dict[str, str]]:
+        """
+        Updates the index for the given files and drops records of files that
+        no longer exist.
+
+        Returns:
+            The summaries in the order of test_files and a dict with the error
+            message for each file that failed the validation.
+        """
+        self.load()
+
+        paths = [str(test_file.resolve()) for test_file in test_files]
+        pending = [path for path in paths if self.lookup(Path(path)) is None]
+        logger.info(
+            f"Test index: {len(paths) - len(pending)} cached, "
+            f"{len(pending)} file(s) to validate."
+        )
+
+        if len(pending) > POOL_THRESHOLD:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(summarize_capcon_file, pending, chunksize=16))
+        else:
+            results = [summarize_capcon_file(path) for path in pending]
+
+        errors: dict[str, str] = {}
+        for path, summary, error in results:
+            if summary is None:
+                self.records.pop(path, None)
+                errors[path] = error
+            else:
+                self.records[path] = CapConSummary.model_validate(summary)
+
+        # keep the index small, only files found in this scan are kept
+        self.records = {
+            path: self.records[path] for path in paths if path in self.records
+        }
+        self.store()
+
+        return [self.records[path] for path in paths if path in self.records], errors
+
+    def update(
+        self, test_file: Path, store: bool = True
+    ) -> tuple[Optional[CapConSummary], Optional[str]]:
+        """
+        Validates a single changed file and updates its record.
+
+        store: Writes the index to disk, a batch of changes is stored once
+            by the caller instead.
+
+        Returns:
+            The new summary or the error message, if the validation failed.
+        """
+        path, summary, error = summarize_capcon_file(str(test_file.resolve()))
+        if summary is None:
+            self.records.pop(path, None)
+        else:
+            self.records[path] = CapConSummary.model_validate(summary)
+        if store:
+            self.store()
+
+        return self.records.get(path), error
+
+    def discard(self, test_file: Path, store: bool = True):
+        """
+        Removes the record of a deleted file.
+        """
+        if self.records.pop(str(test_file.resolve()), None) is not None and store:
+            self.store()
@@ -0,0 +1,239 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from motra.workspace.workspace_configuration import WATCH_MODES
+
+logger = logging.getLogger(__name__)
+
+
+# see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# the changes of a single burst: (changed, removed), applied as a task
+ChangeCallback = Callable[[set[Path], set[Path]], Awaitable[None]]
+
+
+def snapshot_directory(directory: Path, pattern: str) -> dict[Path, tuple[int, int]]:
+    """
+    Returns the (mtime_ns, size) for every file matching the pattern.
+    """
+    snapshot = {}
+    for test_file in directory.glob(pattern):
+        try:
+            stat = test_file.stat()
+        except FileNotFoundError:
+            continue
+        snapshot[test_file] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+class TestDirectoryWatcher:
+    """
+    Watches the test directory for added, modified and removed capcon files
+    and reports the changes to a callback inside the event loop.
+
+    On Linux inotify is used through libc. Events are collected until the
+    directory was quiet for `settle_time` seconds, so a file that is written
+    in multiple steps is only validated once. On other systems, or if inotify
+    is not available, the directory is polled every `poll_interval` seconds.
+
+    directory: The directory to watch.
+
+    on_change: Coroutine function called with the sets of changed and removed
+        files.
+    """
+
+    directory: Path
+    on_change: ChangeCallback
+
+    def __init__(
+        self,
+        directory: Path,
+        on_change: ChangeCallback,
+        mode: WATCH_MODES = "auto",
+        pattern: str = "*.json",
+        poll_interval: float = 2.0,
+        settle_time: float = 0.5,
+    ):
+        self.directory = directory
+        self.on_change = on_change
+        self.mode = mode
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+
+        self._fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._changed: set[Path] = set()
+        self._removed: set[Path] = set()
+        self._snapshot: dict[Path, tuple[int, int]] = {}
+        self._applying: set[asyncio.Task] = set()
+
+    # #################         Lifecycle      #####################
+
+    def start(self):
+        """
+        Starts watching, needs to be called from within the running event loop.
+        """
+        if self.mode == "off":
+            logger.info("Watching the test directory is disabled.")
+            return
+
+        self._snapshot = snapshot_directory(self.directory, self.pattern)
+
+        if self.mode in ("auto", "inotify"):
+            try:
+                self._start_inotify()
+                logger.info(f"Watching {self.directory} using inotify")
+                return
+            except OSError as e:
+                if self.mode == "inotify":
+                    raise
+                logger.warning(f"inotify is not available ({e}), polling instead")
+
+        self._task = asyncio.get_running_loop().create_task(self._poll())
+        logger.info(f"Polling {self.directory} every {self.poll_interval}s")
+
+    def stop(self):
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for task in self._applying:
+            task.cancel()
+
+    # #################         inotify      #####################
+
+    def _start_inotify(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify requires Linux")
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF
+        wd = libc.inotify_add_watch(fd, str(self.directory).encode(), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"inotify_add_watch failed for {self.directory}")
+
+        self._fd = fd
+        asyncio.get_running_loop().add_reader(fd, self._read_inotify)
+
+    def _read_inotify(self):
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = buffer[offset : offset + length].rstrip(b"\0").decode()
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, compare against the last known state
+                logger.warning("inotify queue overflow, rescanning test directory")
+                self._rescan()
+                continue
+            if mask & IN_DELETE_SELF:
+                logger.error(f"Test directory {self.directory} was removed")
+                continue
+
+            test_file = self.directory / name
+            if not test_file.match(self.pattern):
+                continue
+
+            if mask & (IN_MOVED_FROM | IN_DELETE):
+                self._changed.discard(test_file)
+                self._removed.add(test_file)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._removed.discard(test_file)
+                self._changed.add(test_file)
+
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._flush_handle = loop.call_later(self.settle_time, self._flush)
+
+    # #################         polling      #####################
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self._rescan()
+            self._flush()
+
+    def _rescan(self):
+        snapshot = snapshot_directory(self.directory, self.pattern)
+        for test_file, state in snapshot.items():
+            if self._snapshot.get(test_file) != state:
+                self._changed.add(test_file)
+        for test_file in self._snapshot.keys() - snapshot.keys():
+            self._removed.add(test_file)
+        self._snapshot = snapshot
+
+    # #################         callback      #####################
+
+    def _flush(self):
+        self._flush_handle = None
+        if not self._changed and not self._removed:
+            return
+
+        changed, removed = self._changed, self._removed
+        self._changed, self._removed = set(), set()
+
+        # keep the polling state in sync with the reported changes
+        for test_file in removed:
+            self._snapshot.pop(test_file, None)
+        for test_file in list(changed):
+            try:
+                stat = test_file.stat()
+                self._snapshot[test_file] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                changed.discard(test_file)
+                removed.add(test_file)
+
+        logger.info(
+            f"Test directory changed: {len(changed)} updated, {len(removed)} removed"
+        )
+        # the callback validates the files in the background, the next burst
+        # is collected meanwhile
+        task = asyncio.get_running_loop().create_task(self._apply(changed, removed))
+        self._applying.add(task)
+        task.add_done_callback(self._applying.discard)
+
+    async def _apply(self, changed: set[Path], removed: set[Path]):
+        try:
+            await self.on_change(changed, removed)
+        except Exception:
+            logger.error("Failed to apply test directory changes", exc_info=True)
@@ -0,0 +1,220 @@
+import logging
+import re
+import zipfile
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from motra.common.capcon_protocol import GenericPayload
+from motra.common.readiness import COMMAND_LOG_PREFIX
+from motra.server.quality import UNIT_RESULT, read_archive_capcon
+
+logger = logging.getLogger(__name__)
+
+
+DOCKER_PS = re.compile(r"\bdocker\s+(ps|container\s+(ls|list|ps))\b")
+DOCKER_LOGS = re.compile(r"\bdocker\s+(container\s+)?logs\b")
+
+# the STATUS column of docker ps, e.g. "Up 2 hours (healthy)" or "Exited (137)"
+CONTAINER_STATUS = re.compile(
+    r"^(Up|Exited|Restarting|Created|Paused|Dead|Removal in progress)\b"
+)
+EXIT_STATUS = re.compile(r"^Exited \((?P<code>-?\d+)\)")
+
+# a crash loop or a failed health check, reported for any listed container
+BROKEN_STATUS = ("Restarting", "Dead")
+# states of a configured container, that is not running
+STOPPED_STATUS = ("Created", "Paused", "Removal")
+
+
+class HealthReport(BaseModel):
+    """
+    State of the testbed as reported by the logs payloads of a run.
+    """
+
+    CapConID: str
+    healthy: bool
+    checked: list[str] = Field(
+        description="Payloads whose output was checked", default_factory=list
+    )
+    failures: list[str] = Field(default_factory=list)
+    reset: Optional[str] = Field(
+        description="CapConID of the injected reset, None if none was injected",
+        default=None,
+    )
+    timestamp_utc: str = Field(default_factory=lambda: str(datetime.now(UTC)))
+
+
+def output_lines(log: str) -> list[str]:
+    """
+    The lines written by the command of a payload. The logged command line
+    and the result of the unit are dropped.
+    """
+    return [
+        line
+        for line in log.splitlines()
+        if COMMAND_LOG_PREFIX not in line and UNIT_RESULT.search(line) is None
+    ]
+
+
+def container_failed(status: str, required: bool, clean_exit: bool) -> bool:
+    """
+    Decides whether the STATUS of a container means a broken testbed.
+
+    required: The container is part of the testbed and must be up. Other
+        containers only fail, if they are restarting or unhealthy, docker ps
+        -a lists every stopped container of the host.
+    clean_exit: An exit with status 0 does not count as a failure.
+    """
+    if status.startswith(BROKEN_STATUS) or "(unhealthy)" in status:
+        return True
+    if not required:
+        return False
+    if status.startswith(STOPPED_STATUS):
+        return True
+    exited = EXIT_STATUS.match(status)
+    if exited is not None:
+        return not (clean_exit and int(exited.group("code")) == 0)
+    return False
+
+
+def check_container_states(
+    lines: list[str],
+    containers: list[str],
+    listed: set[str],
+    clean_exit: bool = True,
+) -> list[str]:
+    """
+    Checks the output of docker ps -a. Columns are separated by at least two
+    spaces, the name is the last column. A prefix added by the journal ends
+    up in the first column and does not matter.
+
+    containers: Containers of the testbed, that must be up. If empty, only
+        restarting and unhealthy containers fail the check.
+    listed: Receives the names of all listed containers. Containers of the
+        testbed missing on every host are reported by evaluate_health.
+    """
+    failures = []
+    for line in lines:
+        columns = re.split(r"\s{2,}", line.strip())
+        status = next((c for c in columns if CONTAINER_STATUS.match(c)), None)
+        if status is None or len(columns) < 2:
+            continue
+
+        name = columns[-1]
+        listed.add(name)
+        if container_failed(status, name in containers, clean_exit):
+            failures.append(f"container {name} is '{status}'")
+    return failures
+
+
+def check_error_markers(lines: list[str], markers: list[re.Pattern]) -> list[str]:
+    failures = []
+    for marker in markers:
+        line = next((line for line in lines if marker.search(line)), None)
+        if line is not None:
+            failures.append(f"'{marker.pattern}' in '{line.strip()}'")
+    return failures
+
+
+def check_logs_payload(
+    payload: GenericPayload,
+    zf: zipfile.ZipFile,
+    containers: list[str],
+    markers: list[re.Pattern],
+    listed: set[str],
+    clean_exit: bool = True,
+) -> Optional[list[str]]:
+    """
+    Checks the output of a logs payload inside a run archive.
+
+    Returns:
+        A message for each failed check, None if the payload reports nothing
+        about the testbed or its log is missing.
+    """
+    if DOCKER_PS.search(payload.command):
+        check = "states"
+    elif DOCKER_LOGS.search(payload.command):
+        check = "markers"
+    else:
+        return None
+
+    try:
+        log = zf.read(f"{payload.payload_id}.log").decode(errors="replace")
+    except KeyError:
+        logger.debug(f"{payload.payload_id}: no log in {zf.filename}")
+        return None
+
+    lines = output_lines(log)
+    if check == "states":
+        failures = check_container_states(lines, containers, listed, clean_exit)
+    else:
+        failures = check_error_markers(lines, markers)
+    return [f"{payload.payload_id}: {failure}" for failure in failures]
+
+
+def evaluate_health(
+    server_archive: Path,
+    client_archive: Path,
+    containers: list[str],
+    error_markers: list[str],
+    clean_exit: bool = True,
+) -> HealthReport:
+    """
+    Evaluates the container states (docker ps) and the container logs (docker
+    logs) collected by the logs payloads of a run. A payload targeting the
+    client and the server is checked in both archives.
+    """
+    capcon = read_archive_capcon(server_archive)
+    if capcon is None:
+        capcon = read_archive_capcon(client_archive)
+    if capcon is None:
+        # without the payloads, nothing is known about the testbed
+        return HealthReport(CapConID=client_archive.stem, healthy=True)
+
+    markers = [re.compile(marker) for marker in error_markers]
+    checked, failures = [], []
+    listed: set[str] = set()
+    states_checked = False
+    for payload in capcon.payload or []:
+        if payload.payload_type != "logs":
+            continue
+
+        archives = []
+        if "server" in payload.target:
+            archives.append(server_archive)
+        if any(target != "server" for target in payload.target):
+            archives.append(client_archive)
+
+        for archive in archives:
+            try:
+                with zipfile.ZipFile(archive, "r") as zf:
+                    payload_failures = check_logs_payload(
+                        payload, zf, containers, markers, listed, clean_exit
+                    )
+            except (OSError, zipfile.BadZipFile) as e:
+                logger.error(f"Cannot open {archive.name}: {e}")
+                continue
+            if payload_failures is None:
+                continue
+            checked.append(payload.payload_id)
+            failures.extend(payload_failures)
+            states_checked |= DOCKER_PS.search(payload.command) is not None
+
+    # the testbed runs on a single host, docker ps on the others lists none of
+    # its containers
+    if states_checked:
+        failures.extend(
+            f"container {name} is not listed"
+            for name in containers
+            if name not in listed
+        )
+
+    return HealthReport(
+        CapConID=capcon.CapConID,
+        healthy=len(failures) == 0,
+        checked=checked,
+        failures=failures,
+    )
@@ -169,6 +169,7 @@ def motra_mexec_unit(config: tuple):
     EnvironmentFile={environment_file}
     Type=exec
     ExecStart={python_executable} -m motra.cli.cli mexec %i
+    ExecStopPost={python_executable} -m motra.cli.cli mexec-finish %i
     """
 
     return template_string
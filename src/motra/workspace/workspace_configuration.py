@@ -1,9 +1,12 @@
+from datetime import datetime
 from pathlib import Path
 import typer
 from typing import Literal, Union, Optional
 from typing_extensions import Annotated
 from pydantic import BaseModel, DirectoryPath, FilePath, Field
 
+from motra.common.literals import SCHEDULER_BACKENDS
+from motra.common.resources import ResourceProfile
 from motra.workspace.environment import environment_dump, environment_serialized
 
 # https://github.com/pydantic/pydantic/issues/10559/
@@ -11,34 +14,166 @@ from motra.workspace.environment import environment_dump, environment_serialized
 # needs more checks
 
 
+class RetentionConfiguration(BaseModel):
+    """
+    Limits for the client side archive directory. Only archives the server has
+    acknowledged with a matching hash are removed. Unset limits are disabled.
+    """
+
+    max_bytes: Optional[Annotated[int, Field(ge=0)]] = None
+    max_count: Optional[Annotated[int, Field(ge=0)]] = None
+    # systemd time format, e.g. "7d" or "12h"
+    max_age: Optional[str] = None
+    # evict acknowledged archives while the filesystem has less free space
+    min_free_bytes: Optional[Annotated[int, Field(ge=0)]] = None
+
+    # bound the work done between two runs
+    max_evictions: Annotated[int, Field(ge=1)] = 64
+    hash_budget_bytes: Annotated[int, Field(ge=0)] = 256 * 1024 * 1024
+
+
 class ClientFileConfiguration(BaseModel):
     type: Literal["client"]
     server_uri: str
     retry_time: Annotated[int, Field(ge=0, le=30)]
     retry_limit: Annotated[int, Field(ge=0, le=30)]
     scheduling_mode: Literal["systemd", "none"]
+    scheduler_backend: SCHEDULER_BACKENDS = "systemd-run"
+    # write the units of a run before EXECUTE_CAPCON, requires root. Each run
+    # reloads systemd, which reloads every unit of the host
+    stage_units: bool = False
+    # start the client restart_settle after the last payload of a run exited,
+    # CAPCON.duration is only the upper bound
+    early_restart: bool = True
+    restart_settle: str = "2s"
+
+    # CPU and I/O placement of the payload units by payload type, and of the
+    # client itself (archive, upload). Stored with each run as resources.json
+    resource_profiles: dict[str, ResourceProfile] = Field(default_factory=dict)
+    motra_profile: Optional[ResourceProfile] = None
 
     # workspace configuration
     live_workspace: Path
     staging_workspace: Path
     archive_workspace: Path
 
+    retention: RetentionConfiguration = Field(default_factory=RetentionConfiguration)
+
     def dump(self, target: Path):
         filestream = self.model_dump_json(indent=2)
         # config_path = default_workspace_path / "server.config"
         target.write_text(filestream)
 
 
+class CampaignConfiguration(BaseModel):
+    """
+    A campaign loaded next to other campaigns. Dispatch is shared between the
+    campaigns by their weight, a campaign falling behind its deadline is
+    dispatched first.
+    """
+
+    weight: Annotated[float, Field(gt=0)] = 1.0
+    deadline: Optional[datetime] = None
+    # defaults to a subdirectory of the test workspace named after the campaign
+    directory: Optional[Path] = None
+
+
+WATCH_MODES = Literal["auto", "inotify", "polling", "off"]
+ORDERING_MODES = Literal["files", "optimized"]
+QUEUE_BACKENDS = Literal["local", "sqlite"]
+RESET_POLICIES = Literal["planned", "adaptive"]
+
+
+class TestbedHealthConfiguration(BaseModel):
+    """
+    Checks of the outputs of the logs payloads (docker ps -a, docker logs),
+    that decide whether the testbed needs a reset before the next run.
+    """
+
+    # containers of the testbed, that must be up (the generators use the
+    # testbed_containers of capcon.reset_payload). docker ps -a lists every
+    # stopped container of the host, so other containers only fail the check
+    # while restarting or unhealthy
+    containers: list[str] = Field(default_factory=list)
+    # a configured container, that exited with status 0, is healthy
+    allow_clean_exit: bool = True
+    # regular expressions, a match inside a container log fails the check
+    error_markers: list[str] = Field(
+        default_factory=lambda: [
+            r"Error response from daemon",
+            r"Traceback \(most recent call last\)",
+            r"(?i)\b(fatal|panic|segmentation fault|out of memory)\b",
+        ]
+    )
+
+
 class ServerFileConfiguration(BaseModel):
     type: Literal["server"]
     port: Annotated[int, Field(ge=1, le=65535)]
     host: str
 
+    # worker processes of uvicorn, more than one worker keeps the queue and
+    # the client sessions in SQLite databases inside the entity storage
+    workers: Annotated[int, Field(ge=1)] = 1
+
     test_storage: Literal["local", "remote"]
     live_workspace: Path
     test_workspace: Union[Path, str] = Field(union_mode="left_to_right")
     archive_workspace: Path
 
+    # pick up new or changed tests while the server is running
+    test_watch: WATCH_MODES = "auto"
+    test_poll_interval: Annotated[float, Field(gt=0)] = 2.0
+
+    # named campaigns dispatched side by side, if empty the test workspace is
+    # loaded as a single campaign
+    campaigns: dict[str, CampaignConfiguration] = Field(default_factory=dict)
+
+    # "files" runs the tests in the order they were found, "optimized"
+    # reorders the campaign to need as few testbed resets as possible
+    campaign_ordering: ORDERING_MODES = "files"
+    max_runs_between_resets: Optional[Annotated[int, Field(ge=1)]] = None
+
+    # "planned" runs the reset tests where the files or the ordering put them,
+    # like campaigns did before the health checks. "adaptive" holds back the
+    # tests tagged "reset" and runs a copy once the logs payloads of a run
+    # report an unhealthy testbed, or where the optimized ordering needs a
+    # reset. With the "files" ordering, runs tagged "destructive" get no reset
+    # of their own: breakage that does not show in docker ps or the container
+    # logs (e.g. ARP poisoning) is not detected
+    reset_policy: RESET_POLICIES = "planned"
+    testbed_health: TestbedHealthConfiguration = Field(
+        default_factory=TestbedHealthConfiguration
+    )
+
+    # "sqlite" shares the campaign between servers using the same database,
+    # defaults to queue.sqlite inside the entity storage
+    queue_backend: QUEUE_BACKENDS = "local"
+    queue_database: Optional[Path] = None
+    queue_lease_timeout: Annotated[float, Field(gt=0)] = 300.0
+
+    # runs failing the quality gate are requeued, the delay doubles per retry
+    max_retries: Annotated[int, Field(ge=0)] = 2
+    retry_backoff: Annotated[float, Field(ge=0)] = 60.0
+
+    # every run starts at an absolute instant trigger_delay seconds after
+    # EXECUTE_CAPCON, runs targeting several clients wait for all ACK_CAPCON
+    barrier_timeout: Annotated[float, Field(gt=0)] = 120.0
+    trigger_delay: Annotated[float, Field(ge=0)] = 2.0
+
+    # how the server side payload timers are created, see scheduler_backend
+    scheduler_backend: SCHEDULER_BACKENDS = "systemd-run"
+    # write the units of a run after CAPCON, EXECUTE_CAPCON then only starts
+    # a single trigger target. Requires root, otherwise the units are created
+    # at EXECUTE_CAPCON. Each run reloads systemd, which reloads every unit of
+    # the host and can take longer than creating the units at EXECUTE_CAPCON
+    stage_units: bool = False
+
+    # CPU and I/O placement of the server payload units by payload type, and
+    # of the server itself. Stored with each run as resources.json
+    resource_profiles: dict[str, ResourceProfile] = Field(default_factory=dict)
+    motra_profile: Optional[ResourceProfile] = None
+
     def dump(self, target: Path):
         filestream = self.model_dump_json(indent=2)
         # config_path = default_workspace_path / "server.config"
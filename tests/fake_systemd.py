@@ -0,0 +1,88 @@
+import itertools
+import time
+from collections import deque
+from typing import Optional
+
+import jeepney
+
+
+class FakeSystemdManager:
+    """
+    Stand-in for the systemd manager, used as connection of the DBusScheduler
+    to check the created units without systemd or root. It accepts the calls
+    of a blocking jeepney connection and records the units instead of
+    starting them.
+
+    timers: The properties of each started timer, by timer name.
+    properties: The runtime properties set on each service.
+    received: Monotonic time of each call, to check the spread of a batch.
+    fail: Units, that are answered with an error.
+    reject: Methods, that are answered with an error for every unit.
+    silent: Units, that are created without sending a reply.
+    """
+
+    def __init__(
+        self,
+        fail: Optional[set[str]] = None,
+        reject: Optional[set[str]] = None,
+        silent: Optional[set[str]] = None,
+    ):
+        self.outgoing_serial = itertools.count(start=1)
+        self.timers: dict[str, dict] = {}
+        self.properties: dict[str, dict] = {}
+        self.received: list[float] = []
+        self.fail = fail or set()
+        self.reject = reject or set()
+        self.silent = silent or set()
+        self.closed = False
+        self._replies = deque()
+
+    def send(self, message, serial=None):
+        if serial is None:
+            serial = next(self.outgoing_serial)
+        # serialising checks the signature against the body
+        message.serialise(serial=serial)
+        message.header.serial = serial
+        self.received.append(time.monotonic())
+
+        method = message.header.fields[jeepney.HeaderFields.member]
+        name = message.body[0]
+        service = name.removesuffix(".timer") + ".service"
+        if name in self.fail or service in self.fail:
+            self._replies.append(
+                jeepney.new_error(message, "org.freedesktop.systemd1.UnitExists")
+            )
+            return
+        if method in self.reject:
+            self._replies.append(
+                jeepney.new_error(message, "org.freedesktop.DBus.Error.InvalidArgs")
+            )
+            return
+
+        if method == "StartTransientUnit":
+            _, mode, properties, _ = message.body
+            self.timers[name] = {key: value for key, (_, value) in properties}
+            job = f"/org/freedesktop/systemd1/job/{len(self.timers)}"
+            if service not in self.silent:
+                self._replies.append(
+                    jeepney.new_method_return(message, "o", (job,))
+                )
+        elif method == "SetUnitProperties":
+            _, _, properties = message.body
+            self.properties.setdefault(name, {}).update(
+                {key: value for key, (_, value) in properties}
+            )
+            if name not in self.silent:
+                self._replies.append(jeepney.new_method_return(message))
+        else:
+            self._replies.append(
+                jeepney.new_error(message, "org.freedesktop.DBus.Error.UnknownMethod")
+            )
+
+    def receive(self, *, timeout=None):
+        if not self._replies:
+            raise TimeoutError("no reply")
+        return self._replies.popleft()
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,64 @@
+from typing import Optional
+
+from motra.common.capcon import format_payload_ids
+from motra.common.capcon_protocol import CAPCON, CapConMetadata, GenericPayload
+from motra.server.capcon_queue import QueuedCapCon
+from motra.server.test_index import CapConSummary
+
+
+def make_payload(
+    command: str = "sleep 1",
+    payload_type: str = "capture",
+    target: Optional[list[str]] = None,
+) -> GenericPayload:
+    return GenericPayload(
+        payload_type=payload_type,
+        payload_id=f"{payload_type[0:3]}001-00000000",
+        target=target or ["client"],
+        setup="",
+        command=command,
+        teardown="",
+        description="",
+        limits="2s",
+        offset="0",
+        timestamp_utc="",
+    )
+
+
+def make_capcon(
+    capcon_id: str,
+    payloads: Optional[list[GenericPayload]] = None,
+    tags: Optional[list[str]] = None,
+    after: Optional[list[str]] = None,
+    requires_reset: bool = False,
+    duration: str = "5s",
+) -> CAPCON:
+    payloads = payloads if payloads is not None else [make_payload()]
+    format_payload_ids(payloads, capcon_id)
+    return CAPCON(
+        CapConID=capcon_id,
+        description="",
+        duration=duration,
+        timestamp_utc="",
+        payload=payloads,
+        metadata=CapConMetadata(
+            tags=tags or [], after=after or [], requires_reset=requires_reset
+        ),
+    )
+
+
+def make_entry(capcon_id: str, campaign: Optional[str] = None, **kwargs):
+    """
+    A queue entry with its summary, like the entries created from the index.
+    """
+    capcon = make_capcon(capcon_id, **kwargs)
+    entry = QueuedCapCon(
+        capcon_id, capcon=capcon, summary=CapConSummary.from_capcon(capcon)
+    )
+    if campaign is not None:
+        entry.campaign = campaign
+    return entry
+
+
+def ids(entries) -> list[Optional[str]]:
+    return [None if entry is None else entry.capcon_id for entry in entries]
@@ -0,0 +1,33 @@
+import asyncio
+
+from helpers import make_capcon, make_payload
+
+from motra.server.barrier import TriggerBarrier, client_targets
+
+
+def make_barrier() -> TriggerBarrier:
+    capcon = make_capcon("run", payloads=[make_payload("sleep 1", target=["a", "b"])])
+    return TriggerBarrier(capcon, client_targets(capcon))
+
+
+def test_all_clients_share_the_trigger():
+    async def run():
+        barrier = make_barrier()
+        return await asyncio.gather(
+            barrier.arrive("a", 5, 1), barrier.arrive("b", 5, 1)
+        )
+
+    first, second = asyncio.run(run())
+    assert first is not None and first == second
+
+
+def test_cancelled_runs_release_the_clients():
+    async def run():
+        barrier = make_barrier()
+        waiting = asyncio.create_task(barrier.arrive("a", 5, 1))
+        await asyncio.sleep(0)
+        barrier.cancel()
+        # a client acknowledging afterwards is not held back either
+        return await waiting, await barrier.arrive("b", 5, 1)
+
+    assert asyncio.run(run()) == (None, None)
@@ -0,0 +1,110 @@
+import re
+
+import pytest
+from helpers import make_capcon, make_payload
+
+from motra.common.capcon import (
+    expand_template,
+    format_fields,
+    iterate_template,
+    template_capcon_id,
+    template_samples,
+    template_size,
+    template_values,
+)
+from motra.common.capcon_protocol import CapConTemplate, GenericPayload
+
+
+def make_template(command: str = "hydra -t {threads} {host}", repetitions: int = 2):
+    capcon = make_capcon(
+        "brute_{host}_{threads}_{repetition}",
+        payloads=[make_payload(command, payload_type="attack")],
+    )
+    capcon.description = "run {index} of {capconname}"
+    return CapConTemplate(
+        TemplateID="brute",
+        template=capcon,
+        parameters={"host": ["a", "b"], "threads": [1, 4, 16]},
+        repetitions=repetitions,
+    )
+
+
+def test_template_values_follow_the_parameter_matrix():
+    template = make_template()
+
+    assert template_size(template) == 12
+    # the last parameter changes fastest, repetitions are consecutive
+    assert template_values(template, 0) == {
+        "host": "a",
+        "threads": 1,
+        "index": 1,
+        "repetition": 1,
+    }
+    assert template_values(template, 1)["repetition"] == 2
+    assert template_values(template, 2)["threads"] == 4
+    assert template_values(template, 6)["host"] == "b"
+    with pytest.raises(IndexError):
+        template_values(template, 12)
+
+
+def test_expanded_runs_match_their_ids():
+    template = make_template()
+    runs = list(iterate_template(template))
+
+    assert [run.CapConID for run in runs] == [
+        template_capcon_id(template, index) for index in range(12)
+    ]
+    assert len({run.CapConID for run in runs}) == 12
+
+    run = runs[7]
+    assert run.CapConID == "brute_b_1_2"
+    assert run.description == "run 8 of brute_b_1_2"
+    assert run.payload[0].command == "hydra -t 1 b"
+
+
+def test_payload_ids_are_created_for_each_run():
+    template = make_template()
+    first, second = expand_template(template, 0), expand_template(template, 1)
+
+    pattern = GenericPayload.model_fields["payload_id"].metadata[0].pattern
+    assert re.match(pattern, first.payload[0].payload_id)
+    assert first.payload[0].payload_id != second.payload[0].payload_id
+
+
+def test_commands_keep_literal_braces():
+    command = (
+        "docker ps --format '{{.Names}}' | awk '{print $1}' "
+        "> {host}_{index:03}.txt {{index}} {unknown}"
+    )
+    run = expand_template(make_template(command), 3)
+
+    assert run.payload[0].command == (
+        "docker ps --format '{{.Names}}' | awk '{print $1}' "
+        "> a_004.txt {{index}} {unknown}"
+    )
+
+
+def test_format_fields_only_replaces_known_fields():
+    assert format_fields("{a} {b} {a:>3}", {"a": 1}) == "1 {b}   1"
+
+
+def test_other_fields_keep_literal_braces():
+    template = make_template()
+    template.template.description = "{unknown} {{index}} of {capconname}"
+    template.template.payload[0].limits = "CPUQuota={threads}0% {x}"
+    run = expand_template(template, 0)
+
+    assert run.description == "{unknown} {{index}} of brute_a_1_1"
+    assert run.payload[0].limits == "CPUQuota=10% {x}"
+
+
+def test_template_samples_cover_every_value():
+    template = make_template()
+    samples = template_samples(template)
+
+    assert samples[0] == 0 and samples[-1] == template_size(template) - 1
+    for name, choices in template.parameters.items():
+        used = {template_values(template, index)[name] for index in samples}
+        assert used == set(choices)
+    repetitions = {template_values(template, i)["repetition"] for i in samples}
+    assert repetitions == {1, 2}
@@ -0,0 +1,159 @@
+import pytest
+from helpers import ids, make_capcon, make_entry
+
+from motra.common.capcon_protocol import CapConTemplate
+from motra.server.capcon_queue import CapConQueue, QueuedCapCon, QueuedTemplate
+from motra.server.queue_backend import LocalQueueBackend
+from motra.server.test_index import CapConSummary
+
+
+def make_template(template_id: str = "scan", rates: tuple = (1, 2, 3)):
+    template = CapConTemplate(
+        TemplateID=template_id,
+        template=make_capcon(template_id + "_{index:02}"),
+        parameters={"rate": rates},
+    )
+    summary = CapConSummary.from_capcon(make_capcon(template_id))
+    summary.template = True
+    summary.expansions = len(rates)
+    return QueuedTemplate(template_id, template=template, summary=summary)
+
+
+def drain(backend: LocalQueueBackend, owner: str = "client", **kwargs) -> list[str]:
+    leased = []
+    while (capcon := backend.lease(owner, **kwargs)) is not None:
+        leased.append(capcon.CapConID)
+    return leased
+
+
+def test_lanes_are_dispatched_in_order():
+    queue = CapConQueue()
+    low = make_entry("low")
+    low.lane = "low"
+    urgent = make_entry("urgent")
+    urgent.lane = "urgent"
+    for entry in (low, make_entry("normal"), urgent):
+        queue.append(entry)
+
+    assert drain(LocalQueueBackend(queue)) == ["urgent", "normal", "low"]
+
+
+def test_capcon_ids_are_unique():
+    queue = CapConQueue()
+    queue.append(make_entry("a"))
+    with pytest.raises(ValueError):
+        queue.append(make_entry("a"))
+
+
+def test_release_requeues_at_the_front():
+    queue = CapConQueue()
+    for capcon_id in ("a", "b"):
+        queue.append(make_entry(capcon_id))
+    backend = LocalQueueBackend(queue)
+
+    assert backend.lease("client").CapConID == "a"
+    backend.release("a")
+    assert ids(queue) == ["a", "b"]
+
+    # a completed test is not returned
+    assert backend.lease("client").CapConID == "a"
+    backend.complete("a")
+    backend.release("a")
+    assert ids(queue) == ["b"]
+
+
+def test_lease_skips_rejected_tests():
+    queue = CapConQueue()
+    queue.append(make_entry("arm", tags=["arm"]))
+    queue.append(make_entry("x86", tags=["x86"]))
+    backend = LocalQueueBackend(queue)
+
+    capcon = backend.lease("client", accept=lambda metadata: "x86" in metadata.tags)
+    assert capcon.CapConID == "x86"
+    assert ids(queue) == ["arm"]
+
+
+def test_lease_by_campaign():
+    queue = CapConQueue()
+    queue.append(make_entry("a1", campaign="a"))
+    queue.append(make_entry("b1", campaign="b"))
+    queue.append(make_entry("a2", campaign="a"))
+
+    assert drain(LocalQueueBackend(queue), campaign="b") == ["b1"]
+    assert ids(queue) == ["a1", "a2"]
+
+
+def test_lease_drops_tests_that_can_not_be_loaded(tmp_path):
+    # the file changed after it was indexed
+    broken = tmp_path / "broken.json"
+    broken.write_text("{")
+    summary = CapConSummary.from_capcon(make_capcon("broken"))
+    queue = CapConQueue()
+    queue.append(QueuedCapCon("broken", source=broken, summary=summary))
+    queue.append(make_entry("a"))
+
+    assert drain(LocalQueueBackend(queue)) == ["a"]
+    assert len(queue) == 0
+
+
+def test_template_runs_are_taken_one_at_a_time():
+    queue = CapConQueue()
+    queue.append(make_template())
+    queue.append(make_entry("after"))
+
+    assert len(queue) == 4
+    assert queue.popleft().capcon_id == "scan_01"
+    assert len(queue) == 3
+    assert ids(queue) == ["scan", "after"]
+    assert drain(LocalQueueBackend(queue)) == ["scan_02", "scan_03", "after"]
+
+
+def test_skipped_template_runs_are_not_expanded():
+    queue = CapConQueue()
+    queue.append(make_template())
+    queue.skip(["scan_02", "unknown"])
+
+    assert len(queue) == 2
+    assert [entry.capcon_id for entry in queue.expanded()] == ["scan_01", "scan_03"]
+    assert drain(LocalQueueBackend(queue)) == ["scan_01", "scan_03"]
+
+
+def test_pending_runs_per_campaign():
+    queue = CapConQueue()
+    template = make_template()
+    template.campaign = "a"
+    queue.append(template)
+    low = make_entry("b1", campaign="b")
+    low.lane = "low"
+    queue.append(low)
+
+    pending = queue.pending()
+    assert pending["a"].runs == 3
+    assert pending["a"].runtime == 15.0
+    assert pending["b"].lane == 2
+
+    queue.popleft()
+    queue.skip(["scan_03"])
+    queue.move("b1", "urgent")
+    pending = queue.pending()
+    assert pending["a"].runs == 1
+    assert pending["b"].lane == 0
+
+    queue.remove("scan")
+    assert list(queue.pending()) == ["b"]
+
+
+def test_entries_keep_their_position():
+    queue = CapConQueue()
+    for capcon_id in "abcd":
+        queue.append(make_entry(capcon_id))
+
+    assert queue.replace(make_entry("b"))
+    assert not queue.replace(make_entry("x"))
+    queue.remove("c")
+    queue.move("d", "normal", front=True)
+    queue.append(make_entry("c"))
+
+    assert ids(queue) == ["d", "a", "b", "c"]
+    assert queue.pop_matching(campaign="default").capcon_id == "d"
+    assert ids(queue) == ["a", "b", "c"]
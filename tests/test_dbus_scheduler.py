@@ -0,0 +1,75 @@
+from datetime import datetime, UTC
+
+import pytest
+
+pytest.importorskip("jeepney")
+
+from fake_systemd import FakeSystemdManager  # noqa: E402
+
+from motra.common import scheduler_backend  # noqa: E402
+from motra.common.schedule import UnitSpec  # noqa: E402
+from motra.common.scheduler_backend import DBusScheduler  # noqa: E402
+
+
+def test_units_get_a_transient_timer():
+    manager = FakeSystemdManager()
+    scheduler = DBusScheduler(connection=manager)
+    units = [
+        UnitSpec(unit="a.service", on_active="5s", runtime_max="1min"),
+        UnitSpec(
+            unit="b.service",
+            on_calendar=datetime(2030, 1, 1, tzinfo=UTC),
+            properties={"CPUWeight": "200"},
+        ),
+    ]
+
+    assert scheduler.schedule(units) == []
+
+    timer = manager.timers["a.timer"]
+    assert timer["Unit"] == "a.service"
+    assert timer["TimersMonotonic"] == [("OnActiveUSec", 5_000_000)]
+    assert manager.properties["a.service"] == {"RuntimeMaxUSec": 60_000_000}
+
+    (calendar,) = manager.timers["b.timer"]["TimersCalendar"]
+    assert calendar[0] == "OnCalendar"
+    assert "2030-01-01" in calendar[1]
+    # no runtime limit, only the resource properties are set
+    assert list(manager.properties["b.service"]) == ["CPUWeight"]
+
+
+def test_failed_units_are_returned():
+    manager = FakeSystemdManager(fail={"b.service"})
+    scheduler = DBusScheduler(connection=manager)
+    units = [UnitSpec(unit=f"{name}.service") for name in "abc"]
+
+    assert scheduler.schedule(units) == [units[1]]
+    assert list(manager.timers) == ["a.timer", "c.timer"]
+    # the connection is kept for the next batch
+    assert not manager.closed
+
+
+def test_rejected_properties_do_not_fail_the_unit():
+    manager = FakeSystemdManager(reject={"SetUnitProperties"})
+    scheduler = DBusScheduler(connection=manager)
+    units = [UnitSpec(unit="a.service", runtime_max="1min")]
+
+    assert scheduler.schedule(units) == []
+    assert list(manager.timers) == ["a.timer"]
+
+
+def test_created_units_are_not_started_again(monkeypatch):
+    manager = FakeSystemdManager(silent={"b.service", "c.service"})
+    scheduler = DBusScheduler(connection=manager)
+    units = [UnitSpec(unit=f"{name}.service") for name in "abc"]
+
+    fallback = []
+    monkeypatch.setattr(
+        scheduler_backend, "created_units", lambda units: {"b.service"}
+    )
+    monkeypatch.setattr(
+        scheduler.fallback, "schedule", lambda units: fallback.extend(units) or []
+    )
+
+    assert scheduler.schedule(units) == []
+    assert fallback == [units[2]]
+    assert manager.closed
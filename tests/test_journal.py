@@ -0,0 +1,35 @@
+from motra.server.journal import CampaignJournal
+
+
+def test_replay(tmp_path):
+    journal = CampaignJournal(tmp_path / "campaign.journal")
+    journal.record("dispatched", "a", campaign="c")
+    journal.record("executed", "a", client="x", jobs=["cap001-00000000"])
+    journal.record("dispatched", "b")
+    journal.close()
+    # a record broken by a crash
+    with open(journal.journal_file, "a") as f:
+        f.write('{"event": "executed", "CapConID": "b"')
+
+    state = CampaignJournal(journal.journal_file).replay()
+    assert state.progress == {"a": "executed", "b": "dispatched"}
+    assert state.interrupted == ["b"]
+    assert state.pending_archives == {"x": ("a", ["cap001-00000000"])}
+    assert state.campaigns == {"a": "c"}
+
+
+def test_records_of_other_workers_are_applied(tmp_path):
+    first = CampaignJournal(tmp_path / "campaign.journal")
+    second = CampaignJournal(tmp_path / "campaign.journal")
+    first.replay()
+    second.replay()
+
+    first.record("dispatched", "a")
+    assert second.refresh() == ["a"]
+    assert second.refresh() == []
+
+    first.record("executed", "a")
+    second.record("dispatched", "b")
+    assert second.state.progress == {"a": "executed", "b": "dispatched"}
+    assert first.refresh() == ["b"]
+    assert first.state.progress == second.state.progress
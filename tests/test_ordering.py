@@ -0,0 +1,100 @@
+from helpers import ids, make_entry, make_payload
+
+from motra.server.ordering import classify, optimize_order, plan_segments
+
+
+def test_classify():
+    assert classify(make_entry("a").summary) == "normal"
+    assert classify(make_entry("b", tags=["destructive"]).summary) == "destructive"
+    assert classify(make_entry("c", tags=["reset"]).summary) == "reset"
+    config = make_entry("d", payloads=[make_payload(payload_type="config")])
+    assert classify(config.summary) == "reset"
+
+
+def test_destructive_tests_end_a_segment():
+    tests = [
+        make_entry("d1", tags=["destructive"]),
+        make_entry("d2", tags=["destructive"]),
+        make_entry("n1"),
+        make_entry("n2"),
+    ]
+    plan, unresolved = plan_segments(tests)
+
+    assert ids(plan) == ["n1", "n2", "d1", None, "d2"]
+    assert unresolved == []
+
+
+def test_last_slot_is_kept_for_a_destructive_test():
+    tests = [
+        make_entry("n1"),
+        make_entry("n2"),
+        make_entry("n3"),
+        make_entry("d1", tags=["destructive"]),
+    ]
+    plan, _ = plan_segments(tests, max_runs_between_resets=2)
+
+    assert ids(plan) == ["n1", "d1", None, "n2", "n3"]
+
+
+def test_tests_requiring_a_reset_start_a_segment():
+    tests = [
+        make_entry("n1"),
+        make_entry("r1", requires_reset=True),
+        make_entry("n2"),
+    ]
+    plan, _ = plan_segments(tests, initial_reset=True)
+
+    assert ids(plan) == [None, "r1", "n1", "n2"]
+
+
+def test_ordering_constraints():
+    tests = [
+        make_entry("b", after=["a"]),
+        make_entry("a"),
+        make_entry("c", after=["b", "unknown"]),
+    ]
+    plan, unresolved = plan_segments(tests)
+
+    assert ids(plan) == ["a", "b", "c"]
+    assert unresolved == []
+
+
+def test_cyclic_constraints_keep_the_original_order():
+    tests = [
+        make_entry("a", after=["b"]),
+        make_entry("b", after=["a"]),
+        make_entry("c"),
+    ]
+    plan, unresolved = plan_segments(tests)
+
+    assert ids(plan) == ["c", "a", "b"]
+    assert unresolved == ["a"]
+
+
+def test_optimize_order_reuses_and_drops_resets():
+    entries = [
+        make_entry("d1", tags=["destructive"]),
+        make_entry("reset1", tags=["reset"]),
+        make_entry("n1"),
+        make_entry("reset2", tags=["reset"]),
+        make_entry("n2"),
+    ]
+    ordered, report = optimize_order(entries)
+
+    assert ids(ordered) == ["n1", "n2", "d1"]
+    assert report.original_resets == 2
+    assert report.planned_resets == 0
+    assert report.dropped_resets == ["reset1", "reset2"]
+
+
+def test_optimize_order_derives_missing_resets():
+    entries = [
+        make_entry("reset", tags=["reset"]),
+        make_entry("d1", tags=["destructive"]),
+        make_entry("d2", tags=["destructive"]),
+        make_entry("d3", tags=["destructive"]),
+    ]
+    ordered, report = optimize_order(entries)
+
+    assert ids(ordered) == ["d1", "reset", "d2", "reset_001", "d3"]
+    assert report.derived_resets == ["reset_001"]
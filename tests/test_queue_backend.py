@@ -0,0 +1,54 @@
+from helpers import make_entry
+
+from motra.server.queue_backend import SQLiteQueueBackend
+
+
+def make_backend(tmp_path, server_id: str = "a") -> SQLiteQueueBackend:
+    return SQLiteQueueBackend(tmp_path / "queue.sqlite", server_id=server_id)
+
+
+def test_servers_share_the_queue(tmp_path):
+    first, second = make_backend(tmp_path, "a"), make_backend(tmp_path, "b")
+    first.publish([make_entry("t1"), make_entry("t2")])
+    # publishing the same tests again does not duplicate them
+    second.publish([make_entry("t1"), make_entry("t2")])
+
+    assert first.lease("client").CapConID == "t1"
+    assert second.lease("client").CapConID == "t2"
+    assert first.lease("client") is None
+
+
+def test_changes_are_numbered(tmp_path):
+    first, second = make_backend(tmp_path, "a"), make_backend(tmp_path, "b")
+    first.publish([make_entry("t1", campaign="c"), make_entry("t2"), make_entry("t3")])
+
+    # publishing is no change of state
+    assert second.changes(0) == ([], 0)
+
+    first.lease("client")
+    first.lease("client")
+    first.complete("t2")
+    changes, version = second.changes(0)
+    assert [change[:3] for change in changes] == [
+        ("t1", "leased", "c"),
+        ("t2", "done", "default"),
+    ]
+
+    first.release("t1")
+    first.cancel(["t3"])
+    changes, version = second.changes(version)
+    assert [change[:2] for change in changes] == [
+        ("t1", "pending"),
+        ("t3", "cancelled"),
+    ]
+    # a released test comes with its capcon
+    assert changes[0][3].CapConID == "t1"
+    assert second.changes(version) == ([], version)
+
+
+def test_dispatched(tmp_path):
+    backend = make_backend(tmp_path)
+    backend.publish([make_entry("t1"), make_entry("t2")])
+    backend.lease("client")
+
+    assert backend.dispatched(["t1", "t2", "unknown"]) == {"t1"}
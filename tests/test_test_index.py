@@ -0,0 +1,19 @@
+from helpers import make_capcon
+
+from motra.server.test_index import CapConIndex
+
+
+def test_removed_files_have_no_summary(tmp_path):
+    test_file = tmp_path / "a.json"
+    test_file.write_text(make_capcon("a").model_dump_json())
+    index = CapConIndex(tmp_path / "index.json")
+
+    summaries, errors = index.refresh([test_file])
+    assert [summary.CapConID for summary in summaries] == ["a"]
+    assert index.lookup(test_file.resolve()) is not None
+
+    test_file.unlink()
+    assert index.lookup(test_file.resolve()) is None
+    summaries, errors = index.refresh([test_file])
+    assert summaries == []
+    assert list(errors) == [str(test_file.resolve())]
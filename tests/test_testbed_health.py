@@ -0,0 +1,116 @@
+import re
+import zipfile
+
+from helpers import make_capcon, make_payload
+
+from motra.server.testbed_health import (
+    check_container_states,
+    check_error_markers,
+    container_failed,
+    evaluate_health,
+)
+
+DOCKER_PS_OUTPUT = [
+    "CONTAINER ID   IMAGE   COMMAND   CREATED   STATUS   PORTS   NAMES",
+    "1a2b3c4d   nginx   \"nginx\"   2 hours ago   Up 2 hours (healthy)   80/tcp   web",
+    "2b3c4d5e   postgres   \"postgres\"   2 hours ago   Exited (137) 1 minute ago"
+    "      db",
+    "3c4d5e6f   busybox   \"sh\"   3 days ago   Exited (0) 3 days ago      old",
+]
+
+
+def test_container_failed():
+    assert container_failed("Restarting (1) 5 seconds ago", False, True)
+    assert container_failed("Up 1 hour (unhealthy)", False, True)
+    assert not container_failed("Exited (1) 1 hour ago", False, True)
+
+    assert container_failed("Exited (1) 1 hour ago", True, True)
+    assert not container_failed("Exited (0) 1 hour ago", True, True)
+    assert container_failed("Exited (0) 1 hour ago", True, False)
+    assert container_failed("Created", True, True)
+    assert not container_failed("Up 2 minutes", True, True)
+
+
+def test_check_container_states():
+    listed: set[str] = set()
+    failures = check_container_states(DOCKER_PS_OUTPUT, ["web", "db"], listed)
+
+    assert failures == ["container db is 'Exited (137) 1 minute ago'"]
+    assert listed == {"web", "db", "old"}
+
+
+def test_check_error_markers_reports_the_first_match():
+    lines = ["start", "ERROR: disk full", "panic: oops", "ERROR: again"]
+    markers = [re.compile("ERROR"), re.compile("panic"), re.compile("FATAL")]
+
+    assert check_error_markers(lines, markers) == [
+        "'ERROR' in 'ERROR: disk full'",
+        "'panic' in 'panic: oops'",
+    ]
+
+
+def write_archive(path, capcon=None, logs: dict[str, str] = {}):
+    with zipfile.ZipFile(path, "w") as zf:
+        if capcon is not None:
+            zf.writestr("capcon.json", capcon.model_dump_json())
+        for payload_id, log in logs.items():
+            zf.writestr(f"{payload_id}.log", log)
+    return path
+
+
+def make_health_capcon():
+    return make_capcon(
+        "run",
+        payloads=[
+            make_payload("docker ps -a", payload_type="logs", target=["server"]),
+            make_payload("docker logs web", payload_type="logs", target=["client"]),
+            make_payload("sleep 1"),
+        ],
+    )
+
+
+def test_evaluate_health(tmp_path):
+    capcon = make_health_capcon()
+    states, logs = capcon.payload[0].payload_id, capcon.payload[1].payload_id
+    server = write_archive(
+        tmp_path / "server.zip",
+        capcon,
+        {states: "Executing: docker ps -a\n" + "\n".join(DOCKER_PS_OUTPUT)},
+    )
+    client = write_archive(tmp_path / "client.zip", logs={logs: "panic: oops\n"})
+
+    report = evaluate_health(server, client, ["web", "db", "cache"], ["panic"])
+
+    assert report.CapConID == "run"
+    assert not report.healthy
+    assert report.checked == [states, logs]
+    assert report.failures == [
+        f"{states}: container db is 'Exited (137) 1 minute ago'",
+        f"{logs}: 'panic' in 'panic: oops'",
+        "container cache is not listed",
+    ]
+
+
+def test_evaluate_health_without_failures(tmp_path):
+    capcon = make_health_capcon()
+    states = capcon.payload[0].payload_id
+    server = write_archive(
+        tmp_path / "server.zip", capcon, {states: "\n".join(DOCKER_PS_OUTPUT[:2])}
+    )
+    # the log of the client payload is missing
+    client = write_archive(tmp_path / "client.zip")
+
+    report = evaluate_health(server, client, ["web"], ["panic"])
+
+    assert report.healthy
+    assert report.checked == [states]
+
+
+def test_evaluate_health_without_capcon(tmp_path):
+    server = write_archive(tmp_path / "server.zip")
+    client = write_archive(tmp_path / "client.zip")
+
+    report = evaluate_health(server, client, ["web"], ["panic"])
+
+    assert report.healthy
+    assert report.CapConID == "client"